@@ -0,0 +1,172 @@
+"""
+Нагрузочный замер справочной системы без интерфейса.
+
+Создает базу, заполняет ее генератором синтетических данных и замеряет
+get_all_records, iter_records, get_reference_values, insert_record,
+подготовку строк таблицы (подстановку названий по внешним ключам и
+форматирование ячеек) и сортировку по колонкам так, как это делает
+TableView. Результат сохраняется в JSON, чтобы сравнивать версии между собой.
+
+Запуск: python -m lab2.benchmark --rows Cities=10000 --rows IndustrialEnterprises=100000 --out bench.json
+"""
+
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Callable, Optional
+
+from lab2.database.db_manager import DatabaseManager, SCHEMA_VERSION
+from lab2.database.generator import DEFAULT_SEED, generate_data, iter_rows, parse_sizes
+from lab2.ui.table_view import FORMATTERS, _format_text, sort_key
+
+DEFAULT_SIZES = {'Cities': 10000, 'IndustrialEnterprises': 100000}
+
+
+def _measure(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Выполняет func repeat раз и возвращает минимум и медиану времени"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return {
+        'min_s': round(min(timings), 6),
+        'median_s': round(statistics.median(timings), 6),
+        'rows': len(result) if isinstance(result, list) else None,
+    }
+
+
+def _display_fields(db_manager: DatabaseManager, table_name: str) -> List[Dict[str, Any]]:
+    """Поля, которые TableView показывает в колонках"""
+    return [
+        f for f in db_manager.get_table_fields(table_name)
+        if not f['is_primary_key'] and f['field_name'] not in ('id', 'created_at', 'updated_at', 'is_deleted')
+    ]
+
+
+def _render_rows(db_manager: DatabaseManager, table_name: str, fields: List[Dict[str, Any]]) -> List[list]:
+    """Строки таблицы в том виде, в каком они попадают в Treeview"""
+    formatters = [FORMATTERS.get(f['data_type'], _format_text) for f in fields]
+    return [
+        [fmt(value) for fmt, value in zip(formatters, row[1:])]
+        for row in db_manager.get_display_rows(table_name, fields)
+    ]
+
+
+def run_benchmark(
+    db_manager: DatabaseManager,
+    repeat: int = 3,
+    inserts: int = 200,
+    seed: int = DEFAULT_SEED
+) -> Dict[str, Any]:
+    """Замеряет основные операции по всем справочникам базы"""
+    results: Dict[str, Any] = {}
+    tables = [d['name'] for d in db_manager.get_dictionaries() if db_manager._table_exists(d['name'])]
+
+    for table_name in tables:
+        fields = _display_fields(db_manager, table_name)
+
+        results[f"get_all_records:{table_name}"] = _measure(
+            lambda: db_manager.get_all_records(table_name), repeat
+        )
+        results[f"iter_records:{table_name}"] = _measure(
+            lambda: sum(1 for _ in db_manager.iter_records(table_name)), repeat
+        )
+        if 'name' in db_manager._table_columns(table_name):
+            results[f"get_reference_values:{table_name}"] = _measure(
+                lambda: db_manager.get_reference_values(table_name), repeat
+            )
+        results[f"render_rows:{table_name}"] = _measure(
+            lambda: _render_rows(db_manager, table_name, fields), repeat
+        )
+
+        rendered = _render_rows(db_manager, table_name, fields)
+        for position, field in enumerate(fields):
+            results[f"sort:{table_name}.{field['field_name']}"] = _measure(
+                lambda: sorted(rendered, key=lambda values: sort_key(field['data_type'], values[position])),
+                repeat
+            )
+
+    # Вставки идут последними, чтобы не влиять на остальные замеры
+    for table_name in tables:
+        start = db_manager.conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        rows = list(iter_rows(db_manager, table_name, inserts, seed, start))
+        started = time.perf_counter()
+        for row in rows:
+            db_manager.insert_record(table_name, row)
+        elapsed = time.perf_counter() - started
+        results[f"insert_record:{table_name}"] = {
+            'count': inserts,
+            'total_s': round(elapsed, 6),
+            'per_record_ms': round(elapsed / max(inserts, 1) * 1000, 3),
+        }
+
+    return results
+
+
+def main():
+    """Запуск замеров из командной строки"""
+    parser = argparse.ArgumentParser(description="Нагрузочный замер справочной системы")
+    parser.add_argument('--db', type=Path, help="Готовая база; по умолчанию создается временная")
+    parser.add_argument('--rows', action='append', default=[], metavar='ТАБЛИЦА=ЧИСЛО',
+                        help="Сколько записей сгенерировать (по умолчанию Cities=10000, IndustrialEnterprises=100000)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--inserts', type=int, default=200)
+    parser.add_argument('--label', default='', help="Метка прогона, например версия или ветка")
+    parser.add_argument('--out', type=Path, default=Path('benchmark.json'))
+    args = parser.parse_args()
+
+    temp_dir: Optional[tempfile.TemporaryDirectory] = None
+    db_path = args.db
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = Path(temp_dir.name) / 'benchmark.db'
+
+    db_manager = DatabaseManager(db_path)
+    try:
+        sizes = parse_sizes(args.rows) if args.rows else (DEFAULT_SIZES if args.db is None else {})
+        generation = generate_data(db_manager, sizes, args.seed) if sizes else {'rows': {}, 'elapsed': 0.0}
+        results = run_benchmark(db_manager, args.repeat, args.inserts, args.seed)
+        row_counts = {
+            d['name']: db_manager.conn.execute(f"SELECT COUNT(*) FROM {d['name']}").fetchone()[0]
+            for d in db_manager.get_dictionaries() if db_manager._table_exists(d['name'])
+        }
+    finally:
+        db_manager.close()
+        if temp_dir:
+            temp_dir.cleanup()
+
+    report = {
+        'meta': {
+            'label': args.label,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'schema_version': SCHEMA_VERSION,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'generated': generation['rows'],
+            'generation_s': round(generation['elapsed'], 3),
+            'row_counts': row_counts,
+        },
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, stats in results.items():
+        value = stats.get('median_s', stats.get('total_s'))
+        print(f"{name:60} {value * 1000:10.2f} мс")
+    print(f"✅ Результаты: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""
+Колоночная выгрузка справочников для аналитики.
+
+Таблица читается с курсора пачками, и каждая пачка сразу раскладывается
+по типизированным колонкам array по типам Dictionary_Fields.data_type:
+
+    INTEGER     -> int64   (array 'q')
+    REAL        -> float64 (array 'd', NULL = NaN)
+    BOOLEAN     -> bool    (array 'b')
+    DATE        -> date32  (array 'i', дни от 1970-01-01)
+    TEXT        -> string  (смещения 'q' + байты UTF-8, как в Arrow)
+    FOREIGN_KEY -> category (коды 'i' + названия записей главного справочника)
+
+У каждой колонки есть маска valid (1 байт на строку, 0 - NULL). После
+выгрузки в памяти нет объекта Python на каждую строку, только буферы,
+которые numpy читает без копирования (numpy.frombuffer).
+
+Файл .l2c состоит из групп строк (по одной на пачку), буферы сжаты zlib,
+а оглавление в JSON записано в конце файла, как в Parquet: читать можно
+только нужные колонки.
+
+    columns = export_columns(db, 'IndustrialEnterprises')
+    write_columnar(db, 'IndustrialEnterprises', Path('enterprises.l2c'))
+    df = to_pandas(read_columnar(Path('enterprises.l2c')))
+
+Запуск: python -m lab2.database.columnar --db business.db --out-dir export
+"""
+
+import argparse
+import json
+import math
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import date
+from itertools import accumulate, repeat
+from operator import is_not
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from lab2.database.validation import parse_date
+
+MAGIC = b'L2COL1\x00\x00'
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# Вид колонки по типу поля в метаданных
+KINDS = {
+    'INTEGER': 'int64',
+    'REAL': 'float64',
+    'BOOLEAN': 'bool',
+    'DATE': 'date32',
+    'TEXT': 'string',
+    'FOREIGN_KEY': 'category',
+}
+
+# Код типа array для буфера значений
+TYPECODES = {'int64': 'q', 'float64': 'd', 'bool': 'b', 'date32': 'i', 'category': 'i'}
+
+# Значение, которое хранится в буфере вместо NULL
+MISSING = {'int64': 0, 'float64': math.nan, 'bool': 0, 'date32': 0}
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class Column:
+    """Типизированная колонка: буфер значений, маска NULL и (для строк) смещения"""
+
+    __slots__ = ('name', 'data_type', 'kind', 'values', 'valid', 'offsets', 'categories')
+
+    def __init__(self, name: str, data_type: str, kind: str, categories: Optional[List[str]] = None):
+        self.name = name
+        self.data_type = data_type
+        self.kind = kind
+        self.values = bytearray() if kind == 'string' else array(TYPECODES[kind])
+        # Конец i-й строки в values; строка i - values[offsets[i]:offsets[i + 1]]
+        self.offsets = array('q', [0]) if kind == 'string' else None
+        self.valid = bytearray()
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    @property
+    def null_count(self) -> int:
+        return len(self.valid) - sum(self.valid)
+
+    @property
+    def nbytes(self) -> int:
+        size = len(self.valid) + len(self.values) * (1 if self.kind == 'string' else self.values.itemsize)
+        if self.offsets is not None:
+            size += len(self.offsets) * self.offsets.itemsize
+        return size
+
+    def extend(self, other: 'Column'):
+        """Дописывает колонку того же вида (следующую группу строк)"""
+        if self.kind == 'string':
+            base = self.offsets[-1]
+            self.offsets.extend(offset + base for offset in other.offsets[1:])
+        self.values += other.values
+        self.valid += other.valid
+
+    def to_list(self) -> List[Any]:
+        """Значения объектами Python (для проверки и небольших выборок)"""
+        result: List[Any] = []
+        for i, valid in enumerate(self.valid):
+            if not valid:
+                result.append(None)
+            elif self.kind == 'string':
+                result.append(self.values[self.offsets[i]:self.offsets[i + 1]].decode('utf-8'))
+            elif self.kind == 'category':
+                result.append(self.categories[self.values[i]])
+            elif self.kind == 'date32':
+                result.append(date.fromordinal(self.values[i] + EPOCH_ORDINAL))
+            elif self.kind == 'bool':
+                result.append(bool(self.values[i]))
+            else:
+                result.append(self.values[i])
+        return result
+
+    def buffers(self) -> Dict[str, bytes]:
+        buffers = {'values': bytes(self.values), 'valid': bytes(self.valid)}
+        if self.offsets is not None:
+            buffers['offsets'] = self.offsets.tobytes()
+        return buffers
+
+    def load_buffers(self, buffers: Dict[str, bytes], swap: bool):
+        """Заполняет колонку буферами из файла; swap - другой порядок байт"""
+        self.valid = bytearray(buffers['valid'])
+        if self.kind == 'string':
+            self.values = bytearray(buffers['values'])
+            self.offsets = array('q')
+            self.offsets.frombytes(buffers['offsets'])
+            if swap:
+                self.offsets.byteswap()
+        else:
+            self.values = array(TYPECODES[self.kind])
+            self.values.frombytes(buffers['values'])
+            if swap:
+                self.values.byteswap()
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bool(value) -> Optional[int]:
+    number = _to_int(value)
+    return None if number is None else int(bool(number))
+
+
+def _to_days(value) -> Optional[int]:
+    # Нераспознанная дата - ошибка выгрузки, а не NULL
+    return None if value is None else parse_date(value).toordinal() - EPOCH_ORDINAL
+
+
+CONVERTERS = {'int64': _to_int, 'float64': _to_float, 'bool': _to_bool, 'date32': _to_days}
+
+
+def _column_specs(db_manager, table_name: str) -> List[Dict[str, Any]]:
+    """Колонки выгрузки: id и поля справочника; для ссылок - словарь категорий"""
+    specs = [{'name': 'id', 'data_type': 'TEXT', 'kind': 'string'}]
+    for field in db_manager.get_table_fields(table_name):
+        if field['field_name'] == 'id':
+            continue
+        spec = {
+            'name': field['field_name'],
+            'data_type': field['data_type'],
+            'kind': KINDS.get(field['data_type'], 'string'),
+        }
+        ref_table = field.get('reference_to')
+        if spec['kind'] == 'category':
+            if ref_table and 'name' in db_manager._table_columns(ref_table):
+                # Удаленные записи тоже: на них могут ссылаться выгружаемые строки
+                labels = dict(db_manager.conn.execute(
+                    f"SELECT id, name FROM {ref_table}"
+                ).fetchall())
+                spec['categories'] = sorted({str(label) for label in labels.values() if label is not None})
+                positions = {label: code for code, label in enumerate(spec['categories'])}
+                spec['codes'] = {
+                    ref_id: positions[str(label)] for ref_id, label in labels.items() if label is not None
+                }
+            else:
+                spec['kind'] = 'string'
+        specs.append(spec)
+    return specs
+
+
+def _new_columns(specs: List[Dict[str, Any]]) -> Dict[str, Column]:
+    return {
+        spec['name']: Column(spec['name'], spec['data_type'], spec['kind'], spec.get('categories'))
+        for spec in specs
+    }
+
+
+def _append(column: Column, values: Tuple[Any, ...], codes: Optional[Dict[str, int]] = None):
+    """Раскладывает значения одной колонки пачки в ее буферы"""
+    if column.kind == 'string':
+        encoded = [b'' if value is None else str(value).encode('utf-8') for value in values]
+        ends = accumulate(map(len, encoded), initial=column.offsets[-1])
+        next(ends)
+        column.offsets.extend(ends)
+        column.values += b''.join(encoded)
+        column.valid += bytes(map(is_not, values, repeat(None)))
+        return
+
+    if column.kind == 'category':
+        # Ссылка на несуществующую запись выгружается как NULL
+        converted = [-1 if value is None else codes.get(value, -1) for value in values]
+        column.values.extend(converted)
+        column.valid += bytes(code >= 0 for code in converted)
+        return
+
+    if column.kind != 'date32':
+        # Без NULL и посторонних значений array принимает пачку целиком
+        try:
+            column.values.extend(array(column.values.typecode, values))
+            column.valid += b'\x01' * len(values)
+            return
+        except (TypeError, OverflowError):
+            pass
+
+    try:
+        converted = list(map(CONVERTERS[column.kind], values))
+    except ValueError as e:
+        raise ValueError(f"Колонка {column.name}: {e}") from None
+    column.valid += bytes(map(is_not, converted, repeat(None)))
+    missing = MISSING[column.kind]
+    column.values.extend(missing if value is None else value for value in converted)
+
+
+def _read_chunks(
+    db_manager,
+    table_name: str,
+    specs: List[Dict[str, Any]],
+    chunk_size: int,
+    include_deleted: bool
+) -> Iterator[List[Tuple[Any, ...]]]:
+    """Выдает пачки строк, уже транспонированные в кортежи по колонкам"""
+    where_clause = "" if include_deleted else "WHERE is_deleted = 0"
+    cursor = db_manager.conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(
+        f"SELECT {', '.join(spec['name'] for spec in specs)} FROM {table_name} "
+        f"{where_clause} ORDER BY rowid"
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield list(zip(*rows))
+
+
+def iter_column_chunks(
+    db_manager,
+    table_name: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    include_deleted: bool = False
+) -> Iterator[Dict[str, Column]]:
+    """Выдает таблицу группами строк: {колонка: Column} на каждую пачку"""
+    specs = _column_specs(db_manager, table_name)
+    for chunk in _read_chunks(db_manager, table_name, specs, chunk_size, include_deleted):
+        columns = _new_columns(specs)
+        for spec, values in zip(specs, chunk):
+            _append(columns[spec['name']], values, spec.get('codes'))
+        yield columns
+
+
+def export_columns(
+    db_manager,
+    table_name: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    include_deleted: bool = False
+) -> Dict[str, Column]:
+    """Выгружает таблицу в память колонками"""
+    specs = _column_specs(db_manager, table_name)
+    columns = _new_columns(specs)
+    for chunk in _read_chunks(db_manager, table_name, specs, chunk_size, include_deleted):
+        for spec, values in zip(specs, chunk):
+            _append(columns[spec['name']], values, spec.get('codes'))
+    return columns
+
+
+def write_columnar(
+    db_manager,
+    table_name: str,
+    path: Path,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    include_deleted: bool = False,
+    compress_level: int = 6
+) -> Dict[str, Any]:
+    """Записывает таблицу в файл .l2c: группа строк на пачку, оглавление в конце"""
+    started = time.perf_counter()
+    footer: Dict[str, Any] = {
+        'table': table_name,
+        'byteorder': sys.byteorder,
+        'compression': 'zlib',
+        'rows': 0,
+        'columns': None,
+        'row_groups': [],
+    }
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for columns in iter_column_chunks(db_manager, table_name, chunk_size, include_deleted):
+            if footer['columns'] is None:
+                footer['columns'] = [
+                    {'name': c.name, 'data_type': c.data_type, 'kind': c.kind, 'categories': c.categories}
+                    for c in columns.values()
+                ]
+            group: Dict[str, Any] = {'rows': 0, 'buffers': {}}
+            for column in columns.values():
+                group['rows'] = len(column)
+                locations = {}
+                for buffer_name, data in column.buffers().items():
+                    packed = zlib.compress(data, compress_level)
+                    locations[buffer_name] = [f.tell(), len(packed)]
+                    f.write(packed)
+                group['buffers'][column.name] = locations
+            footer['rows'] += group['rows']
+            footer['row_groups'].append(group)
+
+        if footer['columns'] is None:
+            # Пустая таблица: описание колонок без групп строк
+            footer['columns'] = [
+                {'name': c.name, 'data_type': c.data_type, 'kind': c.kind, 'categories': c.categories}
+                for c in _new_columns(_column_specs(db_manager, table_name)).values()
+            ]
+        encoded = json.dumps(footer, ensure_ascii=False).encode('utf-8')
+        f.write(encoded)
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(MAGIC)
+
+    return {
+        'table': table_name,
+        'rows': footer['rows'],
+        'row_groups': len(footer['row_groups']),
+        'size': path.stat().st_size,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def read_footer(path: Path) -> Dict[str, Any]:
+    """Оглавление файла .l2c: таблица, колонки и расположение групп строк"""
+    with open(path, 'rb') as f:
+        f.seek(-len(MAGIC) - 8, 2)
+        (length,) = struct.unpack('<Q', f.read(8))
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} не является файлом колоночной выгрузки")
+        f.seek(-len(MAGIC) - 8 - length, 2)
+        return json.loads(f.read(length).decode('utf-8'))
+
+
+def read_columnar(path: Path, columns: Optional[List[str]] = None) -> Dict[str, Column]:
+    """Читает файл .l2c целиком или только колонки columns"""
+    footer = read_footer(path)
+    specs = [c for c in footer['columns'] if columns is None or c['name'] in columns]
+    missing = set(columns or ()) - {c['name'] for c in specs}
+    if missing:
+        raise ValueError(f"В файле нет колонок: {', '.join(sorted(missing))}")
+
+    swap = footer['byteorder'] != sys.byteorder
+    result = {
+        c['name']: Column(c['name'], c['data_type'], c['kind'], c['categories']) for c in specs
+    }
+    with open(path, 'rb') as f:
+        for group in footer['row_groups']:
+            for name, column in result.items():
+                buffers = {}
+                for buffer_name, (offset, length) in group['buffers'][name].items():
+                    f.seek(offset)
+                    buffers[buffer_name] = zlib.decompress(f.read(length))
+                part = Column(column.name, column.data_type, column.kind, column.categories)
+                part.load_buffers(buffers, swap)
+                column.extend(part)
+    return result
+
+
+def to_pandas(columns: Dict[str, Column]):
+    """DataFrame из колонок; числовые буферы передаются в numpy без копирования.
+
+    pandas и numpy не входят в зависимости проекта и нужны только здесь.
+    """
+    import numpy as np
+    import pandas as pd
+
+    data = {}
+    for name, column in columns.items():
+        mask = np.frombuffer(bytes(column.valid), dtype=np.uint8) == 0
+        if column.kind == 'string':
+            data[name] = pd.Series(column.to_list(), dtype='string')
+        elif column.kind == 'category':
+            data[name] = pd.Categorical.from_codes(
+                np.frombuffer(column.values, dtype=np.int32), categories=column.categories
+            )
+        elif column.kind == 'date32':
+            days = np.frombuffer(column.values, dtype=np.int32).astype('datetime64[D]')
+            data[name] = np.where(mask, np.datetime64('NaT'), days)
+        elif column.kind == 'float64':
+            data[name] = np.frombuffer(column.values, dtype=np.float64)
+        elif column.kind == 'bool':
+            values = np.frombuffer(column.values, dtype=np.int8).astype(bool)
+            data[name] = pd.arrays.BooleanArray(values, mask)
+        else:
+            data[name] = pd.arrays.IntegerArray(np.frombuffer(column.values, dtype=np.int64), mask)
+    return pd.DataFrame(data)
+
+
+def main():
+    """Выгрузка справочников в файлы .l2c из командной строки"""
+    from lab2.database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Колоночная выгрузка справочников")
+    parser.add_argument('--db', type=Path, default=Path(__file__).parent.parent / 'data' / 'business.db')
+    parser.add_argument('--table', action='append', dest='tables', help="Справочник (по умолчанию все)")
+    parser.add_argument('--out-dir', type=Path, default=Path('.'))
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--include-deleted', action='store_true')
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+        tables = args.tables or [d['name'] for d in db_manager.get_dictionaries()]
+        for table_name in tables:
+            report = write_columnar(
+                db_manager, table_name, args.out_dir / f"{table_name}.l2c",
+                chunk_size=args.chunk_size, include_deleted=args.include_deleted
+            )
+            print(
+                f"✅ {table_name}: {report['rows']} записей, {report['row_groups']} групп, "
+                f"{report['size'] / 1024:.1f} КБ за {report['elapsed']:.2f} с"
+            )
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
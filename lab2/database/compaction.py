@@ -0,0 +1,257 @@
+"""
+Сжатие мягко удаленных записей.
+
+Записи с is_deleted = 1 старше срока хранения переносятся пачками в
+одноименные таблицы архивной базы (<база>_archive.db рядом с рабочей) и
+удаляются из рабочих таблиц, после чего освобожденные страницы возвращаются
+файлу (и файлам справочников-шардов) через инкрементальный VACUUM.
+
+Инкрементальный VACUUM возможен только в режиме auto_vacuum = INCREMENTAL.
+Файл в другом режиме (база, созданная до этого режима) переводится в него
+полным VACUUM, который блокирует базу, поэтому только по явному запросу
+convert_auto_vacuum=True; иначе освобождение страниц пропускается.
+
+Запуск: python -m lab2.database.compaction --retention-days 30 [--convert-auto-vacuum]
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from lab2.database.integrity import collect_references
+
+ARCHIVE_SUFFIX = '_archive'
+
+# Имя схемы, под которой подключается архивная база
+ARCHIVE_SCHEMA = 'archive'
+
+# PRAGMA auto_vacuum: 2 - INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def compact_deleted(
+    db_manager,
+    retention_days: int = 30,
+    batch_size: int = 1000,
+    archive_path: Optional[Path] = None,
+    convert_auto_vacuum: bool = False
+) -> Dict[str, Any]:
+    """Архивирует мягко удаленные записи старше retention_days дней.
+
+    Записи, на которые еще ссылаются другие справочники (ON DELETE RESTRICT),
+    остаются на месте. Справочники обрабатываются от зависимых к главным,
+    чтобы удаленные предприятия освобождали свои города в том же проходе.
+    Возвращает отчет: перенесенные и пропущенные записи по таблицам,
+    освобожденные страницы, что сделано с файлом каждой схемы в vacuum
+    ('incremental', 'converted' или 'skipped') и затраченное время.
+    """
+    started = time.perf_counter()
+    conn = db_manager.conn
+    cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+
+    if archive_path is None:
+        db_path = Path(db_manager.db_path)
+        archive_path = db_path.with_name(f"{db_path.stem}{ARCHIVE_SUFFIX}{db_path.suffix}")
+
+    pages_before = {
+        schema: conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+        for schema in db_manager._data_schemas()
+    }
+    report: Dict[str, Any] = {'archived': {}, 'skipped': {}, 'archive_path': str(archive_path)}
+
+    conn.commit()
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (str(archive_path),))
+    try:
+        _archive_tables(db_manager, report, cutoff, batch_size)
+    finally:
+        conn.commit()
+        conn.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+
+    report['vacuum'] = {}
+    report['pages_reclaimed'] = 0
+    for schema, pages in pages_before.items():
+        mode, reclaimed = _incremental_vacuum(db_manager, schema, pages, convert_auto_vacuum)
+        report['vacuum'][schema] = mode
+        report['pages_reclaimed'] += reclaimed
+    report['elapsed'] = time.perf_counter() - started
+    return report
+
+
+def _archive_tables(db_manager, report: Dict[str, Any], cutoff: str, batch_size: int):
+    """Переносит подходящие записи всех справочников в архивную базу"""
+    conn = db_manager.conn
+
+    tables = [
+        d['name'] for d in db_manager.get_dictionaries()
+        if db_manager._table_exists(d['name'])
+    ]
+    references = collect_references(db_manager)
+    for table_name in _compaction_order(tables, references):
+        archive_name = _ensure_archive_table(db_manager, table_name)
+        source = _source_name(db_manager, table_name)
+        columns = _table_columns(db_manager, table_name, db_manager._schema_of(table_name))
+        column_list = ', '.join(columns)
+
+        eligible = f"""
+            t.is_deleted = 1 AND COALESCE(t.updated_at, t.created_at, '') < ?
+        """
+        not_referenced = ''.join(
+            f" AND NOT EXISTS (SELECT 1 FROM {_source_name(db_manager, child)} c WHERE c.{column} = t.id)"
+            for child, column, _ in references.get(table_name, [])
+        )
+
+        # Курсор по rowid: каждая пачка продолжает обход с места предыдущей,
+        # а не просматривает заново записи, оставленные из-за ссылок
+        archived = 0
+        last_rowid = 0
+        while True:
+            rows = conn.execute(f"""
+                SELECT t.rowid, t.id FROM {source} t
+                WHERE t.rowid > ? AND {eligible} {not_referenced}
+                ORDER BY t.rowid
+                LIMIT ?
+            """, (last_rowid, cutoff, batch_size)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            ids = [row[1] for row in rows]
+
+            placeholders = ', '.join('?' for _ in ids)
+            try:
+                conn.execute(f"""
+                    INSERT INTO {archive_name} ({column_list}, archived_at)
+                    SELECT {column_list}, ? FROM {source} WHERE id IN ({placeholders})
+                """, [datetime.now().isoformat()] + ids)
+                conn.execute(f"DELETE FROM {source} WHERE id IN ({placeholders})", ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            archived += len(ids)
+
+        skipped = conn.execute(
+            f"SELECT COUNT(*) FROM {source} t WHERE {eligible}", (cutoff,)
+        ).fetchone()[0]
+        report['archived'][table_name] = archived
+        report['skipped'][table_name] = skipped
+
+
+def _compaction_order(tables: List[str], references: Dict[str, List[tuple]]) -> List[str]:
+    """Сортирует справочники так, чтобы зависимые шли раньше главных"""
+    order: List[str] = []
+    visited = set()
+
+    def visit(table_name: str):
+        if table_name in visited:
+            return
+        visited.add(table_name)
+        for child, *_ in references.get(table_name, []):
+            visit(child)
+        if table_name in tables:
+            order.append(table_name)
+
+    for table_name in tables:
+        visit(table_name)
+    return order
+
+
+def _source_name(db_manager, table_name: str) -> str:
+    """Рабочая таблица со схемой: архив содержит таблицы с теми же именами"""
+    return f"{db_manager._schema_of(table_name)}.{table_name}"
+
+
+def _table_columns(db_manager, table_name: str, schema: str = 'main') -> List[str]:
+    """Имена колонок таблицы"""
+    return [
+        row['name']
+        for row in db_manager.conn.execute(f"PRAGMA {schema}.table_info({table_name})").fetchall()
+    ]
+
+
+def _ensure_archive_table(db_manager, table_name: str) -> str:
+    """Создает архивную таблицу и добавляет в нее недостающие колонки"""
+    conn = db_manager.conn
+    archive_name = f"{ARCHIVE_SCHEMA}.{table_name}"
+
+    archive_columns = set(_table_columns(db_manager, table_name, ARCHIVE_SCHEMA))
+    if not archive_columns:
+        conn.execute(
+            f"CREATE TABLE {archive_name} AS SELECT * FROM {_source_name(db_manager, table_name)} WHERE 0"
+        )
+        conn.execute(f"ALTER TABLE {archive_name} ADD COLUMN archived_at TEXT")
+        archive_columns = set(_table_columns(db_manager, table_name, ARCHIVE_SCHEMA))
+
+    # Рабочая таблица могла получить новые колонки после миграций
+    schema = db_manager._schema_of(table_name)
+    for row in conn.execute(f"PRAGMA {schema}.table_info({table_name})").fetchall():
+        if row['name'] not in archive_columns:
+            conn.execute(f"ALTER TABLE {archive_name} ADD COLUMN {row['name']} {row['type']}")
+
+    conn.commit()
+    return archive_name
+
+
+def _incremental_vacuum(
+    db_manager,
+    schema: str,
+    pages_before: int,
+    convert: bool = False
+) -> Tuple[str, int]:
+    """Возвращает свободные страницы файлу схемы: (что сделано, сколько страниц освобождено)"""
+    conn = db_manager.conn
+    conn.commit()
+
+    if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        if not convert:
+            print(f"⚠️  {schema}: auto_vacuum не INCREMENTAL, страницы не освобождены "
+                  f"(однократный перевод: --convert-auto-vacuum)")
+            return 'skipped', 0
+        # Режим auto_vacuum меняется только полным VACUUM, один раз
+        print(f"⚠️  Перевод {schema} в режим auto_vacuum = INCREMENTAL (полный VACUUM)")
+        conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+        conn.execute(f"VACUUM {schema}")
+        mode = 'converted'
+    else:
+        # execute() делает один шаг прагмы и освобождает одну страницу,
+        # executescript() выполняет ее до конца
+        conn.executescript(f"PRAGMA {schema}.incremental_vacuum")
+        mode = 'incremental'
+
+    pages_after = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+    return mode, max(pages_before - pages_after, 0)
+
+
+def main():
+    """Запуск сжатия из командной строки"""
+    from lab2.database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Архивирование мягко удаленных записей")
+    parser.add_argument('--db', type=Path, default=Path(__file__).parent.parent / 'data' / 'business.db')
+    parser.add_argument('--retention-days', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--convert-auto-vacuum', action='store_true',
+                        help="Однократно перевести файл в auto_vacuum = INCREMENTAL полным VACUUM")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        report = db_manager.compact_deleted(
+            args.retention_days, args.batch_size, convert_auto_vacuum=args.convert_auto_vacuum
+        )
+    finally:
+        db_manager.close()
+
+    for table_name, archived in report['archived'].items():
+        print(f"📦 {table_name}: перенесено в архив {archived}, "
+              f"оставлено из-за ссылок {report['skipped'][table_name]}")
+    print(f"✅ Архив: {report['archive_path']}")
+    for schema, mode in report['vacuum'].items():
+        print(f"📊 {schema}: vacuum {mode}")
+    print(f"✅ Освобождено страниц: {report['pages_reclaimed']}, "
+          f"время: {report['elapsed']:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
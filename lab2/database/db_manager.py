@@ -1,39 +1,219 @@
+import gzip
+import shutil
 import sqlite3
+import time
 import uuid
 import json
-from datetime import datetime
+import re
+from contextlib import contextmanager
+from datetime import date, datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Generator, Union
 
 from lab2.database.seed_db import seed_initial_data
+from lab2.database.migrations import apply_migrations, plan_migrations
+from lab2.database.compaction import compact_deleted
+from lab2.database.sync import install_change_log, sync_databases
+from lab2.database.instrumentation import QueryProfiler
+from lab2.database.records import stream_records, to_dict
+from lab2.database.replica import DictionaryReplica, DEFAULT_MAX_ROWS
+from lab2.database.validation import (
+    SYSTEM_FIELDS, RecordValidationError, RecordValidator, compile_validator, validate_records
+)
+from lab2.database.statistics import maintenance_due, refresh_statistics, run_maintenance
+from lab2.database.shards import attach_shards, move_dictionary, shard_path
+from lab2.database.history import as_of, install_history, record_history, set_history_enabled
+from lab2.database.integrity import (
+    IN_BATCH_SIZE, ON_DELETE_POLICIES, check_cross_file_references, ensure_reference_indexes,
+    plan_soft_delete
+)
+
+# Версия схемы, записываемая в PRAGMA user_version.
+# Увеличивать при каждом изменении schema.sql
+SCHEMA_VERSION = 12
+
+# Агрегатные функции, доступные в aggregate()
+AGGREGATE_FUNCTIONS = ('sum', 'avg', 'count', 'min', 'max')
+
+# Объем файла, отображаемый в память в режиме только для чтения, байт
+READ_ONLY_MMAP_SIZE = 256 * 1024 * 1024
+
+# Таблицы метаданных, изменения которых увеличивают Metadata_Version
+METADATA_TABLES = ('Dictionary', 'Dictionary_Fields', 'Dictionary_Summaries')
+
+# Типы полей, по которым разрешены числовые агрегаты
+NUMERIC_DATA_TYPES = ('INTEGER', 'REAL')
+
 
 class DatabaseManager:
-    def __init__(self, db_path: Path):
+    def __init__(
+        self,
+        db_path: Path,
+        profiler: Optional[QueryProfiler] = None,
+        read_only: bool = False,
+        immutable: bool = False
+    ):
         self.db_path = db_path
         self.conn = None
+        # Только чтение: без загрузки схемы, миграций и триггеров.
+        # immutable - файл не меняется, пока открыт (снимок для отчетов):
+        # SQLite не берет блокировок и не проверяет изменения файла
+        self.read_only = read_only or immutable
+        self.immutable = immutable
+        # Метаданные, прочитанные один раз в режиме только для чтения
+        self._metadata: Optional[Dict[str, Any]] = None
+        # Необязательный сбор статистики запросов и методов
+        self.profiler = profiler
+        if profiler:
+            profiler.instrument_methods(self)
+        # Кэш результатов aggregate(): ключ -> (затронутые таблицы, строки)
+        self._aggregate_cache: Dict[tuple, Tuple[set, List[Dict[str, Any]]]] = {}
+        # Подписчики на изменения записей: callback(table_name, operation, record_id)
+        self._change_listeners: List[Callable[[str, str, str], None]] = []
+        # Глубина вложенности batch() и изменения, ждущие его фиксации
+        self._batch_depth = 0
+        self._pending_changes: List[Tuple[str, str, str]] = []
+        # Необязательная копия небольших справочников в памяти (enable_replica)
+        self.replica: Optional[DictionaryReplica] = None
+        # Подключенные файлы справочников: storage -> схема, таблица -> схема
+        self._shard_schemas: Dict[str, str] = {}
+        self._table_schemas: Dict[str, str] = {}
         self.init_database()
     
     def init_database(self):
         """Инициализация базы данных"""
-        self.conn = sqlite3.connect(self.db_path)
+        timings = {}
+        started = time.perf_counter()
+        
+        connect = self.profiler.connect if self.profiler else sqlite3.connect
+        if self.read_only:
+            self._open_read_only(connect)
+            return
+        self.conn = connect(self.db_path)
         self.conn.row_factory = sqlite3.Row
         
         # Включаем поддержку внешних ключей
         self.conn.execute("PRAGMA foreign_keys = ON")
+        # Файлы справочников подключаются до схемы: иначе CREATE TABLE IF NOT EXISTS
+        # создал бы в основной базе пустую копию таблицы шарда
+        attach_shards(self)
+        timings['подключение'] = time.perf_counter() - started
+        
+        # Схему и начальные данные загружаем только если версия БД устарела
+        if self.get_schema_version() == SCHEMA_VERSION:
+            print(f"✅ Схема базы данных актуальна (версия {SCHEMA_VERSION})")
+        else:
+            phase_started = time.perf_counter()
+            # Загружаем полную схему из schema.sql
+            schema_loaded = self._load_full_schema()
+            self._install_metadata_triggers()
+            timings['схема'] = time.perf_counter() - phase_started
+            
+            phase_started = time.perf_counter()
+            # Заполняем начальными данными
+            seed_initial_data(db_manager=self)
+            timings['начальные данные'] = time.perf_counter() - phase_started
+            
+            if schema_loaded:
+                self._set_schema_version(SCHEMA_VERSION)
+        
+        phase_started = time.perf_counter()
+        # Приводим таблицы данных в соответствие с метаданными
+        self._sync_data_tables()
+        timings['миграции'] = time.perf_counter() - phase_started
+        
+        phase_started = time.perf_counter()
+        # Создаем недостающие триггеры журнала изменений
+        install_change_log(self)
+        timings['журнал изменений'] = time.perf_counter() - phase_started
         
-        # Загружаем полную схему из schema.sql
-        self._load_full_schema()
+        phase_started = time.perf_counter()
+        # Создаем таблицы истории записей и их триггеры
+        install_history(self)
+        timings['история'] = time.perf_counter() - phase_started
         
-        # Заполняем начальными данными
-        seed_initial_data(db_manager=self)
+        phase_started = time.perf_counter()
+        # Создаем недостающие сводные таблицы и их триггеры
+        self._sync_summary_tables()
+        timings['сводные таблицы'] = time.perf_counter() - phase_started
+        
+        phases = ', '.join(f"{name} {elapsed * 1000:.1f} мс" for name, elapsed in timings.items())
+        print(f"⏱  Запуск БД за {(time.perf_counter() - started) * 1000:.1f} мс ({phases})")
+    
+    def _open_read_only(self, connect: Callable[..., sqlite3.Connection]):
+        """Открывает файл только для чтения: без схемы, миграций и блокировок записи.
+        
+        Файл отображается в память (mmap), поэтому процессы отчетов читают
+        страницы из общего кэша ОС без копирования в свой кэш SQLite.
+        """
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        self.conn = connect(uri, uri=True)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(f"PRAGMA mmap_size = {READ_ONLY_MMAP_SIZE}")
+        self.conn.execute("PRAGMA query_only = ON")
+        
+        if self.get_schema_version() != SCHEMA_VERSION:
+            print(
+                f"⚠️  Версия схемы {self.get_schema_version()} вместо {SCHEMA_VERSION}: "
+                f"в режиме только для чтения база не обновляется"
+            )
+        self._metadata = self._load_metadata()
+    
+    def _load_metadata(self) -> Dict[str, Any]:
+        """Читает справочники, поля и список таблиц одним проходом"""
+        dictionaries = self._select_dictionaries()
+        attach_shards(self, dictionaries)
+        return {
+            'version': self._metadata_version_or_none(),
+            'dictionaries': dictionaries,
+            'fields': {d['id']: self._select_dictionary_fields(d['id']) for d in dictionaries},
+            'tables': {
+                row[0] for row in
+                self.conn.execute("SELECT name FROM pragma_table_list WHERE type = 'table'")
+            },
+            # Колонки таблиц заполняются по мере обращения
+            'columns': {},
+        }
+    
+    def _metadata_version_or_none(self) -> Optional[int]:
+        try:
+            return self.get_metadata_version()
+        except sqlite3.OperationalError:
+            # База старше Metadata_Version: изменения метаданных не отследить
+            return None
+    
+    def _metadata_snapshot(self) -> Optional[Dict[str, Any]]:
+        """Метаданные из памяти (только чтение) или None, если читать из базы.
+        
+        Без immutable файл может менять другой процесс, поэтому снимок
+        перечитывается, когда меняется Metadata_Version.
+        """
+        if self._metadata is None:
+            return None
+        if not self.immutable and self._metadata['version'] is not None:
+            if self.get_metadata_version() != self._metadata['version']:
+                self._metadata = self._load_metadata()
+                self._invalidate_cache()
+        return self._metadata
+    
+    def get_schema_version(self) -> int:
+        """Возвращает версию схемы из PRAGMA user_version"""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    def _set_schema_version(self, version: int):
+        """Записывает версию схемы в PRAGMA user_version"""
+        self.conn.execute(f"PRAGMA user_version = {int(version)}")
+        self.conn.commit()
 
-    def _load_full_schema(self):
+    def _load_full_schema(self) -> bool:
         """Загружает полную схему из schema.sql"""
         schema_path = Path(__file__).parent.parent / 'schema.sql'
         
         if not schema_path.exists():
             print("⚠️  Файл schema.sql не найден")
-            return
+            return False
         
         try:
             with open(schema_path, 'r', encoding='utf-8') as f:
@@ -44,21 +224,45 @@ class DatabaseManager:
             
             for command in commands:
                 command = command.strip()
+                # Таблицу, хранящуюся в шарде, ищем в его схеме
+                command = re.sub(
+                    r'(CREATE TABLE IF NOT EXISTS\s+)(\w+)',
+                    lambda match: match.group(1) + self._qualified(match.group(2)),
+                    command, count=1
+                )
                 if command:  # Пропускаем пустые команды
                     try:
                         self.conn.execute(command)
                     except sqlite3.OperationalError as e:
-                        # Игнорируем ошибки "таблица уже существует"
-                        if "already exists" not in str(e):
+                        # Игнорируем ошибки "таблица уже существует" и повторное
+                        # добавление колонки при перезагрузке схемы
+                        if "already exists" not in str(e) and "duplicate column" not in str(e):
                             print(f"⚠️  SQL ошибка: {e}")
             
             self.conn.commit()
             print("✅ Схема базы данных загружена")
+            return True
             
         except Exception as e:
             print(f"❌ Ошибка загрузки схемы: {e}")
             raise
 
+    def _install_metadata_triggers(self):
+        """Создает триггеры, увеличивающие Metadata_Version при изменении метаданных"""
+        for table_name in METADATA_TABLES:
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                self.conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_metadata_version_{table_name}_{event.lower()}
+                    AFTER {event} ON {table_name} BEGIN
+                        UPDATE Metadata_Version SET version = version + 1 WHERE id = 1;
+                    END
+                """)
+        self.conn.commit()
+    
+    def get_metadata_version(self) -> int:
+        """Возвращает версию метаданных (меняется при любом изменении справочников и полей)"""
+        return self.conn.execute("SELECT version FROM Metadata_Version WHERE id = 1").fetchone()[0]
+    
     def _create_metadata_tables(self):
         """Создание таблиц метаданных"""
         with open(Path(__file__).parent.parent / 'schema.sql', 'r', encoding='utf-8') as f:
@@ -71,44 +275,142 @@ class DatabaseManager:
 
     def _sync_data_tables(self):
         """Синхронизация таблиц данных с метаданными"""
-        # Получаем все справочники
-        dictionaries = self.get_dictionaries()
-        
-        for dict_info in dictionaries:
-            table_name = dict_info['name']
-            fields = self.get_dictionary_fields(dict_info['id'])
-            
-            # Создаем таблицу, если её нет
-            if not self._table_exists(table_name):
-                self._create_data_table(table_name, fields)
+        # Создаем недостающие таблицы и колонки, пересобираем измененные
+        self.migrate()
+        # Индексы по внешним ключам для проверки ссылок при удалении
+        ensure_reference_indexes(self)
+    
+    def plan_migrations(self) -> List[Dict[str, Any]]:
+        """Возвращает план миграций без его применения"""
+        return plan_migrations(self)
+    
+    def migrate(self, batch_size: int = 10000) -> List[Dict[str, Any]]:
+        """Применяет миграции таблиц данных в одной транзакции"""
+        plan = apply_migrations(self, batch_size=batch_size)
+        if plan:
+            # Набор колонок изменился - пересоздаем триггеры журнала и истории
+            install_change_log(self, replace=True)
+            install_history(self, replace=True)
+            self._invalidate_cache()
+        return plan
+    
+    def sync_with(self, other: 'DatabaseManager', batch_size: int = 1000) -> Dict[str, Any]:
+        """Обменивается изменениями с другой копией базы по журналу Change_Log"""
+        return sync_databases(self, other, batch_size=batch_size)
+    
+    def compact_deleted(
+        self,
+        retention_days: int = 30,
+        batch_size: int = 1000,
+        archive_path: Optional[Path] = None,
+        convert_auto_vacuum: bool = False
+    ) -> Dict[str, Any]:
+        """Переносит старые мягко удаленные записи в архив и сжимает файл"""
+        report = compact_deleted(
+            self, retention_days=retention_days, batch_size=batch_size, archive_path=archive_path,
+            convert_auto_vacuum=convert_auto_vacuum
+        )
+        self._invalidate_cache()
+        refresh_statistics(self.conn)
+        return report
+    
+    def as_of(
+        self,
+        table_name: str,
+        moment: Union[str, date, datetime],
+        record_id: Optional[str] = None,
+        include_deleted: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Записи справочника на момент времени (дата без времени - конец дня)"""
+        return as_of(self, table_name, moment, record_id, include_deleted)
+    
+    def set_history_enabled(self, table_name: str, enabled: bool):
+        """Включает или отключает историю изменений справочника"""
+        set_history_enabled(self, table_name, enabled)
+        self._invalidate_cache()
+    
+    def get_record_history(self, table_name: str, record_id: str) -> List[Dict[str, Any]]:
+        """Все версии записи со сроками действия valid_from, valid_to"""
+        return record_history(self, table_name, record_id)
     
     def _table_exists(self, table_name: str) -> bool:
         """Проверяет существование таблицы"""
+        metadata = self._metadata_snapshot()
+        if metadata is not None:
+            return table_name in metadata['tables']
+        # pragma_table_list видит таблицы всех подключенных файлов
         cursor = self.conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+            "SELECT name FROM pragma_table_list WHERE type = 'table' AND name = ?",
             (table_name,)
         )
         return cursor.fetchone() is not None
     
+    def _schema_of(self, table_name: str) -> str:
+        """Схема файла, в котором хранится таблица справочника"""
+        return self._table_schemas.get(table_name, 'main')
+    
+    def _qualified(self, name: str, table_name: Optional[str] = None) -> str:
+        """Имя таблицы (или индекса таблицы table_name) со схемой ее шарда"""
+        schema = self._schema_of(table_name or name)
+        return name if schema == 'main' else f"{schema}.{name}"
+    
+    def _data_schemas(self) -> List[str]:
+        """Основная база и подключенные файлы справочников"""
+        return ['main'] + list(self._shard_schemas.values())
+    
+    def move_dictionary(
+        self,
+        table_name: str,
+        storage: Optional[str] = None,
+        batch_size: int = 10000
+    ) -> Dict[str, Any]:
+        """Переносит справочник в отдельный файл storage (None - в основную базу)"""
+        return move_dictionary(self, table_name, storage, batch_size=batch_size)
+    
     def _create_data_table(self, table_name: str, fields: List[Dict[str, Any]]):
         """Создает таблицу для данных на основе метаданных"""
+        self.conn.execute(self._data_table_sql(table_name, fields))
+        self.conn.commit()
+    
+    def _data_table_sql(
+        self,
+        table_name: str,
+        fields: List[Dict[str, Any]],
+        schema: Optional[str] = None,
+        constraints: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> str:
+        """Возвращает CREATE TABLE для таблицы данных на основе метаданных.
+
+        constraints - ограничения колонок пересобираемой таблицы по имени
+        колонки: not_null, default и fk_actions (ON DELETE/ON UPDATE).
+        """
+        schema = schema or self._schema_of(table_name)
+        constraints = constraints or {}
         columns = []
         foreign_keys = []
         
         for field in fields:
             field_name = field['field_name']
             data_type = self._map_data_type(field['data_type'])
+            column = constraints.get(field_name, {})
             
+            column_sql = f"{field_name} {data_type}"
             if field['is_primary_key']:
-                columns.append(f"{field_name} {data_type} PRIMARY KEY")
-            else:
-                columns.append(f"{field_name} {data_type}")
+                column_sql += " PRIMARY KEY"
+            if column.get('not_null'):
+                column_sql += " NOT NULL"
+            if column.get('default') is not None:
+                column_sql += f" DEFAULT {column['default']}"
+            columns.append(column_sql)
             
-            # Добавляем внешний ключ если нужно
-            if field['data_type'] == 'FOREIGN_KEY' and field['reference_to']:
-                foreign_keys.append(
-                    f"FOREIGN KEY ({field_name}) REFERENCES {field['reference_to']}(id)"
-                )
+            # Добавляем внешний ключ если нужно (SQLite проверяет его только
+            # внутри одного файла, ссылки между шардами проверяет валидатор)
+            if (field['data_type'] == 'FOREIGN_KEY' and field['reference_to']
+                    and self._schema_of(field['reference_to']) == schema):
+                foreign_key = f"FOREIGN KEY ({field_name}) REFERENCES {field['reference_to']}(id)"
+                if column.get('fk_actions'):
+                    foreign_key += f" {column['fk_actions']}"
+                foreign_keys.append(foreign_key)
         
         # Добавляем служебные поля
         columns.append("created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
@@ -116,14 +418,14 @@ class DatabaseManager:
         columns.append("is_deleted INTEGER DEFAULT 0")
         
         # Собираем SQL
-        sql = f"CREATE TABLE IF NOT EXISTS {table_name} (\n"
+        name = table_name if schema == 'main' else f"{schema}.{table_name}"
+        sql = f"CREATE TABLE IF NOT EXISTS {name} (\n"
         sql += ",\n".join(columns)
         if foreign_keys:
             sql += ",\n" + ",\n".join(foreign_keys)
         sql += "\n)"
         
-        self.conn.execute(sql)
-        self.conn.commit()
+        return sql
     
     def _map_data_type(self, data_type: str) -> str:
         """Преобразует тип данных из метаданных в SQLite тип"""
@@ -139,8 +441,14 @@ class DatabaseManager:
     
     def get_dictionaries(self) -> List[Dict[str, Any]]:
         """Возвращает список всех справочников"""
+        metadata = self._metadata_snapshot()
+        if metadata is not None:
+            return [dict(d) for d in metadata['dictionaries']]
+        return self._select_dictionaries()
+    
+    def _select_dictionaries(self) -> List[Dict[str, Any]]:
         cursor = self.conn.execute("""
-            SELECT id, name, display_name, description 
+            SELECT id, name, display_name, description, storage
             FROM Dictionary 
             ORDER BY display_name
         """)
@@ -148,6 +456,12 @@ class DatabaseManager:
     
     def get_dictionary_fields(self, dictionary_id: str) -> List[Dict[str, Any]]:
         """Возвращает поля для указанного справочника"""
+        metadata = self._metadata_snapshot()
+        if metadata is not None:
+            return [dict(f) for f in metadata['fields'].get(dictionary_id, [])]
+        return self._select_dictionary_fields(dictionary_id)
+    
+    def _select_dictionary_fields(self, dictionary_id: str) -> List[Dict[str, Any]]:
         cursor = self.conn.execute("""
             SELECT * FROM Dictionary_Fields 
             WHERE dictionary_id = ? 
@@ -166,6 +480,13 @@ class DatabaseManager:
     
     def get_dictionary_by_name(self, name: str) -> Optional[Dict[str, Any]]:
         """Возвращает справочник по имени"""
+        metadata = self._metadata_snapshot()
+        if metadata is not None:
+            return next(
+                ({key: d[key] for key in ('id', 'name', 'display_name')}
+                 for d in metadata['dictionaries'] if d['name'] == name),
+                None
+            )
         cursor = self.conn.execute(
             "SELECT id, name, display_name FROM Dictionary WHERE name = ?",
             (name,)
@@ -182,8 +503,161 @@ class DatabaseManager:
         """)
         return [dict(row) for row in cursor.fetchall()]
     
+    def find_records(
+        self,
+        table_name: str,
+        filters: Optional[Dict[str, Any]] = None,
+        limit: int = 100,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Возвращает страницу записей, подходящих под условия равенства filters"""
+        columns = set(self._table_columns(table_name))
+        unknown = [c for c in (filters or {}) if c not in columns]
+        if unknown:
+            raise ValueError(f"В таблице {table_name} нет колонок: {', '.join(unknown)}")
+        
+        conditions = ["is_deleted = 0"]
+        params: List[Any] = []
+        for column, value in (filters or {}).items():
+            conditions.append(f"{column} = ?")
+            params.append(value)
+        
+        cursor = self.conn.execute(f"""
+            SELECT * FROM {table_name}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rowid
+            LIMIT ? OFFSET ?
+        """, params + [limit, offset])
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def iter_records(
+        self,
+        table_name: str,
+        include_deleted: bool = False,
+        batch_size: int = 1000
+    ) -> Iterator[Any]:
+        """Лениво выдает записи таблицы компактными namedtuple в порядке добавления.
+        
+        В отличие от get_all_records не строит словарь на каждую строку и не
+        держит всю выборку в памяти; records.to_dict() дает словарь для
+        отдельной записи.
+        """
+        where_clause = "" if include_deleted else "WHERE is_deleted = 0"
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f"SELECT * FROM {table_name} {where_clause} ORDER BY rowid")
+        return stream_records(cursor, table_name, batch_size)
+    
+    def get_display_rows(
+        self,
+        table_name: str,
+        fields: List[Dict[str, Any]],
+        include_deleted: bool = False,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[tuple]:
+        """Возвращает кортежи (id, значения fields...) в порядке отображения.
+        
+        Внешние ключи сразу заменяются названием связанной записи через
+        LEFT JOIN; если записи нет или у справочника нет поля name,
+        остается исходное значение. where - условия равенства по колонкам
+        таблицы, например {'id': record_id}.
+        """
+        return self._display_rows_cursor(table_name, fields, include_deleted, where).fetchall()
+    
+    def iter_display_rows(
+        self,
+        table_name: str,
+        fields: List[Dict[str, Any]],
+        page_size: int = 1000
+    ) -> Iterator[List[tuple]]:
+        """То же, что get_display_rows, но страницами по page_size строк.
+        
+        Каждая страница - отдельный запрос WHERE rowid < последнего выданного,
+        который читается целиком: между страницами не остается открытого
+        курсора, держащего блокировку чтения, а изменения между страницами
+        не сбивают загрузку. Страницы идут по убыванию rowid (от новых записей
+        к старым), а не по created_at, чтобы не сортировать таблицу заново
+        для каждой страницы.
+        """
+        before_rowid = None
+        while True:
+            rows = self._display_rows_cursor(
+                table_name, fields, before_rowid=before_rowid, limit=page_size
+            ).fetchall()
+            if not rows:
+                break
+            # Последняя колонка - rowid для следующей страницы
+            before_rowid = rows[-1][-1]
+            yield [row[:-1] for row in rows]
+    
+    def _display_rows_cursor(
+        self,
+        table_name: str,
+        fields: List[Dict[str, Any]],
+        include_deleted: bool = False,
+        where: Optional[Dict[str, Any]] = None,
+        before_rowid: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> sqlite3.Cursor:
+        select_parts = ["t.id"]
+        joins = []
+        for field in fields:
+            field_name = field['field_name']
+            ref_table = field.get('reference_to')
+            if (field['data_type'] == 'FOREIGN_KEY' and ref_table
+                    and 'name' in self._table_columns(ref_table)):
+                alias = f"ref_{len(joins)}"
+                joins.append(
+                    f" LEFT JOIN {ref_table} {alias}"
+                    f" ON {alias}.id = t.{field_name} AND {alias}.is_deleted = 0"
+                )
+                select_parts.append(f"COALESCE({alias}.name, t.{field_name})")
+            else:
+                select_parts.append(f"t.{field_name}")
+        
+        conditions = [] if include_deleted else ["t.is_deleted = 0"]
+        params = []
+        for column, value in (where or {}).items():
+            conditions.append(f"t.{column} = ?")
+            params.append(value)
+        order_clause = "ORDER BY t.created_at DESC"
+        if limit is not None:
+            # Постраничное чтение по ключу: rowid последней колонкой
+            select_parts.append("t.rowid")
+            if before_rowid is not None:
+                conditions.append("t.rowid < ?")
+                params.append(before_rowid)
+            order_clause = "ORDER BY t.rowid DESC LIMIT ?"
+            params.append(limit)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f"""
+            SELECT {', '.join(select_parts)} FROM {table_name} t{''.join(joins)}
+            {where_clause}
+            {order_clause}
+        """, params)
+        return cursor
+    
+    def _table_columns(self, table_name: str) -> List[str]:
+        """Возвращает имена колонок таблицы"""
+        metadata = self._metadata_snapshot()
+        if metadata is not None and table_name in metadata['columns']:
+            return list(metadata['columns'][table_name])
+        cursor = self.conn.execute(f"PRAGMA table_info({table_name})")
+        columns = [row['name'] for row in cursor.fetchall()]
+        if metadata is not None:
+            metadata['columns'][table_name] = columns
+        return list(columns)
+    
     def get_record_by_id(self, table_name: str, record_id: str) -> Optional[Dict[str, Any]]:
         """Возвращает запись по ID"""
+        mirror = self.replica.lookup(table_name) if self.replica else None
+        if mirror is not None:
+            record = mirror.records.get(record_id)
+            return to_dict(record) if record is not None else None
+        
         cursor = self.conn.execute(
             f"SELECT * FROM {table_name} WHERE id = ? AND is_deleted = 0",
             (record_id,)
@@ -204,11 +678,18 @@ class DatabaseManager:
         
         sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
         
-        self.conn.execute(sql, list(data.values()))
-        self.conn.commit()
+        with self._write_transaction():
+            check_cross_file_references(self, table_name, data)
+            self.conn.execute(sql, list(data.values()))
+        self._notify_change(table_name, 'insert', data['id'])
         
         return data['id']
     
+    def insert_records(self, table_name: str, records: List[Dict[str, Any]]) -> List[str]:
+        """Добавляет набор записей атомарно: при ошибке не сохраняется ни одна"""
+        with self.batch(), self._write_transaction():
+            return [self.insert_record(table_name, dict(record)) for record in records]
+    
     def update_record(self, table_name: str, record_id: str, data: Dict[str, Any]):
         """Обновляет существующую запись"""
         data['updated_at'] = datetime.now().isoformat()
@@ -218,20 +699,212 @@ class DatabaseManager:
         sql = f"UPDATE {table_name} SET {set_clause} WHERE id = ?"
         
         params = list(data.values()) + [record_id]
-        self.conn.execute(sql, params)
-        self.conn.commit()
+        with self._write_transaction():
+            check_cross_file_references(self, table_name, data)
+            self.conn.execute(sql, params)
+        self._notify_change(table_name, 'update', record_id)
     
     def soft_delete_record(self, table_name: str, record_id: str):
         """Мягкое удаление записи (помечает как удаленную)"""
-        self.conn.execute(f"""
-            UPDATE {table_name} 
-            SET is_deleted = 1, updated_at = ? 
-            WHERE id = ?
-        """, (datetime.now().isoformat(), record_id))
+        self.soft_delete_many(table_name, [record_id])
+    
+    def soft_delete_many(self, table_name: str, ids: List[str]) -> int:
+        """Мягкое удаление набора записей одной транзакцией.
+        
+        Ссылки на удаляемые записи проверяются по reference_to: при политике
+        'restrict' выбрасывается DeleteBlockedError, при 'cascade'
+        ссылающиеся записи удаляются вместе с ними. id подставляются в IN
+        пачками по IN_BATCH_SIZE. Возвращает число помеченных записей
+        table_name; уже удаленные не учитываются.
+        """
+        ids = list(dict.fromkeys(ids))
+        now = datetime.now().isoformat()
+        deleted: List[Tuple[str, str]] = []
+        
+        # Проверка ссылок и пометка идут в одной транзакции записи
+        with self._write_transaction():
+            plan = plan_soft_delete(self, table_name, ids)
+            for target, target_ids in plan.items():
+                for start in range(0, len(target_ids), IN_BATCH_SIZE):
+                    batch = target_ids[start:start + IN_BATCH_SIZE]
+                    cursor = self.conn.execute(f"""
+                        UPDATE {target}
+                        SET is_deleted = 1, updated_at = ?
+                        WHERE is_deleted = 0 AND id IN ({', '.join('?' for _ in batch)})
+                        RETURNING id
+                    """, [now] + batch)
+                    deleted.extend((target, row[0]) for row in cursor.fetchall())
+        
+        for target, record_id in deleted:
+            self._notify_change(target, 'delete', record_id)
+        return sum(1 for target, _ in deleted if target == table_name)
+    
+    @contextmanager
+    def batch(self) -> Generator[None, None, None]:
+        """Групповая фиксация: все записи внутри блока идут одной транзакцией.
+        
+        Каждая операция внутри выполняется в своей точке сохранения, поэтому
+        ошибка одной из них откатывает только ее. Оповещения об изменениях
+        рассылаются после фиксации всего блока.
+        """
+        if self._batch_depth:
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+            return
+        
         self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._batch_depth = 1
+        try:
+            yield
+        except Exception:
+            self._batch_depth = 0
+            self._pending_changes.clear()
+            self.conn.rollback()
+            raise
+        
+        self._batch_depth = 0
+        try:
+            self.conn.commit()
+        except Exception:
+            self._pending_changes.clear()
+            self.conn.rollback()
+            raise
+        
+        changes, self._pending_changes = self._pending_changes, []
+        for change in changes:
+            self._notify_change(*change)
+    
+    @contextmanager
+    def _write_transaction(self) -> Generator[None, None, None]:
+        """Транзакция одной операции записи; внутри batch() - точка сохранения"""
+        if self._batch_depth:
+            pending = len(self._pending_changes)
+            self.conn.execute("SAVEPOINT write_op")
+            try:
+                yield
+            except Exception:
+                self.conn.execute("ROLLBACK TO write_op")
+                self.conn.execute("RELEASE write_op")
+                # Об откаченных изменениях оповещать не нужно
+                del self._pending_changes[pending:]
+                raise
+            self.conn.execute("RELEASE write_op")
+            return
+        
+        self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+    
+    def set_on_delete_policy(self, table_name: str, field_name: str, policy: str):
+        """Задает поведение внешнего ключа при удалении главной записи"""
+        if policy not in ON_DELETE_POLICIES:
+            raise ValueError(f"Неизвестная политика удаления: {policy}")
+        dictionary = self.get_dictionary_by_name(table_name)
+        if not dictionary:
+            raise ValueError(f"Справочник '{table_name}' не найден")
+        
+        cursor = self.conn.execute("""
+            UPDATE Dictionary_Fields SET on_delete = ?
+            WHERE dictionary_id = ? AND field_name = ? AND data_type = 'FOREIGN_KEY'
+        """, (policy, dictionary['id'], field_name))
+        if cursor.rowcount == 0:
+            self.conn.rollback()
+            raise ValueError(f"Поле {table_name}.{field_name} не является внешним ключом")
+        self.conn.commit()
+    
+    def update_where(
+        self,
+        table_name: str,
+        filters: Dict[str, Any],
+        changes: Dict[str, Any]
+    ) -> int:
+        """Изменяет все записи, подходящие под filters, одной транзакцией.
+        
+        filters - условия равенства по колонкам; значение-список превращается
+        в IN, длинный список разбивается на пачки по IN_BATCH_SIZE. Удаленные
+        записи не изменяются, если в filters не указано is_deleted.
+        changes проверяются по метаданным, как изменение одной записи, и
+        не могут затрагивать системные поля: удаление идет только через
+        soft_delete_many с проверкой ссылок. Возвращает число измененных записей.
+        """
+        if not filters:
+            raise ValueError("Для update_where нужно хотя бы одно условие")
+        if not changes:
+            return 0
+        
+        columns = set(self._table_columns(table_name))
+        unknown = [c for c in list(filters) + list(changes) if c not in columns]
+        if unknown:
+            raise ValueError(f"В таблице {table_name} нет колонок: {', '.join(unknown)}")
+        system = [c for c in changes if c in SYSTEM_FIELDS]
+        if system:
+            raise ValueError(f"Системные поля нельзя изменять через update_where: {', '.join(system)}")
+        
+        report = self.validate_records(table_name, [changes], partial=True)
+        if report['errors']:
+            raise RecordValidationError(report['errors'])
+        
+        filters = dict(filters)
+        filters.setdefault('is_deleted', 0)
+        changes = dict(report['records'][0], updated_at=datetime.now().isoformat())
+        
+        # Пачками идет самый длинный список значений, остальные условия общие
+        lists = [c for c, v in filters.items() if isinstance(v, (list, tuple, set))]
+        batched = max(lists, key=lambda c: len(filters[c]), default=None)
+        batched_values = list(dict.fromkeys(filters[batched])) if batched else [None]
+        
+        conditions = []
+        params: List[Any] = []
+        for column, value in filters.items():
+            if column == batched:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                conditions.append(f"{column} IN ({', '.join('?' for _ in value)})")
+                params.extend(value)
+            elif value is None:
+                conditions.append(f"{column} IS NULL")
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        
+        set_clause = ', '.join(f"{column} = ?" for column in changes)
+        updated: List[str] = []
+        
+        with self._write_transaction():
+            step = IN_BATCH_SIZE if batched else 1
+            for start in range(0, len(batched_values), step):
+                batch_conditions = list(conditions)
+                batch_params = list(changes.values()) + params
+                if batched:
+                    batch = batched_values[start:start + step]
+                    batch_conditions.append(f"{batched} IN ({', '.join('?' for _ in batch)})")
+                    batch_params.extend(batch)
+                cursor = self.conn.execute(f"""
+                    UPDATE {table_name} SET {set_clause}
+                    WHERE {' AND '.join(batch_conditions)}
+                    RETURNING id
+                """, batch_params)
+                updated.extend(row[0] for row in cursor.fetchall())
+        
+        for record_id in updated:
+            self._notify_change(table_name, 'update', record_id)
+        return len(updated)
     
     def get_reference_values(self, table_name: str, display_field: str = 'name') -> List[Tuple[str, str]]:
         """Возвращает значения для выпадающего списка (id, display_value)"""
+        mirror = self._replica_mirror(table_name, display_field)
+        if mirror is not None:
+            return mirror.values()
         cursor = self.conn.execute(f"""
             SELECT id, {display_field} 
             FROM {table_name} 
@@ -240,6 +913,556 @@ class DatabaseManager:
         """)
         return [(row['id'], row[display_field]) for row in cursor.fetchall()]
     
+    def search_reference_values(
+        self,
+        table_name: str,
+        prefix: str = '',
+        limit: int = 50,
+        display_field: str = 'name'
+    ) -> List[Tuple[str, str]]:
+        """Возвращает до limit значений (id, display_value), начинающихся с prefix.
+        
+        Префикс ищется диапазоном по индексу (display_field, is_deleted), без
+        просмотра таблицы. Для кириллицы SQLite не различает регистр сам,
+        поэтому дополнительно ищется вариант префикса с заглавной буквы.
+        Справочники из копии в памяти ищутся в ней без учета регистра.
+        """
+        mirror = self._replica_mirror(table_name, display_field)
+        if mirror is not None:
+            return mirror.search(prefix, limit)
+        
+        variants = list(dict.fromkeys([prefix, prefix[:1].upper() + prefix[1:]]))
+        values: Dict[str, str] = {}
+        for variant in variants:
+            cursor = self.conn.execute(f"""
+                SELECT id, {display_field}
+                FROM {table_name}
+                WHERE {display_field} >= ? AND {display_field} < ? AND is_deleted = 0
+                ORDER BY {display_field}
+                LIMIT ?
+            """, (variant, variant + '\U0010ffff', limit))
+            for row in cursor.fetchall():
+                values.setdefault(row[0], row[1])
+        
+        return sorted(values.items(), key=lambda item: item[1])[:limit]
+    
+    def get_reference_label(
+        self,
+        table_name: str,
+        record_id: str,
+        display_field: str = 'name'
+    ) -> Optional[str]:
+        """Возвращает отображаемое значение записи по id"""
+        mirror = self._replica_mirror(table_name, display_field)
+        if mirror is not None and record_id in mirror.records:
+            return mirror.label(record_id)
+        
+        row = self.conn.execute(
+            f"SELECT {display_field} FROM {table_name} WHERE id = ?", (record_id,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def get_table_statistics(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Сохраненная статистика таблицы и ее полей или None, если ее еще не собирали"""
+        row = self.conn.execute(
+            "SELECT row_count, live_count, analyzed_at FROM Table_Statistics WHERE table_name = ?",
+            (table_name,)
+        ).fetchone()
+        if row is None:
+            return None
+        stats = dict(row)
+        stats['fields'] = {
+            field['field_name']: {
+                'distinct_estimate': field['distinct_estimate'],
+                'null_fraction': field['null_fraction'],
+            }
+            for field in self.conn.execute(
+                "SELECT * FROM Field_Statistics WHERE table_name = ?", (table_name,)
+            )
+        }
+        return stats
+    
+    def estimate_row_count(self, table_name: str) -> int:
+        """Число живых записей без просмотра таблицы.
+        
+        Берется из Table_Statistics; если статистики нет - наибольший rowid
+        (поиск по краю B-дерева, оценка сверху).
+        """
+        row = self.conn.execute(
+            "SELECT live_count FROM Table_Statistics WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        return self.conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+    
+    def run_maintenance(self, analyze: bool = True, tables: Optional[List[str]] = None) -> Dict[str, Any]:
+        """ANALYZE, PRAGMA optimize и пересчет Table_Statistics/Field_Statistics"""
+        return run_maintenance(self.conn, analyze=analyze, tables=tables)
+    
+    def maintenance_due(self) -> bool:
+        """Устарела ли статистика таблиц"""
+        return maintenance_due(self.conn)
+    
+    def compile_validator(self, table_name: str) -> RecordValidator:
+        """Валидатор записей таблицы по ее метаданным"""
+        return compile_validator(self, table_name)
+    
+    def validate_records(
+        self,
+        table_name: str,
+        rows: List[Dict[str, Any]],
+        processes: int = 0,
+        partial: bool = False,
+        keep_records: bool = True
+    ) -> Dict[str, Any]:
+        """Проверяет записи по метаданным и приводит значения к типам полей"""
+        return validate_records(
+            self, table_name, rows, processes=processes, partial=partial, keep_records=keep_records
+        )
+    
+    def enable_replica(self, max_rows: int = DEFAULT_MAX_ROWS) -> DictionaryReplica:
+        """Загружает в память справочники не больше max_rows записей.
+        
+        Дальше поиск записи по id, значения для выпадающих списков и поиск
+        по началу названия для них выполняются без запросов к базе, а копия
+        обновляется при изменениях через этот DatabaseManager.
+        """
+        self.disable_replica()
+        self.replica = DictionaryReplica(self, max_rows)
+        loaded = sum(len(mirror.records) for mirror in self.replica.mirrors.values())
+        print(f"✅ Копия в памяти: {len(self.replica.mirrors)} справочников, {loaded} записей")
+        return self.replica
+    
+    def disable_replica(self):
+        """Отключает копию справочников в памяти"""
+        if self.replica:
+            self.replica.close()
+            self.replica = None
+    
+    def _replica_mirror(self, table_name: str, display_field: str = 'name'):
+        """Копия справочника, если запрос по display_field можно выполнить в ней"""
+        if not self.replica or display_field != 'name':
+            return None
+        return self.replica.lookup(table_name)
+    
+    def get_table_fields(self, table_name: str) -> List[Dict[str, Any]]:
+        """Возвращает поля справочника по имени его таблицы"""
+        dictionary = self.get_dictionary_by_name(table_name)
+        if not dictionary:
+            raise ValueError(f"Справочник '{table_name}' не найден")
+        return self.get_dictionary_fields(dictionary['id'])
+    
+    def aggregate(
+        self,
+        table_name: str,
+        group_by: Any = None,
+        aggregates: Optional[Dict[str, Any]] = None,
+        include_deleted: bool = False,
+        use_cache: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Группировка и агрегаты по справочнику, вычисляемые в SQL.
+        
+        group_by - имя поля или список имен. Для внешнего ключа можно
+        указать поле связанного справочника через точку: 'city_id.region'.
+        aggregates - словарь {поле: функция или список функций},
+        например {'employee_count': ['sum', 'avg']}.
+        
+        Каждая строка результата содержит значения группировки, для внешних
+        ключей дополнительно '<поле>_display' с названием связанной записи,
+        количество записей 'count' и агрегаты вида '<функция>_<поле>'.
+        """
+        if group_by is None:
+            group_by = []
+        elif isinstance(group_by, str):
+            group_by = [group_by]
+        aggregates = aggregates or {}
+        
+        cache_key = (
+            table_name,
+            tuple(group_by),
+            tuple(sorted(
+                (field, tuple([funcs] if isinstance(funcs, str) else funcs))
+                for field, funcs in aggregates.items()
+            )),
+            include_deleted
+        )
+        if use_cache and cache_key in self._aggregate_cache:
+            return [dict(row) for row in self._aggregate_cache[cache_key][1]]
+        
+        # Если запрос покрывается материализованной сводкой, читаем из нее
+        summary = None if include_deleted else self._find_summary(table_name, group_by, aggregates)
+        if summary:
+            rows = self._aggregate_from_summary(summary, aggregates)
+            if use_cache:
+                self._aggregate_cache[cache_key] = ({table_name, summary['summary_name']}, rows)
+                return [dict(row) for row in rows]
+            return rows
+        
+        fields = {f['field_name']: f for f in self.get_table_fields(table_name)}
+        tables = {table_name}
+        joins: Dict[str, str] = {}
+        select_parts: List[str] = []
+        group_parts: List[str] = []
+        
+        def join_alias(field: Dict[str, Any]) -> str:
+            """Добавляет JOIN по внешнему ключу и возвращает псевдоним"""
+            if field['field_name'] not in joins:
+                joins[field['field_name']] = f"ref_{len(joins)}"
+                tables.add(field['reference_to'])
+            return joins[field['field_name']]
+        
+        for key in group_by:
+            field_name, _, ref_field_name = key.partition('.')
+            field = fields.get(field_name)
+            if not field:
+                raise ValueError(f"Поле '{field_name}' отсутствует в справочнике '{table_name}'")
+            
+            is_reference = field['data_type'] == 'FOREIGN_KEY' and field['reference_to']
+            if ref_field_name:
+                if not is_reference:
+                    raise ValueError(f"Поле '{field_name}' не является внешним ключом")
+                ref_fields = {f['field_name'] for f in self.get_table_fields(field['reference_to'])}
+                if ref_field_name not in ref_fields:
+                    raise ValueError(
+                        f"Поле '{ref_field_name}' отсутствует в справочнике '{field['reference_to']}'"
+                    )
+                column = f"{join_alias(field)}.{ref_field_name}"
+                select_parts.append(f'{column} AS "{key}"')
+                group_parts.append(column)
+            else:
+                column = f"t.{field_name}"
+                select_parts.append(f'{column} AS "{key}"')
+                group_parts.append(column)
+                if is_reference:
+                    display = f"{join_alias(field)}.name"
+                    select_parts.append(f'{display} AS "{key}_display"')
+                    group_parts.append(display)
+        
+        select_parts.append("COUNT(*) AS count")
+        for field_name, funcs in aggregates.items():
+            field = fields.get(field_name)
+            if not field:
+                raise ValueError(f"Поле '{field_name}' отсутствует в справочнике '{table_name}'")
+            for func in [funcs] if isinstance(funcs, str) else funcs:
+                func = func.lower()
+                if func not in AGGREGATE_FUNCTIONS:
+                    raise ValueError(f"Неизвестная агрегатная функция '{func}'")
+                if func != 'count' and field['data_type'] not in NUMERIC_DATA_TYPES:
+                    raise ValueError(f"Функция '{func}' применима только к числовым полям")
+                select_parts.append(f"{func.upper()}(t.{field_name}) AS {func}_{field_name}")
+        
+        sql = f"SELECT {', '.join(select_parts)} FROM {table_name} t"
+        for field_name, alias in joins.items():
+            sql += (
+                f" LEFT JOIN {fields[field_name]['reference_to']} {alias}"
+                f" ON {alias}.id = t.{field_name}"
+            )
+        if not include_deleted:
+            sql += " WHERE t.is_deleted = 0"
+        if group_parts:
+            sql += f" GROUP BY {', '.join(group_parts)} ORDER BY {', '.join(group_parts)}"
+        
+        rows = [dict(row) for row in self.conn.execute(sql).fetchall()]
+        
+        if use_cache:
+            self._aggregate_cache[cache_key] = (tables, rows)
+            return [dict(row) for row in rows]
+        return rows
+    
+    def get_summaries(self, table_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Возвращает объявленные сводные таблицы (всех или одного справочника)"""
+        sql = """
+            SELECT s.id, s.summary_name, s.group_field, s.value_fields, d.name AS table_name
+            FROM Dictionary_Summaries s
+            JOIN Dictionary d ON d.id = s.dictionary_id
+        """
+        params: Tuple = ()
+        if table_name:
+            sql += " WHERE d.name = ?"
+            params = (table_name,)
+        
+        summaries = []
+        for row in self.conn.execute(sql + " ORDER BY s.summary_name", params).fetchall():
+            summary = dict(row)
+            summary['value_fields'] = [f for f in (summary['value_fields'] or '').split(',') if f]
+            summaries.append(summary)
+        return summaries
+    
+    def add_summary_table(
+        self,
+        table_name: str,
+        group_field: str,
+        value_fields: Optional[List[str]] = None,
+        summary_name: Optional[str] = None
+    ) -> str:
+        """Объявляет материализованную сводку по справочнику.
+        
+        Сводка хранит количество активных записей и суммы числовых полей
+        value_fields по значениям group_field. Таблица заполняется один раз
+        по текущим данным, дальше ее поддерживают триггеры на INSERT,
+        UPDATE (включая мягкое удаление) и DELETE.
+        """
+        dictionary = self.get_dictionary_by_name(table_name)
+        if not dictionary:
+            raise ValueError(f"Справочник '{table_name}' не найден")
+        
+        value_fields = value_fields or []
+        fields = {f['field_name']: f for f in self.get_dictionary_fields(dictionary['id'])}
+        if group_field not in fields:
+            raise ValueError(f"Поле '{group_field}' отсутствует в справочнике '{table_name}'")
+        for field_name in value_fields:
+            if field_name not in fields:
+                raise ValueError(f"Поле '{field_name}' отсутствует в справочнике '{table_name}'")
+            if fields[field_name]['data_type'] not in NUMERIC_DATA_TYPES:
+                raise ValueError(f"Поле '{field_name}' не является числовым")
+        
+        summary_name = summary_name or f"{table_name}_by_{group_field}"
+        if not summary_name.isidentifier():
+            raise ValueError(f"Недопустимое имя сводной таблицы '{summary_name}'")
+        
+        summary_id = str(uuid.uuid4())
+        self.conn.execute("""
+            INSERT INTO Dictionary_Summaries (id, dictionary_id, summary_name, group_field, value_fields)
+            VALUES (?, ?, ?, ?, ?)
+        """, (summary_id, dictionary['id'], summary_name, group_field, ','.join(value_fields)))
+        
+        self._create_summary_table({
+            'summary_name': summary_name,
+            'table_name': table_name,
+            'group_field': group_field,
+            'value_fields': value_fields
+        })
+        self.conn.commit()
+        self._invalidate_cache(table_name)
+        
+        return summary_id
+    
+    def get_summary(self, summary_name: str) -> List[Dict[str, Any]]:
+        """Читает сводную таблицу: группы, количество, суммы и средние"""
+        summary = next((s for s in self.get_summaries() if s['summary_name'] == summary_name), None)
+        if not summary:
+            raise ValueError(f"Сводная таблица '{summary_name}' не найдена")
+        
+        aggregates = {field: ['sum', 'avg'] for field in summary['value_fields']}
+        return self._aggregate_from_summary(summary, aggregates)
+    
+    def _sync_summary_tables(self):
+        """Создает сводные таблицы и триггеры, объявленные в метаданных"""
+        for summary in self.get_summaries():
+            name = summary['summary_name']
+            if not self._table_exists(name) or self._table_columns(name) != self._summary_columns(summary):
+                # Нет таблицы или она в старом формате (без счетчиков непустых значений)
+                self._create_summary_table(summary)
+            elif not self._trigger_exists(f"trg_{name}_ins"):
+                # TEMP-триггеры таблиц шардов живут до закрытия соединения
+                self._create_summary_triggers(summary)
+        self.conn.commit()
+    
+    def _summary_columns(self, summary: Dict[str, Any]) -> List[str]:
+        """Колонки сводной таблицы: сумма и число непустых значений по каждому полю"""
+        columns = ['group_key', 'row_count']
+        for field in summary['value_fields']:
+            columns += [f"sum_{field}", f"cnt_{field}"]
+        return columns
+    
+    def _create_summary_table(self, summary: Dict[str, Any]):
+        """Создает сводную таблицу, триггеры и заполняет ее текущими данными"""
+        name = summary['summary_name']
+        table = summary['table_name']
+        group = summary['group_field']
+        values = summary['value_fields']
+        fields = {f['field_name']: f for f in self.get_table_fields(table)}
+        
+        # group_key без типа: значения группировки хранятся как есть (число
+        # остается числом, NULL - отдельной группой), как в GROUP BY
+        columns = ["group_key", "row_count INTEGER NOT NULL DEFAULT 0"]
+        for field in values:
+            # Суммы целых полей остаются целыми, как SUM() в SQL
+            sum_type = self._map_data_type(fields[field]['data_type'])
+            columns.append(f"sum_{field} {sum_type} NOT NULL DEFAULT 0")
+            columns.append(f"cnt_{field} INTEGER NOT NULL DEFAULT 0")
+        
+        self.conn.execute(f"DROP TABLE IF EXISTS {name}")
+        self.conn.execute(f"CREATE TABLE {name} ({', '.join(columns)})")
+        self.conn.execute(f"CREATE INDEX idx_{name}_group_key ON {name} (group_key)")
+        
+        # Первичное заполнение - единственный полный проход по таблице
+        select_sums = ''.join(f", COALESCE(SUM({field}), 0), COUNT({field})" for field in values)
+        self.conn.execute(f"""
+            INSERT INTO {name} ({', '.join(self._summary_columns(summary))})
+            SELECT {group}, COUNT(*){select_sums}
+            FROM {table} WHERE is_deleted = 0
+            GROUP BY {group}
+        """)
+        self._create_summary_triggers(summary)
+    
+    def _create_summary_triggers(self, summary: Dict[str, Any]):
+        """Триггеры, поддерживающие сводную таблицу при изменении записей.
+        
+        Группа ищется через IS, чтобы NULL в поле группировки был своей
+        группой, а не совпадал с пустой строкой.
+        """
+        name = summary['summary_name']
+        group = summary['group_field']
+        values = summary['value_fields']
+        
+        def change(ref: str, sign: str) -> str:
+            """SET-часть: вклад строки NEW/OLD в счетчики и суммы"""
+            return ''.join(
+                f", sum_{field} = sum_{field} {sign} COALESCE({ref}.{field}, 0)"
+                f", cnt_{field} = cnt_{field} {sign} ({ref}.{field} IS NOT NULL)"
+                for field in values
+            )
+        
+        def add_row(ref: str) -> str:
+            """SQL добавления вклада строки NEW/OLD в сводку"""
+            inserted = ''.join(
+                f", COALESCE({ref}.{field}, 0), {ref}.{field} IS NOT NULL" for field in values
+            )
+            return f"""
+                UPDATE {name} SET row_count = row_count + 1{change(ref, '+')}
+                WHERE group_key IS {ref}.{group} AND {ref}.is_deleted = 0;
+                INSERT INTO {name} ({', '.join(self._summary_columns(summary))})
+                SELECT {ref}.{group}, 1{inserted}
+                WHERE {ref}.is_deleted = 0
+                  AND NOT EXISTS (SELECT 1 FROM {name} WHERE group_key IS {ref}.{group});
+            """
+        
+        def remove_row(ref: str) -> str:
+            """SQL вычитания вклада строки OLD из сводки"""
+            return f"""
+                UPDATE {name} SET row_count = row_count - 1{change(ref, '-')}
+                WHERE group_key IS {ref}.{group} AND {ref}.is_deleted = 0;
+                DELETE FROM {name}
+                WHERE group_key IS {ref}.{group} AND row_count <= 0;
+            """
+        
+        triggers = {
+            'ins': ('AFTER INSERT', add_row('NEW')),
+            'upd': ('AFTER UPDATE', remove_row('OLD') + add_row('NEW')),
+            'del': ('AFTER DELETE', remove_row('OLD')),
+        }
+        for suffix, (event, body) in triggers.items():
+            self._create_trigger(f"trg_{name}_{suffix}", event, summary['table_name'], body)
+    
+    def _trigger_exists(self, trigger_name: str) -> bool:
+        """Проверяет существование триггера (постоянного или TEMP)"""
+        cursor = self.conn.execute("""
+            SELECT name FROM sqlite_master WHERE type = 'trigger' AND name = ?
+            UNION ALL
+            SELECT name FROM sqlite_temp_master WHERE type = 'trigger' AND name = ?
+        """, (trigger_name, trigger_name))
+        return cursor.fetchone() is not None
+    
+    def _create_trigger(self, trigger_name: str, event: str, table_name: str, body: str):
+        """Пересоздает триггер на таблице справочника.
+        
+        Постоянный триггер может обращаться только к таблицам своего файла,
+        поэтому на таблицах шардов создается TEMP-триггер: он видит Change_Log
+        и сводки основной базы, но действует только в этом соединении.
+        """
+        temp = '' if self._schema_of(table_name) == 'main' else 'TEMP '
+        self.conn.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+        self.conn.execute(
+            f"CREATE {temp}TRIGGER {trigger_name} {event} ON {self._qualified(table_name)} "
+            f"BEGIN {body} END"
+        )
+    
+    def _find_summary(
+        self,
+        table_name: str,
+        group_by: List[str],
+        aggregates: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Ищет сводку, из которой можно ответить на запрос aggregate()"""
+        if len(group_by) != 1 or '.' in group_by[0]:
+            return None
+        
+        for summary in self.get_summaries(table_name):
+            if summary['group_field'] != group_by[0]:
+                continue
+            covered = all(
+                field in summary['value_fields']
+                and all(f.lower() in ('sum', 'avg') for f in ([funcs] if isinstance(funcs, str) else funcs))
+                for field, funcs in aggregates.items()
+            )
+            if covered:
+                return summary
+        return None
+    
+    def _aggregate_from_summary(
+        self,
+        summary: Dict[str, Any],
+        aggregates: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Строит результат aggregate() по сводной таблице за O(число групп)"""
+        group = summary['group_field']
+        fields = {f['field_name']: f for f in self.get_table_fields(summary['table_name'])}
+        field = fields[group]
+        
+        select_parts = [f's.group_key AS "{group}"']
+        join = ""
+        if field['data_type'] == 'FOREIGN_KEY' and field['reference_to']:
+            select_parts.append(f'ref.name AS "{group}_display"')
+            join = f" LEFT JOIN {field['reference_to']} ref ON ref.id = s.group_key"
+        
+        select_parts.append("s.row_count AS count")
+        for field_name, funcs in aggregates.items():
+            for func in [funcs] if isinstance(funcs, str) else funcs:
+                func = func.lower()
+                # Как SUM() и AVG() в SQL: NULL, если в группе нет непустых значений
+                if func == 'sum':
+                    select_parts.append(
+                        f"CASE WHEN s.cnt_{field_name} > 0 THEN s.sum_{field_name} END AS sum_{field_name}"
+                    )
+                else:
+                    select_parts.append(
+                        f"s.sum_{field_name} * 1.0 / NULLIF(s.cnt_{field_name}, 0) AS avg_{field_name}"
+                    )
+        
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(select_parts)} FROM {summary['summary_name']} s{join} "
+            f"ORDER BY s.group_key"
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def add_change_listener(self, callback: Callable[[str, str, str], None]):
+        """Подписывает callback(table_name, operation, record_id) на изменения записей.
+        
+        operation - 'insert', 'update' или 'delete' (мягкое удаление).
+        Вызывается после фиксации транзакции.
+        """
+        if callback not in self._change_listeners:
+            self._change_listeners.append(callback)
+    
+    def remove_change_listener(self, callback: Callable[[str, str, str], None]):
+        """Отписывает callback от изменений записей"""
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+    
+    def _notify_change(self, table_name: str, operation: str, record_id: str):
+        """Сбрасывает зависимые кэши и оповещает подписчиков об изменении"""
+        if self._batch_depth:
+            # Внутри batch() оповещение откладывается до фиксации
+            self._pending_changes.append((table_name, operation, record_id))
+            return
+        self._invalidate_cache(table_name)
+        for callback in list(self._change_listeners):
+            callback(table_name, operation, record_id)
+    
+    def _invalidate_cache(self, table_name: Optional[str] = None):
+        """Сбрасывает кэш агрегатов, зависящих от таблицы (или весь кэш)"""
+        if table_name is None:
+            self._aggregate_cache.clear()
+            # Массовые изменения в обход записи по одной: копию перечитать
+            if self.replica:
+                self.replica.invalidate()
+            return
+        
+        stale = [key for key, (tables, _) in self._aggregate_cache.items() if table_name in tables]
+        for key in stale:
+            del self._aggregate_cache[key]
+    
     def add_dictionary(self, name: str, display_name: str, description: str = "") -> str:
         """Добавляет новый справочник"""
         dict_id = str(uuid.uuid4())
@@ -250,6 +1473,7 @@ class DatabaseManager:
         """, (dict_id, name, display_name, description))
         
         self.conn.commit()
+        self._invalidate_cache()
         
         # Создаем таблицу для данных
         self._sync_data_tables()
@@ -263,22 +1487,32 @@ class DatabaseManager:
         # Определяем тип виджета по типу данных
         if 'widget_type' not in field_data:
             field_data['widget_type'] = self._suggest_widget_type(field_data['data_type'])
+        if field_data.get('on_delete', 'restrict') not in ON_DELETE_POLICIES:
+            raise ValueError(f"Неизвестная политика удаления: {field_data['on_delete']}")
+        if field_data.get('pattern'):
+            try:
+                re.compile(field_data['pattern'])
+            except re.error as e:
+                raise ValueError(f"Неверный шаблон поля: {e}")
         
         self.conn.execute("""
             INSERT INTO Dictionary_Fields (id, dictionary_id, field_name, display_name, 
                                          data_type, is_required, is_primary_key, 
-                                         reference_to, widget_type, display_order)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                         reference_to, widget_type, display_order, on_delete,
+                                         pattern)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             field_id, field_data['dictionary_id'], field_data['field_name'],
             field_data['display_name'], field_data['data_type'],
             int(field_data.get('is_required', False)),
             int(field_data.get('is_primary_key', False)),
             field_data.get('reference_to'), field_data['widget_type'],
-            field_data.get('display_order', 0)
+            field_data.get('display_order', 0), field_data.get('on_delete', 'restrict'),
+            field_data.get('pattern')
         ))
         
         self.conn.commit()
+        self._invalidate_cache()
         
         # Обновляем таблицу данных
         self._sync_data_tables()
@@ -297,7 +1531,91 @@ class DatabaseManager:
         }
         return mapping.get(data_type, 'text')
     
+    def backup(
+        self,
+        dest: Path,
+        pages_per_step: int = 256,
+        progress: Optional[Callable[[int, int, int], None]] = None,
+        compress: bool = False,
+        pause: float = 0.005
+    ) -> Dict[str, Any]:
+        """Онлайн-копия базы через sqlite3 backup API.
+        
+        Копирование идет по pages_per_step страниц с паузой pause секунд между
+        шагами. progress вызывается после каждого шага как
+        progress(status, remaining, total). compress=True сохраняет снимок в
+        gzip. Метод открывает собственное соединение-источник, поэтому его
+        можно вызывать из фонового потока.
+        
+        Источник держит одну транзакцию чтения на все копирование, и копия
+        получается из одного снимка. Для этого файл переводится в режим WAL:
+        в нем запись из других соединений не ждет читателя и не заставляет
+        backup начинать копирование заново. Если перевести файл не удалось
+        (в другом соединении открыта транзакция), копирование идет одним
+        шагом под короткой блокировкой чтения.
+        
+        Файлы справочников (шарды) копируются рядом с dest по тем же
+        относительным путям, что и у рабочей базы; размер каждого - в shards.
+        """
+        started = time.perf_counter()
+        dest = Path(dest)
+        
+        def on_step(status: int, remaining: int, total: int):
+            if progress:
+                progress(status, remaining, total)
+            # sqlite3 сам ждет только при занятой базе, паузу между шагами делаем здесь
+            if remaining and pause:
+                time.sleep(pause)
+        
+        def copy_file(source_path: Path, dest_path: Path) -> int:
+            target_path = dest_path.with_name(dest_path.name + '.part') if compress else dest_path
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            source = sqlite3.connect(source_path, isolation_level=None)
+            target = sqlite3.connect(target_path)
+            try:
+                step = pages_per_step
+                if source.execute("PRAGMA journal_mode = WAL").fetchone()[0] == 'wal':
+                    # Снимок фиксируется первым чтением и держится до конца копии
+                    source.execute("BEGIN")
+                    source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                else:
+                    print(f"⚠️  {source_path}: не удалось включить WAL, копия одним шагом")
+                    step = -1
+                source.backup(target, pages=step, progress=on_step)
+                if source.in_transaction:
+                    source.execute("COMMIT")
+                pages = target.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                target.close()
+                source.close()
+            
+            if compress:
+                with open(target_path, 'rb') as src, gzip.open(dest_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                target_path.unlink()
+            return pages
+        
+        pages = copy_file(self.db_path, dest)
+        shards = {}
+        for storage in self._shard_schemas:
+            shard_dest = dest.parent / (storage + '.gz' if compress else storage)
+            shard_pages = copy_file(shard_path(self, storage), shard_dest)
+            shards[storage] = {
+                'path': str(shard_dest), 'pages': shard_pages, 'size': shard_dest.stat().st_size
+            }
+        
+        return {
+            'path': str(dest),
+            'pages': pages,
+            'size': dest.stat().st_size,
+            'shards': shards,
+            'elapsed': time.perf_counter() - started
+        }
+    
     def close(self):
         """Закрывает соединение с базой данных"""
         if self.conn:
+            if not self.read_only:
+                # Рекомендация SQLite: перед закрытием дать планировщику обновить статистику
+                self.conn.execute("PRAGMA optimize")
             self.conn.close()
@@ -0,0 +1,269 @@
+"""
+Детерминированный генератор синтетических данных.
+
+Заполняет Cities, IndustrialEnterprises и любые справочники, описанные в
+метаданных, заданным числом записей. При одинаковом seed получаются
+одинаковые данные. Значения внешних ключей распределены неравномерно:
+на первые записи главного справочника приходится больше ссылок, как на
+крупные города приходится больше предприятий.
+
+Запуск: python -m lab2.database.generator --db test.db --rows Cities=10000 --rows IndustrialEnterprises=100000
+"""
+
+import argparse
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Iterator, Callable
+
+DEFAULT_SEED = 42
+
+# Чем больше показатель, тем сильнее ссылки сосредоточены на первых записях
+FAN_OUT_SKEW = 3.0
+
+# Доля NULL в необязательных полях
+NULL_RATE = 0.2
+
+# Отметка времени первой сгенерированной записи
+BASE_TIMESTAMP = datetime(2024, 1, 1)
+
+REGIONS = ['Минская', 'Брестская', 'Витебская', 'Гомельская', 'Гродненская', 'Могилевская']
+CITY_PREFIXES = ['', '', '', 'Ново', 'Старо', 'Верхне', 'Нижне']
+CITY_ROOTS = [
+    'Борисов', 'Полоцк', 'Лида', 'Слоним', 'Пинск', 'Орша', 'Жлобин', 'Мозырь',
+    'Светлогорск', 'Речица', 'Кобрин', 'Несвиж', 'Слуцк', 'Молодечно', 'Жодино',
+    'Глубокое', 'Поставы', 'Дятлово', 'Ивье', 'Кричев', 'Быхов', 'Осиповичи',
+]
+INDUSTRIES = [
+    'Машиностроение', 'Химическая промышленность', 'Пищевая промышленность',
+    'Легкая промышленность', 'Деревообработка', 'Металлургия', 'Энергетика',
+    'Нефтепереработка', 'Приборостроение', 'Строительные материалы',
+]
+COMPANY_FORMS = ['ОАО', 'ЗАО', 'ООО', 'УП', 'ЧУП']
+COMPANY_ROOTS = [
+    'Белмаш', 'Агрокомбинат', 'Стройдеталь', 'Промприбор', 'Текстиль',
+    'Энергомаш', 'Химволокно', 'Металлист', 'Лесопродукт', 'Электросеть',
+]
+FIRST_NAMES = ['Александр', 'Ирина', 'Сергей', 'Ольга', 'Андрей', 'Наталья', 'Дмитрий', 'Елена']
+LAST_NAMES = ['Иванов', 'Ковалев', 'Новик', 'Шевчук', 'Козлов', 'Мельник', 'Лукашевич', 'Бондарь']
+STREETS = ['Ленина', 'Советская', 'Победы', 'Гагарина', 'Промышленная', 'Заводская', 'Мира']
+
+
+def _random_date(rng: random.Random, start_year: int, end_year: int) -> str:
+    """Случайная дата в формате ГГГГ-ММ-ДД"""
+    start = date(start_year, 1, 1)
+    span = (date(end_year, 12, 31) - start).days
+    return (start + timedelta(days=rng.randrange(span))).isoformat()
+
+
+def _city_name(rng: random.Random, index: int) -> str:
+    name = rng.choice(CITY_PREFIXES) + rng.choice(CITY_ROOTS).lower()
+    name = name[0].upper() + name[1:]
+    # Дальше словаря имен повторы различаются номером
+    return name if index < len(CITY_ROOTS) else f"{name}-{index}"
+
+
+def _company_name(rng: random.Random, index: int) -> str:
+    return f"{rng.choice(COMPANY_FORMS)} «{rng.choice(COMPANY_ROOTS)}-{index}»"
+
+
+def _person(rng: random.Random, index: int) -> str:
+    return f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}"
+
+
+# Генераторы значений известных полей: (rng, номер записи) -> значение
+FIELD_GENERATORS: Dict[tuple, Callable[[random.Random, int], Any]] = {
+    ('Cities', 'name'): _city_name,
+    ('Cities', 'region'): lambda rng, i: rng.choice(REGIONS),
+    ('Cities', 'population'): lambda rng, i: int(rng.lognormvariate(9.5, 1.3)),
+    ('Cities', 'area'): lambda rng, i: round(rng.lognormvariate(3.0, 0.8), 2),
+    ('Cities', 'foundation_date'): lambda rng, i: _random_date(rng, 900, 1950),
+    ('Cities', 'is_industrial_center'): lambda rng, i: int(rng.random() < 0.3),
+    ('Cities', 'description'): lambda rng, i: f"Населенный пункт №{i}",
+    ('IndustrialEnterprises', 'name'): _company_name,
+    ('IndustrialEnterprises', 'industry_type'): lambda rng, i: rng.choice(INDUSTRIES),
+    ('IndustrialEnterprises', 'employee_count'): lambda rng, i: int(rng.lognormvariate(5.0, 1.2)) + 1,
+    ('IndustrialEnterprises', 'annual_revenue'): lambda rng, i: round(rng.lognormvariate(15.0, 1.5), 2),
+    ('IndustrialEnterprises', 'foundation_year'): lambda rng, i: rng.randint(1900, 2023),
+    ('IndustrialEnterprises', 'is_state_owned'): lambda rng, i: int(rng.random() < 0.4),
+    ('IndustrialEnterprises', 'contact_person'): _person,
+    ('IndustrialEnterprises', 'email'): lambda rng, i: f"info{i}@example.by",
+    ('IndustrialEnterprises', 'phone'): lambda rng, i: f"+375 {rng.choice((17, 29, 33, 44))} {rng.randint(1000000, 9999999)}",
+    ('IndustrialEnterprises', 'address'): lambda rng, i: f"ул. {rng.choice(STREETS)}, {rng.randint(1, 200)}",
+}
+
+# Генераторы по типу данных для полей, описанных только в метаданных
+TYPE_GENERATORS: Dict[str, Callable[[random.Random, int], Any]] = {
+    'TEXT': lambda rng, i: f"Значение {i}",
+    'INTEGER': lambda rng, i: rng.randint(0, 1000000),
+    'REAL': lambda rng, i: round(rng.uniform(0, 1000000), 2),
+    'DATE': lambda rng, i: _random_date(rng, 1950, 2024),
+    'BOOLEAN': lambda rng, i: int(rng.random() < 0.5),
+}
+
+
+def _record_id(rng: random.Random) -> str:
+    """UUID4 из генератора случайных чисел, а не из системной энтропии"""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _parent_ids(db_manager, table_name: str) -> List[str]:
+    """Идентификаторы записей главного справочника в порядке добавления"""
+    return [
+        row[0] for row in db_manager.conn.execute(
+            f"SELECT id FROM {table_name} WHERE is_deleted = 0 ORDER BY rowid"
+        ).fetchall()
+    ]
+
+
+def iter_rows(
+    db_manager,
+    table_name: str,
+    count: int,
+    seed: int = DEFAULT_SEED,
+    start: int = 0
+) -> Iterator[Dict[str, Any]]:
+    """Порождает count записей справочника в виде {поле: значение}.
+
+    start - номер первой записи; с одним seed и start последовательность
+    всегда одна и та же. Главные справочники должны быть уже заполнены.
+    """
+    fields = db_manager.get_table_fields(table_name)
+    rng = random.Random(f"{seed}:{table_name}:{start}")
+
+    parents = {
+        f['field_name']: _parent_ids(db_manager, f['reference_to'])
+        for f in fields if f['data_type'] == 'FOREIGN_KEY' and f['reference_to']
+    }
+    for field_name, ids in parents.items():
+        if not ids:
+            raise ValueError(f"Для поля {table_name}.{field_name} нет записей в главном справочнике")
+
+    generators = []
+    for field in fields:
+        name = field['field_name']
+        if name == 'id':
+            generators.append((name, False, lambda rng, i: _record_id(rng)))
+        elif name in parents:
+            ids = parents[name]
+            generators.append((name, False, lambda rng, i, ids=ids:
+                               ids[int(len(ids) * rng.random() ** FAN_OUT_SKEW)]))
+        else:
+            generator = FIELD_GENERATORS.get(
+                (table_name, name), TYPE_GENERATORS.get(field['data_type'], TYPE_GENERATORS['TEXT'])
+            )
+            generators.append((name, not field['is_required'], generator))
+
+    for index in range(start, start + count):
+        row = {}
+        for name, nullable, generator in generators:
+            row[name] = None if nullable and rng.random() < NULL_RATE else generator(rng, index)
+        yield row
+
+
+def generation_order(db_manager, tables: List[str]) -> List[str]:
+    """Сортирует справочники так, чтобы главные заполнялись раньше зависимых"""
+    order: List[str] = []
+    visited = set()
+
+    def visit(table_name: str):
+        if table_name in visited:
+            return
+        visited.add(table_name)
+        for field in db_manager.get_table_fields(table_name):
+            if field['data_type'] == 'FOREIGN_KEY' and field['reference_to'] in tables:
+                visit(field['reference_to'])
+        order.append(table_name)
+
+    for table_name in tables:
+        visit(table_name)
+    return order
+
+
+def generate_data(
+    db_manager,
+    sizes: Dict[str, int],
+    seed: int = DEFAULT_SEED,
+    batch_size: int = 10000
+) -> Dict[str, Any]:
+    """Добавляет в справочники sizes[таблица] сгенерированных записей.
+
+    Записи вставляются пачками через executemany, по транзакции на пачку.
+    Возвращает число добавленных записей по таблицам и затраченное время.
+    """
+    started = time.perf_counter()
+    conn = db_manager.conn
+    report: Dict[str, Any] = {'rows': {}}
+
+    for table_name in generation_order(db_manager, list(sizes)):
+        count = sizes[table_name]
+        start = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        rows = iter_rows(db_manager, table_name, count, seed, start)
+
+        columns = [f['field_name'] for f in db_manager.get_table_fields(table_name)]
+        sql = f"""
+            INSERT INTO {table_name} ({', '.join(columns)}, created_at, updated_at, is_deleted)
+            VALUES ({', '.join('?' for _ in columns)}, ?, ?, 0)
+        """
+
+        inserted = 0
+        while inserted < count:
+            batch = []
+            for row in rows:
+                # Время создания растет с номером записи, как при ручном вводе
+                stamp = (BASE_TIMESTAMP + timedelta(seconds=start + inserted + len(batch))).isoformat()
+                batch.append([row[column] for column in columns] + [stamp, stamp])
+                if len(batch) >= batch_size:
+                    break
+            if not batch:
+                break
+            try:
+                conn.executemany(sql, batch)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            inserted += len(batch)
+
+        report['rows'][table_name] = inserted
+        print(f"✅ {table_name}: добавлено {inserted} записей")
+
+    db_manager._invalidate_cache()
+    # После массовой загрузки планировщику и интерфейсу нужна свежая статистика
+    db_manager.run_maintenance(tables=list(report['rows']))
+    report['elapsed'] = time.perf_counter() - started
+    return report
+
+
+def parse_sizes(values: List[str]) -> Dict[str, int]:
+    """Разбирает аргументы вида Таблица=число"""
+    sizes = {}
+    for value in values:
+        table_name, _, count = value.partition('=')
+        sizes[table_name] = int(count)
+    return sizes
+
+
+def main():
+    """Заполнение базы синтетическими данными из командной строки"""
+    from lab2.database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Генерация синтетических данных справочников")
+    parser.add_argument('--db', type=Path, required=True, help="Путь к базе (рабочую лучше не трогать)")
+    parser.add_argument('--rows', action='append', default=[], metavar='ТАБЛИЦА=ЧИСЛО')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        report = generate_data(db_manager, parse_sizes(args.rows), args.seed, args.batch_size)
+    finally:
+        db_manager.close()
+    print(f"✅ Генерация за {report['elapsed']:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
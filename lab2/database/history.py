@@ -0,0 +1,281 @@
+"""
+История изменений записей справочников (темпоральные таблицы).
+
+Для каждого справочника ведется таблица <справочник>_History: каждая
+версия записи со сроком действия [valid_from, valid_to). Триггеры на
+таблице справочника при вставке добавляют версию, при изменении
+закрывают текущую (valid_to = время изменения) и добавляют новую, при
+физическом удалении (сжатие) закрывают текущую. У действующей версии
+valid_to = OPEN_END, а не NULL, чтобы условие по сроку было диапазоном
+индекса, а не OR.
+
+История ведется для справочников с Dictionary.keep_history = 1 (по
+умолчанию). У справочника, для которого она отключена, триггеров нет и
+запись не дорожает; накопленные версии сохраняются, но as_of() для него
+недоступен, пока история снова не включена.
+
+Состояние на момент времени - один запрос по индексу, без проигрывания
+журнала изменений:
+
+    db.as_of('IndustrialEnterprises', '2025-03-01')            # весь справочник
+    db.as_of('IndustrialEnterprises', '2025-03-01', record_id)  # одна запись
+    db.get_record_history('IndustrialEnterprises', record_id)   # все версии
+    db.set_history_enabled('Cities', False)                     # без истории
+
+    python -m lab2.database.history --table IndustrialEnterprises --as-of 2025-03-01
+"""
+
+import argparse
+import sqlite3
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Union
+
+HISTORY_SUFFIX = '_History'
+TRIGGER_PREFIX = 'hist'
+
+# Конец срока действующей версии записи
+OPEN_END = '9999-12-31T23:59:59.999'
+
+# Время изменения в формате datetime.isoformat() (как updated_at), с миллисекундами
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+
+def history_table(table_name: str) -> str:
+    """Имя таблицы истории справочника"""
+    return f"{table_name}{HISTORY_SUFFIX}"
+
+
+def install_history(db_manager, replace: bool = False):
+    """Создает таблицы истории, их индексы и триггеры на таблицах справочников.
+
+    Новая таблица истории заполняется текущими записями (срок действия - с
+    updated_at). replace=True пересоздает триггеры, например после
+    миграции, когда у таблиц изменился набор колонок.
+    """
+    conn = db_manager.conn
+    disabled = _disabled_tables(db_manager)
+    for dict_info in db_manager.get_dictionaries():
+        table_name = dict_info['name']
+        if not db_manager._table_exists(table_name):
+            continue
+
+        names = _trigger_names(table_name)
+        if table_name in disabled:
+            for name in names.values():
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            continue
+
+        columns = db_manager._table_columns(table_name)
+        created = _ensure_history_table(db_manager, table_name, columns)
+        installed = all(db_manager._trigger_exists(name) for name in names.values())
+        if installed and not created and not replace:
+            continue
+
+        history = history_table(table_name)
+        column_list = ', '.join(columns)
+        insert_new = f"""
+            INSERT INTO {history} ({column_list}, valid_from)
+            VALUES ({', '.join(f'NEW.{column}' for column in columns)}, {NOW_SQL});
+        """
+        close_old = f"""
+            UPDATE {history} SET valid_to = {NOW_SQL}
+            WHERE id = OLD.id AND valid_to = '{OPEN_END}';
+        """
+        bodies = {
+            'insert': ('AFTER INSERT', insert_new),
+            'update': ('AFTER UPDATE', close_old + insert_new),
+            'delete': ('AFTER DELETE', close_old),
+        }
+        for op, (event, body) in bodies.items():
+            db_manager._create_trigger(names[op], event, table_name, body)
+
+    conn.commit()
+
+
+def set_history_enabled(db_manager, table_name: str, enabled: bool):
+    """Включает или отключает историю справочника.
+
+    При включении действующие версии сверяются с таблицей по updated_at:
+    версии записей, измененных или удаленных без истории, закрываются, и
+    для них и новых записей добавляются версии с текущего момента.
+    """
+    dictionary = db_manager.get_dictionary_by_name(table_name)
+    if not dictionary:
+        raise ValueError(f"Справочник '{table_name}' не найден")
+
+    conn = db_manager.conn
+    conn.execute(
+        "UPDATE Dictionary SET keep_history = ? WHERE id = ?", (int(enabled), dictionary['id'])
+    )
+    history = history_table(table_name)
+    if enabled and db_manager._table_exists(table_name) and db_manager._table_exists(history):
+        columns = db_manager._table_columns(table_name)
+        _ensure_history_table(db_manager, table_name, columns)
+        column_list = ', '.join(columns)
+        # Одно время для закрытых и новых версий: сроки идут без разрыва
+        now = datetime.now().isoformat(timespec='milliseconds')
+        conn.execute(f"""
+            UPDATE {history} SET valid_to = ?
+            WHERE valid_to = '{OPEN_END}' AND NOT EXISTS (
+                SELECT 1 FROM {table_name} t
+                WHERE t.id = {history}.id AND t.updated_at IS {history}.updated_at
+            )
+        """, (now,))
+        conn.execute(f"""
+            INSERT INTO {history} ({column_list}, valid_from)
+            SELECT {column_list}, ? FROM {table_name} t
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {history} h WHERE h.id = t.id AND h.valid_to = '{OPEN_END}'
+            )
+        """, (now,))
+    conn.commit()
+    install_history(db_manager)
+
+
+def history_enabled(db_manager, table_name: str) -> bool:
+    """Ведется ли история справочника"""
+    return table_name not in _disabled_tables(db_manager)
+
+
+def _disabled_tables(db_manager) -> Set[str]:
+    """Справочники, для которых история отключена"""
+    try:
+        rows = db_manager.conn.execute("SELECT name FROM Dictionary WHERE keep_history = 0").fetchall()
+    except sqlite3.OperationalError:
+        # Схема старше Dictionary.keep_history: история ведется для всех
+        return set()
+    return {row[0] for row in rows}
+
+
+def _trigger_names(table_name: str) -> Dict[str, str]:
+    return {op: f"{TRIGGER_PREFIX}_{table_name}_{op}" for op in ('insert', 'update', 'delete')}
+
+
+def _ensure_history_table(db_manager, table_name: str, columns: List[str]) -> bool:
+    """Создает таблицу истории или добавляет в нее новые колонки справочника.
+
+    Возвращает True, если таблица создана (и заполнена текущими записями).
+    """
+    conn = db_manager.conn
+    history = history_table(table_name)
+    types = {
+        row['name']: row['type']
+        for row in conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+    }
+
+    if db_manager._table_exists(history):
+        existing = set(db_manager._table_columns(history))
+        for column in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {history} ADD COLUMN {column} {types[column]}")
+        return False
+
+    definitions = ', '.join(f"{column} {types[column]}" for column in columns)
+    conn.execute(f"""
+        CREATE TABLE {history} (
+            version INTEGER PRIMARY KEY,
+            {definitions},
+            valid_from TEXT NOT NULL,
+            valid_to TEXT NOT NULL DEFAULT '{OPEN_END}'
+        )
+    """)
+    # Версии одной записи - для истории и состояния записи на момент времени;
+    # срок действия - для состояния всего справочника
+    conn.execute(f"CREATE INDEX idx_{history}_id ON {history} (id, valid_from)")
+    conn.execute(f"CREATE INDEX idx_{history}_period ON {history} (valid_from, valid_to)")
+
+    # Начальные версии: CURRENT_TIMESTAMP пишет дату через пробел, приводим к ISO
+    column_list = ', '.join(columns)
+    conn.execute(f"""
+        INSERT INTO {history} ({column_list}, valid_from)
+        SELECT {column_list}, replace(COALESCE(updated_at, created_at, {NOW_SQL}), ' ', 'T')
+        FROM {table_name}
+    """)
+    return True
+
+
+def to_timestamp(moment: Union[str, date, datetime]) -> str:
+    """Момент времени в формате valid_from/valid_to.
+
+    Дата без времени означает состояние на конец этого дня.
+    """
+    if isinstance(moment, str):
+        moment = date.fromisoformat(moment) if len(moment) == 10 else datetime.fromisoformat(moment)
+    if not isinstance(moment, datetime):
+        moment = datetime.combine(moment, time.max)
+    if moment.tzinfo is not None:
+        # Триггеры пишут местное время
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat(timespec='milliseconds')
+
+
+def as_of(
+    db_manager,
+    table_name: str,
+    moment: Union[str, date, datetime],
+    record_id: Optional[str] = None,
+    include_deleted: bool = False
+) -> List[Dict[str, Any]]:
+    """Записи справочника (или одна запись) в том виде, какими они были в moment"""
+    history = _require_history(db_manager, table_name)
+    timestamp = to_timestamp(moment)
+    conditions = ["valid_from <= ?", "valid_to > ?"]
+    params: List[Any] = [timestamp, timestamp]
+    if record_id is not None:
+        conditions.insert(0, "id = ?")
+        params.insert(0, record_id)
+    if not include_deleted:
+        conditions.append("is_deleted = 0")
+
+    columns = db_manager._table_columns(table_name)
+    # Без ORDER BY: иначе SQLite обходит индекс по id вместо диапазона сроков
+    cursor = db_manager.conn.execute(f"""
+        SELECT {', '.join(columns)}, valid_from, valid_to FROM {history}
+        WHERE {' AND '.join(conditions)}
+    """, params)
+    return sorted((dict(row) for row in cursor.fetchall()), key=lambda record: record['id'])
+
+
+def record_history(db_manager, table_name: str, record_id: str) -> List[Dict[str, Any]]:
+    """Все версии записи от первой к последней"""
+    history = _require_history(db_manager, table_name)
+    columns = db_manager._table_columns(table_name)
+    cursor = db_manager.conn.execute(f"""
+        SELECT version, {', '.join(columns)}, valid_from, valid_to FROM {history}
+        WHERE id = ? ORDER BY valid_from, version
+    """, (record_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def _require_history(db_manager, table_name: str) -> str:
+    history = history_table(table_name)
+    if not db_manager._table_exists(history):
+        raise ValueError(f"Для справочника '{table_name}' нет истории изменений")
+    if not history_enabled(db_manager, table_name):
+        # Версии после отключения не записывались: ответ был бы неверным
+        raise ValueError(f"История изменений справочника '{table_name}' отключена")
+    return history
+
+
+def main():
+    """Состояние справочника на дату из командной строки"""
+    from lab2.database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Записи справочника на момент времени")
+    parser.add_argument('--db', type=Path, default=Path(__file__).parent.parent / 'data' / 'business.db')
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--as-of', required=True, help="Дата ГГГГ-ММ-ДД (конец дня) или ISO время")
+    parser.add_argument('--id', help="Только одна запись")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db, read_only=True)
+    try:
+        for record in db_manager.as_of(args.table, args.as_of, args.id):
+            print(f"   {record['id']}: {record.get('name', '')} (с {record['valid_from']})")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Инструментирование запросов DatabaseManager.
+
+QueryProfiler собирает по каждому методу DatabaseManager и по каждой форме
+SQL (запрос с замененными литералами) количество вызовов, суммарное время,
+p50/p99 и число возвращенных строк; у методов - еще число вызовов,
+завершившихся исключением. Запросы дольше порога попадают в журнал
+медленных запросов вместе с EXPLAIN QUERY PLAN.
+
+Строки запроса учитываются при выборке fetchone/fetchmany/fetchall и при
+обходе курсора в for. Обход накапливается в курсоре и добавляется к
+статистике каждые ITER_FLUSH_ROWS строк, в конце обхода, при повторном
+execute и при close(); строки курсора, брошенного посреди обхода без
+close(), могут не попасть в отчет. Методы-генераторы замеряются по всему
+обходу: учитывается время внутри генератора (без времени потребителя) и
+число выданных строк.
+
+Включается передачей профилировщика в DatabaseManager:
+    db = DatabaseManager(path, profiler=QueryProfiler(slow_threshold_ms=50))
+или переменной окружения LAB2_SQL_PROFILE=путь/к/отчету.json для lab2.main.
+"""
+
+import functools
+import inspect
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Сколько последних замеров хранить для расчета перцентилей
+MAX_SAMPLES = 10000
+
+# Через сколько строк обхода курсора накопленное время добавляется к статистике
+ITER_FLUSH_ROWS = 1000
+
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Запросы, для которых имеет смысл EXPLAIN QUERY PLAN
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def normalize_sql(sql: str) -> str:
+    """Приводит запрос к форме: литералы и списки параметров заменены на ?"""
+    shape = _LINE_COMMENT.sub('', sql)
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('?, ...', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    """Перцентиль по отсортированному списку замеров"""
+    if not samples:
+        return 0.0
+    index = min(int(len(samples) * fraction), len(samples) - 1)
+    return samples[index]
+
+
+class _Stats:
+    """Накопленная статистика одного метода или формы запроса"""
+
+    __slots__ = ('count', 'total', 'rows', 'errors', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.samples: deque = deque(maxlen=MAX_SAMPLES)
+
+    def snapshot(self) -> Dict[str, Any]:
+        durations = sorted(sample[0] for sample in self.samples)
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'p50_ms': round(_percentile(durations, 0.50) * 1000, 3),
+            'p99_ms': round(_percentile(durations, 0.99) * 1000, 3),
+            'rows': self.rows,
+            'errors': self.errors,
+        }
+
+
+class QueryProfiler:
+    """Сборщик статистики запросов и вызовов методов"""
+
+    def __init__(self, slow_threshold_ms: float = 100.0, export_path: Optional[Path] = None):
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.export_path = export_path
+        self.methods: Dict[str, _Stats] = {}
+        self.queries: Dict[str, _Stats] = {}
+        self.slow_queries: deque = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    def connect(self, db_path, **kwargs) -> sqlite3.Connection:
+        """Открывает соединение, запросы которого учитываются профилировщиком"""
+        conn = sqlite3.connect(db_path, factory=InstrumentedConnection, **kwargs)
+        conn.profiler = self
+        return conn
+
+    def instrument_methods(self, db_manager):
+        """Оборачивает публичные методы DatabaseManager замером времени"""
+        for name in dir(type(db_manager)):
+            if name.startswith('_'):
+                continue
+            method = getattr(db_manager, name)
+            if callable(method):
+                setattr(db_manager, name, self._wrap_method(name, method))
+
+    def _wrap_method(self, name: str, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result, failed = None, True
+            try:
+                result = method(*args, **kwargs)
+                failed = False
+            finally:
+                elapsed = time.perf_counter() - started
+                # Вызов, завершившийся исключением, тоже учитывается - с отметкой
+                if failed or not inspect.isgenerator(result):
+                    rows = len(result) if isinstance(result, list) else 0
+                    self._record(self.methods, name, elapsed, rows, failed)
+            if inspect.isgenerator(result):
+                # Генератор работает при обходе - замер продолжается там
+                return self._timed_generator(name, result, elapsed)
+            return result
+        return wrapper
+
+    def _timed_generator(self, name: str, generator, elapsed: float):
+        """Обходит генератор метода, замеряя время его шагов и число строк"""
+        rows, failed = 0, True
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                # Страница строк (iter_display_rows) считается по строкам
+                rows += len(item) if isinstance(item, list) else 1
+                yield item
+            failed = False
+        except GeneratorExit:
+            # Потребитель прекратил обход - это не ошибка метода
+            failed = False
+            raise
+        finally:
+            generator.close()
+            self._record(self.methods, name, elapsed, rows, failed)
+
+    def _record(
+        self,
+        table: Dict[str, _Stats],
+        key: str,
+        elapsed: float,
+        rows: int,
+        failed: bool = False
+    ) -> list:
+        """Добавляет замер и возвращает изменяемую запись [длительность]"""
+        sample = [elapsed]
+        with self._lock:
+            stats = table.get(key)
+            if stats is None:
+                stats = table[key] = _Stats()
+            stats.count += 1
+            stats.total += elapsed
+            stats.rows += rows
+            stats.errors += failed
+            stats.samples.append(sample)
+        return sample
+
+    def _add_fetch(self, shape: str, sample: list, elapsed: float, rows: int):
+        """Добавляет к выполненному запросу время и строки выборки"""
+        with self._lock:
+            stats = self.queries[shape]
+            stats.total += elapsed
+            stats.rows += rows
+            sample[0] += elapsed
+
+    def _check_slow(self, conn: sqlite3.Connection, sql: str, params, sample: list, state: dict):
+        """Заносит запрос в журнал медленных один раз, когда он превысил порог"""
+        if state.get('logged') or sample[0] < self.slow_threshold:
+            return
+        state['logged'] = True
+
+        plan: List[str] = []
+        if sql.lstrip().upper().startswith(_EXPLAINABLE):
+            try:
+                # Базовый execute, чтобы сам EXPLAIN не попадал в статистику
+                cursor = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params or ())
+                plan = [row[-1] for row in cursor.fetchall()]
+            except sqlite3.Error:
+                pass
+
+        entry = {
+            'sql': normalize_sql(sql),
+            'elapsed_ms': round(sample[0] * 1000, 3),
+            'plan': plan,
+            'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+        print(f"🐢 Медленный запрос {entry['elapsed_ms']} мс: {entry['sql']}")
+        for line in plan:
+            print(f"     {line}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущая статистика: методы, формы запросов и медленные запросы"""
+        with self._lock:
+            return {
+                'methods': {name: stats.snapshot() for name, stats in self.methods.items()},
+                'queries': {shape: stats.snapshot() for shape, stats in self.queries.items()},
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def export(self, path: Optional[Path] = None) -> Path:
+        """Сохраняет снимок статистики в JSON-файл"""
+        path = Path(path or self.export_path or 'sql_profile.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def reset(self):
+        """Очищает накопленную статистику"""
+        with self._lock:
+            self.methods.clear()
+            self.queries.clear()
+            self.slow_queries.clear()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий выполнение и выборку строк"""
+
+    _shape = None
+    _iter_time = 0.0
+    _iter_rows = 0
+
+    def execute(self, sql, parameters=()):
+        profiler = self.connection.profiler
+        self._flush_iteration()
+        started = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self._shape = normalize_sql(sql)
+        self._sql, self._params, self._slow_state = sql, parameters, {}
+        self._sample = profiler._record(profiler.queries, self._shape, time.perf_counter() - started, 0)
+        profiler._check_slow(self.connection, sql, parameters, self._sample, self._slow_state)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        profiler = self.connection.profiler
+        self._flush_iteration()
+        started = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        self._shape = None
+        profiler._record(
+            profiler.queries, normalize_sql(sql), time.perf_counter() - started, max(self.rowcount, 0)
+        )
+        return result
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        rows = fetch(*args)
+        if getattr(self, '_shape', None):
+            profiler = self.connection.profiler
+            count = len(rows) if isinstance(rows, list) else int(rows is not None)
+            profiler._add_fetch(self._shape, self._sample, time.perf_counter() - started, count)
+            profiler._check_slow(self.connection, self._sql, self._params, self._sample, self._slow_state)
+        return rows
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._iter_time += time.perf_counter() - started
+            self._flush_iteration()
+            raise
+        # Замер на строку без блокировки профилировщика: копится в курсоре
+        self._iter_time += time.perf_counter() - started
+        self._iter_rows += 1
+        if self._iter_rows >= ITER_FLUSH_ROWS:
+            self._flush_iteration()
+        return row
+
+    def close(self):
+        self._flush_iteration()
+        super().close()
+
+    def _flush_iteration(self):
+        """Добавляет к запросу накопленные время и строки обхода курсора"""
+        if not (self._iter_rows or self._iter_time):
+            return
+        if self._shape:
+            profiler = self.connection.profiler
+            profiler._add_fetch(self._shape, self._sample, self._iter_time, self._iter_rows)
+            profiler._check_slow(self.connection, self._sql, self._params, self._sample, self._slow_state)
+        self._iter_time, self._iter_rows = 0.0, 0
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, все запросы которого идут через InstrumentedCursor"""
+
+    profiler: QueryProfiler
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        # Фиксация (fsync) - заметная часть времени каждой записи
+        started = time.perf_counter()
+        super().commit()
+        self.profiler._record(self.profiler.queries, 'COMMIT', time.perf_counter() - started, 0)
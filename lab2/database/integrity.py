@@ -0,0 +1,163 @@
+"""
+Ссылочная целостность при мягком удалении.
+
+ON DELETE RESTRICT в схеме защищает только от физического удаления, а
+записи удаляются пометкой is_deleted. Здесь по метаданным reference_to
+проверяется, ссылаются ли на удаляемые записи живые записи других
+справочников. Поведение задается для каждого внешнего ключа колонкой
+Dictionary_Fields.on_delete:
+  'restrict' - удаление запрещено, пока есть ссылки (по умолчанию);
+  'cascade'  - ссылающиеся записи удаляются вместе с главной.
+Ссылающиеся колонки индексируются, поэтому проверка - индексный поиск,
+а не просмотр таблицы; для пачки id выполняется один запрос на каждую
+ссылающуюся таблицу.
+
+Ссылки между справочниками в разных файлах (шардах) FOREIGN KEY не
+защищает; при добавлении и изменении записей их проверяет
+check_cross_file_references().
+"""
+
+import sqlite3
+from typing import Dict, Any, List, Set
+
+ON_DELETE_POLICIES = ('restrict', 'cascade')
+
+# Сколько id подставляется в один IN (лимит переменных SQLite - 999)
+IN_BATCH_SIZE = 500
+
+# Сколько id блокирующих записей показывать в сообщении
+BLOCKER_SAMPLE = 5
+
+
+class DeleteBlockedError(ValueError):
+    """Удаление запрещено: на записи ссылаются живые записи других справочников"""
+
+    def __init__(self, blockers: List[Dict[str, Any]]):
+        self.blockers = blockers
+        details = '; '.join(
+            f"{b['table']}.{b['column']}: {b['count']} зап." for b in blockers
+        )
+        super().__init__(f"На удаляемые записи есть ссылки ({details})")
+
+
+def collect_references(db_manager) -> Dict[str, List[tuple]]:
+    """Возвращает {главная таблица: [(зависимая таблица, колонка, политика), ...]}"""
+    references: Dict[str, List[tuple]] = {}
+    for dict_info in db_manager.get_dictionaries():
+        if not db_manager._table_exists(dict_info['name']):
+            continue
+        for field in db_manager.get_dictionary_fields(dict_info['id']):
+            if field['data_type'] == 'FOREIGN_KEY' and field['reference_to']:
+                references.setdefault(field['reference_to'], []).append(
+                    (dict_info['name'], field['field_name'], field.get('on_delete') or 'restrict')
+                )
+    return references
+
+
+def check_cross_file_references(db_manager, table_name: str, data: Dict[str, Any]):
+    """Проверяет ссылки записи на справочники из других файлов.
+
+    Выбрасывает то же sqlite3.IntegrityError, что и FOREIGN KEY внутри
+    одного файла; как и FOREIGN KEY, принимает ссылку на помеченную
+    удаленной запись.
+    """
+    if not db_manager._table_schemas:
+        return
+    schema = db_manager._schema_of(table_name)
+    for field in db_manager.get_table_fields(table_name):
+        ref_table = field.get('reference_to')
+        value = data.get(field['field_name'])
+        if field['data_type'] != 'FOREIGN_KEY' or not ref_table or value is None:
+            continue
+        if db_manager._schema_of(ref_table) == schema:
+            continue
+        found = db_manager.conn.execute(f"SELECT 1 FROM {ref_table} WHERE id = ?", (value,)).fetchone()
+        if found is None:
+            raise sqlite3.IntegrityError(
+                f"FOREIGN KEY constraint failed: {table_name}.{field['field_name']} - "
+                f"нет записи {value} в {ref_table}"
+            )
+
+
+def ensure_reference_indexes(db_manager):
+    """Создает индексы для работы со ссылками.
+
+    (колонка, is_deleted) по всем внешним ключам - для проверки ссылок, и
+    (name, is_deleted) у справочников, на которые ссылаются, - для поиска
+    значения по началу названия при выборе в форме.
+    """
+    conn = db_manager.conn
+    for parent, children in collect_references(db_manager).items():
+        for child, column, _ in children:
+            index_name = db_manager._qualified(f"idx_{child}_{column}", child)
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {child} ({column}, is_deleted)"
+            )
+        if db_manager._table_exists(parent) and 'name' in db_manager._table_columns(parent):
+            index_name = db_manager._qualified(f"idx_{parent}_name", parent)
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {parent} (name, is_deleted)"
+            )
+    conn.commit()
+
+
+def _referencing_ids(conn, child: str, column: str, ids: List[str]) -> List[str]:
+    """Живые записи child, ссылающиеся на ids; один запрос на пачку IN"""
+    found: List[str] = []
+    for start in range(0, len(ids), IN_BATCH_SIZE):
+        batch = ids[start:start + IN_BATCH_SIZE]
+        found.extend(
+            row[0] for row in conn.execute(f"""
+                SELECT id FROM {child}
+                WHERE {column} IN ({', '.join('?' for _ in batch)}) AND is_deleted = 0
+            """, batch).fetchall()
+        )
+    return found
+
+
+def plan_soft_delete(db_manager, table_name: str, ids: List[str]) -> Dict[str, List[str]]:
+    """Возвращает {таблица: [id, ...]} всех записей, удаляемых вместе с ids.
+
+    Сначала по связям 'cascade' собирается полный набор удаляемых записей,
+    затем по связям 'restrict' ищутся ссылки на него извне. Ссылки из
+    записей, которые сами удаляются, удалению не мешают. При найденных
+    ссылках выбрасывается DeleteBlockedError.
+    """
+    conn = db_manager.conn
+    references = collect_references(db_manager)
+
+    scheduled: Dict[str, Set[str]] = {table_name: set(ids)}
+    order: List[str] = [table_name]
+    queue = [(table_name, list(ids))]
+    while queue:
+        parent, parent_ids = queue.pop(0)
+        for child, column, policy in references.get(parent, []):
+            if policy != 'cascade':
+                continue
+            found = set(_referencing_ids(conn, child, column, parent_ids))
+            new_ids = found - scheduled.setdefault(child, set())
+            if new_ids:
+                if child not in order:
+                    order.append(child)
+                scheduled[child] |= new_ids
+                queue.append((child, list(new_ids)))
+
+    blockers = []
+    for parent in order:
+        for child, column, policy in references.get(parent, []):
+            if policy == 'cascade':
+                continue
+            found = [
+                record_id
+                for record_id in _referencing_ids(conn, child, column, list(scheduled[parent]))
+                if record_id not in scheduled.get(child, ())
+            ]
+            if found:
+                blockers.append({
+                    'table': child, 'column': column, 'count': len(found),
+                    'sample': found[:BLOCKER_SAMPLE],
+                })
+    if blockers:
+        raise DeleteBlockedError(blockers)
+
+    return {table: list(scheduled[table]) for table in order if scheduled[table]}
@@ -0,0 +1,249 @@
+import re
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+# Служебные колонки таблиц данных, которых нет в Dictionary_Fields
+SERVICE_COLUMNS = ('created_at', 'updated_at', 'is_deleted')
+
+
+def plan_migrations(db_manager) -> List[Dict[str, Any]]:
+    """Сравнивает Dictionary_Fields с PRAGMA table_info и возвращает план.
+
+    Каждый шаг плана - словарь с ключами table, operation и fields:
+    'create' - таблицы нет, 'add_columns' - недостающие колонки
+    добавляются через ALTER TABLE ADD COLUMN, 'rebuild' - у существующих
+    колонок изменился тип или первичный ключ, нужна пересборка таблицы.
+    Колонки, удаленные из метаданных, не трогаются, чтобы не терять данные.
+    """
+    plan = []
+
+    for dict_info in db_manager.get_dictionaries():
+        table_name = dict_info['name']
+        fields = db_manager.get_dictionary_fields(dict_info['id'])
+
+        if not db_manager._table_exists(table_name):
+            plan.append({'table': table_name, 'operation': 'create', 'fields': fields})
+            continue
+
+        columns = {
+            row['name']: row
+            for row in db_manager.conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+        }
+
+        missing = [f for f in fields if f['field_name'] not in columns]
+        changed = [
+            f for f in fields
+            if f['field_name'] in columns and _column_differs(db_manager, columns[f['field_name']], f)
+        ]
+
+        # Первичный ключ нельзя добавить через ALTER TABLE ADD COLUMN
+        changed += [f for f in missing if f['is_primary_key']]
+
+        if changed:
+            plan.append({
+                'table': table_name,
+                'operation': 'rebuild',
+                'fields': fields,
+                'changed': [f['field_name'] for f in changed]
+            })
+        elif missing:
+            plan.append({'table': table_name, 'operation': 'add_columns', 'fields': missing})
+
+    return plan
+
+
+def apply_migrations(db_manager, batch_size: int = 10000) -> List[Dict[str, Any]]:
+    """Применяет план миграций в одной транзакции и записывает его в Schema_Migrations"""
+    plan = plan_migrations(db_manager)
+    if not plan:
+        return plan
+
+    conn = db_manager.conn
+    conn.commit()
+
+    # Внешние ключи отключаются до начала транзакции, иначе пересборка
+    # таблицы, на которую ссылаются другие, невозможна
+    needs_rebuild = any(step['operation'] == 'rebuild' for step in plan)
+    if needs_rebuild:
+        conn.execute("PRAGMA foreign_keys = OFF")
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute(
+            "SELECT COALESCE(MAX(version), 0) + 1 FROM Schema_Migrations"
+        ).fetchone()[0]
+
+        for step in plan:
+            if step['operation'] == 'create':
+                conn.execute(db_manager._data_table_sql(step['table'], step['fields']))
+            elif step['operation'] == 'add_columns':
+                for field in step['fields']:
+                    column_sql = _column_sql(db_manager, step['table'], field)
+                    conn.execute(f"ALTER TABLE {step['table']} ADD COLUMN {column_sql}")
+            else:
+                rebuild_table(db_manager, step['table'], step['fields'], batch_size)
+
+            conn.execute("""
+                INSERT INTO Schema_Migrations (version, table_name, operation, details)
+                VALUES (?, ?, ?, ?)
+            """, (
+                version, step['table'], step['operation'],
+                ', '.join(step.get('changed') or [f['field_name'] for f in step['fields']])
+            ))
+
+        if needs_rebuild:
+            violations = [
+                row for schema in db_manager._data_schemas()
+                for row in conn.execute(f"PRAGMA {schema}.foreign_key_check").fetchall()
+            ]
+            if violations:
+                raise sqlite3.IntegrityError(
+                    f"Нарушение внешних ключей после миграции: {len(violations)} записей"
+                )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if needs_rebuild:
+            conn.execute("PRAGMA foreign_keys = ON")
+
+    for step in plan:
+        print(f"✅ Миграция {step['table']}: {step['operation']}")
+
+    return plan
+
+
+def _column_sql(db_manager, table_name: str, field: Dict[str, Any]) -> str:
+    """Описание колонки для ALTER TABLE ADD COLUMN"""
+    sql = f"{field['field_name']} {db_manager._map_data_type(field['data_type'])}"
+    reference_to = field['reference_to'] if field['data_type'] == 'FOREIGN_KEY' else None
+    # FOREIGN KEY возможен только между таблицами одного файла
+    if reference_to and db_manager._schema_of(reference_to) == db_manager._schema_of(table_name):
+        sql += f" REFERENCES {reference_to}(id)"
+    return sql
+
+
+def _column_differs(db_manager, column: sqlite3.Row, field: Dict[str, Any]) -> bool:
+    """Проверяет, расходится ли колонка таблицы с описанием поля"""
+    declared_type = (column['type'] or '').upper()
+    if declared_type != db_manager._map_data_type(field['data_type']):
+        return True
+    return bool(column['pk']) != bool(field['is_primary_key']) and field['is_primary_key']
+
+
+def _column_constraints(
+    conn,
+    schema: str,
+    table_name: str,
+    table_info: List[sqlite3.Row]
+) -> Dict[str, Dict[str, Any]]:
+    """Ограничения колонок существующей таблицы: NOT NULL, DEFAULT и действия внешних ключей.
+
+    Метаданные их не описывают, поэтому при пересборке они берутся из
+    PRAGMA table_info и PRAGMA foreign_key_list старой таблицы.
+    """
+    constraints = {
+        row['name']: {'not_null': bool(row['notnull']) and not row['pk'], 'default': row['dflt_value']}
+        for row in table_info
+    }
+    for row in conn.execute(f"PRAGMA {schema}.foreign_key_list({table_name})").fetchall():
+        actions = [
+            f"ON {event} {row[key]}"
+            for event, key in (('DELETE', 'on_delete'), ('UPDATE', 'on_update'))
+            if row[key] and row[key] != 'NO ACTION'
+        ]
+        if row['from'] in constraints and actions:
+            constraints[row['from']]['fk_actions'] = ' '.join(actions)
+    return constraints
+
+
+def rebuild_table(
+    db_manager,
+    table_name: str,
+    fields: List[Dict[str, Any]],
+    batch_size: int,
+    from_schema: Optional[str] = None
+):
+    """Пересобирает таблицу: создает новую, копирует данные пачками и подменяет.
+
+    from_schema - схема, где таблица лежит сейчас, если она переносится в
+    другой файл (новая таблица создается в db_manager._schema_of(table_name)).
+    NOT NULL, DEFAULT и ON DELETE/ON UPDATE колонок старой таблицы сохраняются.
+    """
+    conn = db_manager.conn
+    schema = db_manager._schema_of(table_name)
+    from_schema = from_schema or schema
+    source = f"{from_schema}.{table_name}"
+    new_table = f"{table_name}__migration"
+
+    # Индексы и триггеры удаляются вместе с таблицей, сохраняем их определения.
+    # TEMP-триггеры таблиц шардов хранятся без слова TEMP
+    dependent_sql = [
+        (row['type'], row['sql']) for row in conn.execute(f"""
+            SELECT type, sql FROM {from_schema}.sqlite_master
+            WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        """, (table_name,)).fetchall()
+    ] + [
+        ('temp_trigger', row['sql']) for row in conn.execute("""
+            SELECT sql FROM sqlite_temp_master WHERE tbl_name = ? AND type = 'trigger'
+        """, (table_name,)).fetchall()
+    ]
+
+    old_info = conn.execute(f"PRAGMA {from_schema}.table_info({table_name})").fetchall()
+    old_columns = {row['name']: row['type'] for row in old_info}
+    # Первичный ключ старой таблицы сохраняется, даже если он не отмечен в метаданных
+    old_keys = {row['name'] for row in old_info if row['pk']}
+    fields = [dict(f, is_primary_key=True) if f['field_name'] in old_keys else f for f in fields]
+    field_names = [f['field_name'] for f in fields]
+    extra_columns = [
+        name for name in old_columns
+        if name not in field_names and name not in SERVICE_COLUMNS
+    ]
+
+    conn.execute(f"DROP TABLE IF EXISTS {schema}.{new_table}")
+    conn.execute(db_manager._data_table_sql(
+        new_table, fields, schema=schema,
+        constraints=_column_constraints(conn, from_schema, table_name, old_info)
+    ))
+    # Колонки, которых уже нет в метаданных, переносим как есть
+    for name in extra_columns:
+        conn.execute(f"ALTER TABLE {schema}.{new_table} ADD COLUMN {name} {old_columns[name]}")
+
+    columns = [
+        name for name in field_names + list(SERVICE_COLUMNS) + extra_columns
+        if name in old_columns
+    ]
+    column_list = ', '.join(columns)
+
+    # Копируем пачками по rowid, не поднимая строки в Python
+    last_rowid = 0
+    while True:
+        batch_end = conn.execute(f"""
+            SELECT MAX(rowid) FROM (
+                SELECT rowid FROM {source} WHERE rowid > ? ORDER BY rowid LIMIT ?
+            )
+        """, (last_rowid, batch_size)).fetchone()[0]
+        if batch_end is None:
+            break
+        conn.execute(f"""
+            INSERT INTO {schema}.{new_table} ({column_list})
+            SELECT {column_list} FROM {source} WHERE rowid > ? AND rowid <= ?
+        """, (last_rowid, batch_end))
+        last_rowid = batch_end
+
+    conn.execute(f"DROP TABLE {source}")
+    conn.execute(f"ALTER TABLE {schema}.{new_table} RENAME TO {table_name}")
+
+    for object_type, sql in dependent_sql:
+        if object_type == 'index':
+            # Индекс создается в схеме таблицы: имя индекса уточняется схемой
+            conn.execute(re.sub(r'(INDEX\s+(?:IF NOT EXISTS\s+)?)', rf'\g<1>{schema}.', sql, count=1))
+        elif schema != from_schema:
+            # При переносе в другой файл триггеры создает вызывающий код
+            continue
+        elif object_type == 'temp_trigger':
+            conn.execute(re.sub(r'^CREATE\s+TRIGGER', 'CREATE TEMP TRIGGER', sql, count=1))
+        else:
+            conn.execute(sql)
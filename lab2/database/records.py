@@ -0,0 +1,48 @@
+"""
+Компактное представление записей справочников.
+
+Вместо словаря на каждую строку записи выдаются экземплярами namedtuple,
+класс которого строится один раз на набор колонок таблицы. Такая запись
+занимает место обычного кортежа, поля доступны как атрибуты (record.name)
+и по индексу, а to_dict() превращает ее в привычный словарь.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Iterator, Tuple
+
+
+@lru_cache(maxsize=256)
+def record_class(table_name: str, columns: Tuple[str, ...]):
+    """Класс записи таблицы с заданными колонками (создается один раз)"""
+    # rename=True защищает от колонок с именами-ключевыми словами Python,
+    # исходные имена колонок сохраняются в _columns
+    cls = namedtuple(f"{table_name}Record", columns, rename=True)
+    cls._columns = columns
+    return cls
+
+
+def to_dict(record) -> Dict[str, Any]:
+    """Словарь {колонка: значение} для кода, которому нужен dict"""
+    return dict(zip(record._columns, record))
+
+
+def stream_records(cursor, table_name: str, batch_size: int = 1000) -> Iterator[Any]:
+    """Лениво выдает строки курсора записями record_class.
+
+    Курсор должен быть создан с row_factory = None; строки забираются
+    пачками по batch_size, в памяти одновременно не больше одной пачки.
+    """
+    columns = tuple(column[0] for column in cursor.description)
+    make = record_class(table_name, columns)._make
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from map(make, rows)
+
+
+def to_dicts(records: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+    """Адаптер потока записей в поток словарей"""
+    return map(to_dict, records)
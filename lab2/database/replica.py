@@ -0,0 +1,207 @@
+"""
+Копия небольших справочников в памяти.
+
+Справочники, в которых не больше max_rows живых записей, один раз
+загружаются в словарь {id: запись} и отсортированный по названию индекс.
+Поиск по id, по началу названия и список значений для выпадающих списков
+отвечают из памяти, без запросов к SQLite. Копия обновляется по событиям
+изменения записей DatabaseManager; после массовых изменений в обход
+событий (синхронизация, генерация данных) таблица перечитывается при
+следующем обращении. Запросы к справочникам, которых нет в копии,
+DatabaseManager выполняет в базе и учитывает как промахи.
+
+Записи других соединений и процессов (служба, второй экземпляр
+приложения) событий не порождают. Их копия замечает по PRAGMA
+data_version, которая проверяется при каждом обращении: если файл
+изменило другое соединение, все справочники перечитываются при
+следующем обращении к каждому из них.
+
+    db.enable_replica(max_rows=5000)
+    db.search_reference_values('Cities', 'Мин')   # из памяти
+    db.replica.snapshot()                         # попадания и объем памяти
+"""
+
+import sys
+from bisect import bisect_left, insort
+from typing import Dict, Any, List, Optional, Tuple
+
+from lab2.database.records import stream_records
+
+DEFAULT_MAX_ROWS = 5000
+
+
+class _Mirror:
+    """Записи одного справочника и индекс по названию"""
+
+    __slots__ = ('records', 'index', 'id_position', 'name_position')
+
+    def __init__(self, id_position: int, name_position: Optional[int]):
+        self.records: Dict[str, Any] = {}
+        # Отсортированные пары (название в нижнем регистре, id)
+        self.index: List[Tuple[str, str]] = []
+        self.id_position = id_position
+        self.name_position = name_position
+
+    def _key(self, record) -> Optional[Tuple[str, str]]:
+        if self.name_position is None or record[self.name_position] is None:
+            return None
+        return (str(record[self.name_position]).casefold(), record[self.id_position])
+
+    def put(self, record):
+        record_id = record[self.id_position]
+        self.remove(record_id)
+        self.records[record_id] = record
+        key = self._key(record)
+        if key:
+            insort(self.index, key)
+
+    def remove(self, record_id: str):
+        record = self.records.pop(record_id, None)
+        key = self._key(record) if record is not None else None
+        if key:
+            position = bisect_left(self.index, key)
+            if position < len(self.index) and self.index[position] == key:
+                del self.index[position]
+
+    def label(self, record_id: str) -> Optional[str]:
+        record = self.records.get(record_id)
+        if record is None or self.name_position is None:
+            return None
+        return record[self.name_position]
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[str, str]]:
+        folded = prefix.casefold()
+        found = []
+        position = bisect_left(self.index, (folded, ''))
+        while position < len(self.index) and len(found) < limit:
+            key, record_id = self.index[position]
+            if not key.startswith(folded):
+                break
+            found.append((record_id, self.label(record_id)))
+            position += 1
+        return found
+
+    def values(self) -> List[Tuple[str, str]]:
+        return [(record_id, self.label(record_id)) for _, record_id in self.index]
+
+    def footprint(self) -> int:
+        """Приблизительный объем памяти в байтах"""
+        size = sys.getsizeof(self.records) + sys.getsizeof(self.index)
+        for record in self.records.values():
+            size += sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record)
+        # id в индексе - те же объекты строк, что и в записях
+        size += sum(sys.getsizeof(key) + sys.getsizeof(key[0]) for key in self.index)
+        return size
+
+
+class DictionaryReplica:
+    """Копии небольших справочников базы в памяти"""
+
+    def __init__(self, db_manager, max_rows: int = DEFAULT_MAX_ROWS):
+        self.db = db_manager
+        self.max_rows = max_rows
+        self.mirrors: Dict[str, _Mirror] = {}
+        # Справочники, которые нужно (пере)прочитать при обращении
+        self._stale: set = set()
+        self.stats: Dict[str, Dict[str, int]] = {}
+        # data_version файлов базы на момент загрузки копии
+        self._data_version = self._read_data_version()
+
+        for dict_info in db_manager.get_dictionaries():
+            self._load(dict_info['name'])
+        db_manager.add_change_listener(self._on_record_changed)
+
+    def close(self):
+        """Отписывается от изменений и освобождает память"""
+        self.db.remove_change_listener(self._on_record_changed)
+        self.mirrors.clear()
+
+    def lookup(self, table_name: str) -> Optional[_Mirror]:
+        """Копия справочника или None, если запрос нужно выполнить в базе"""
+        data_version = self._read_data_version()
+        if data_version != self._data_version:
+            # Файл изменило другое соединение - неизвестно, какие справочники
+            self._data_version = data_version
+            self.invalidate()
+        if table_name in self._stale:
+            self._stale.discard(table_name)
+            self._load(table_name)
+
+        stats = self.stats.setdefault(table_name, {'hits': 0, 'misses': 0, 'loads': 0})
+        mirror = self.mirrors.get(table_name)
+        stats['hits' if mirror is not None else 'misses'] += 1
+        return mirror
+
+    def invalidate(self, table_name: Optional[str] = None):
+        """Помечает справочник (или все) для перечитывания при следующем обращении"""
+        tables = [table_name] if table_name else [d['name'] for d in self.db.get_dictionaries()]
+        for name in tables:
+            self.mirrors.pop(name, None)
+            self._stale.add(name)
+
+    def _read_data_version(self) -> Tuple[int, ...]:
+        """data_version основной базы и файлов справочников.
+
+        Значение меняется, только когда файл изменило другое соединение;
+        собственные записи DatabaseManager приходят событиями.
+        """
+        return tuple(
+            self.db.conn.execute(f"PRAGMA {schema}.data_version").fetchone()[0]
+            for schema in self.db._data_schemas()
+        )
+
+    def _load(self, table_name: str):
+        """Читает справочник целиком, если он не больше max_rows записей"""
+        if not self.db._table_exists(table_name):
+            return
+        count = self.db.conn.execute(
+            f"SELECT COUNT(*) FROM {table_name} WHERE is_deleted = 0"
+        ).fetchone()[0]
+        if count > self.max_rows:
+            return
+
+        columns = self.db._table_columns(table_name)
+        mirror = _Mirror(columns.index('id'), columns.index('name') if 'name' in columns else None)
+        for record in self.db.iter_records(table_name):
+            mirror.put(record)
+        self.mirrors[table_name] = mirror
+        self.stats.setdefault(table_name, {'hits': 0, 'misses': 0, 'loads': 0})['loads'] += 1
+
+    def _on_record_changed(self, table_name: str, operation: str, record_id: str):
+        mirror = self.mirrors.get(table_name)
+        if mirror is None:
+            return
+        if operation == 'delete':
+            mirror.remove(record_id)
+            return
+
+        cursor = self.db.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(
+            f"SELECT * FROM {table_name} WHERE id = ? AND is_deleted = 0", (record_id,)
+        )
+        record = next(stream_records(cursor, table_name), None)
+        if record is None:
+            mirror.remove(record_id)
+        elif len(mirror.records) >= self.max_rows and record_id not in mirror.records:
+            # Справочник перерос порог: дальше запросы идут в базу
+            del self.mirrors[table_name]
+        else:
+            mirror.put(record)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Число записей, объем памяти и попадания по справочникам"""
+        tables = {}
+        for table_name, stats in self.stats.items():
+            mirror = self.mirrors.get(table_name)
+            tables[table_name] = dict(
+                stats,
+                rows=len(mirror.records) if mirror else 0,
+                bytes=mirror.footprint() if mirror else 0,
+                mirrored=mirror is not None,
+            )
+        return {
+            'max_rows': self.max_rows,
+            'tables': tables,
+            'total_bytes': sum(t['bytes'] for t in tables.values()),
+        }
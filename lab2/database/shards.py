@@ -0,0 +1,231 @@
+"""
+Размещение справочников в отдельных файлах SQLite (шардах).
+
+Таблица справочника может храниться не в основной базе, а в своем файле:
+Dictionary.storage - путь к файлу относительно основной базы (NULL -
+основная база). DatabaseManager подключает файлы через ATTACH DATABASE под
+схемами shard_<имя файла>, поэтому запросы без имени схемы, соединения
+справочников и поиск по ссылкам работают как раньше. Каждый файл меньше
+общей базы, копируется и сжимается отдельно.
+
+Ограничения SQLite, которые учитывает размещение:
+    - FOREIGN KEY не может ссылаться на таблицу другого файла: такие
+      ссылки проверяют валидатор записей и модуль integrity;
+    - постоянный триггер видит только таблицы своего файла, поэтому журнал
+      изменений, историю и сводные таблицы на таблицах шардов ведут
+      TEMP-триггеры, которые создаются при каждом подключении;
+    - запись в шард добавляет строку в Change_Log основной базы, так что
+      писатели разных шардов все равно по очереди берут блокировку
+      основного файла;
+    - в режиме WAL транзакция над несколькими файлами атомарна для каждого
+      файла, но не для всех вместе;
+    - к соединению подключается не больше 10 файлов (SQLITE_MAX_ATTACHED).
+
+    python -m lab2.database.shards --table IndustrialEnterprises --storage enterprises.db
+    python -m lab2.database.shards --table IndustrialEnterprises   # обратно в основную базу
+    python -m lab2.database.shards --list
+"""
+
+import argparse
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from lab2.database.history import install_history
+from lab2.database.integrity import collect_references, ensure_reference_indexes
+from lab2.database.migrations import rebuild_table
+from lab2.database.sync import install_change_log
+
+SCHEMA_PREFIX = 'shard_'
+
+# PRAGMA auto_vacuum: 2 - INCREMENTAL (как у основной базы после сжатия)
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def shard_path(db_manager, storage: str) -> Path:
+    """Путь к файлу шарда; storage задается относительно основной базы"""
+    return Path(db_manager.db_path).parent / storage
+
+
+def attach_shards(db_manager, dictionaries: Optional[List[Dict[str, Any]]] = None):
+    """Подключает файлы справочников и запоминает схему каждой таблицы"""
+    if dictionaries is None:
+        try:
+            dictionaries = db_manager._select_dictionaries()
+        except sqlite3.OperationalError:
+            # Новая база или схема старше Dictionary.storage: шардов еще нет
+            return
+
+    table_schemas = {}
+    for dict_info in dictionaries:
+        if dict_info.get('storage'):
+            table_schemas[dict_info['name']] = attach_shard(db_manager, dict_info['storage'])
+    db_manager._table_schemas = table_schemas
+
+
+def attach_shard(db_manager, storage: str) -> str:
+    """Подключает файл шарда (создает его при записи) и возвращает имя схемы"""
+    if storage in db_manager._shard_schemas:
+        return db_manager._shard_schemas[storage]
+
+    conn = db_manager.conn
+    base = SCHEMA_PREFIX + re.sub(r'\W', '_', Path(storage).stem)
+    used = set(db_manager._shard_schemas.values())
+    schema, number = base, 1
+    while schema in used:
+        number += 1
+        schema = f"{base}_{number}"
+
+    path = shard_path(db_manager, storage)
+    # ATTACH недоступен внутри транзакции
+    conn.commit()
+    if db_manager.read_only:
+        uri = f"{path.resolve().as_uri()}?mode=ro"
+        if db_manager.immutable:
+            uri += "&immutable=1"
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (uri,))
+        conn.execute(f"PRAGMA {schema}.mmap_size = {conn.execute('PRAGMA main.mmap_size').fetchone()[0]}")
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+        if conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0] == 0:
+            # Режим auto_vacuum задается до создания первой таблицы файла
+            conn.execute(f"PRAGMA {schema}.auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        journal_mode = conn.execute("PRAGMA main.journal_mode").fetchone()[0]
+        conn.execute(f"PRAGMA {schema}.journal_mode = {journal_mode}")
+
+    db_manager._shard_schemas[storage] = schema
+    return schema
+
+
+def detach_unused(db_manager):
+    """Отключает файлы, в которых не осталось справочников"""
+    used = set(db_manager._table_schemas.values())
+    for storage, schema in list(db_manager._shard_schemas.items()):
+        if schema not in used:
+            db_manager.conn.commit()
+            db_manager.conn.execute(f"DETACH DATABASE {schema}")
+            del db_manager._shard_schemas[storage]
+
+
+def move_dictionary(
+    db_manager,
+    table_name: str,
+    storage: Optional[str] = None,
+    batch_size: int = 10000
+) -> Dict[str, Any]:
+    """Переносит таблицу справочника в файл storage (None - в основную базу).
+
+    Записи копируются пачками в одной транзакции с записью нового
+    размещения в Dictionary. Справочники, ссылающиеся на перенесенный,
+    пересобираются: FOREIGN KEY остается только у ссылок внутри одного файла.
+    Индексы, триггеры журнала изменений, истории и сводок создаются заново;
+    таблицы истории остаются в основной базе.
+    """
+    started = time.perf_counter()
+    conn = db_manager.conn
+
+    dict_info = db_manager.get_dictionary_by_name(table_name)
+    if dict_info is None:
+        raise ValueError(f"Справочник {table_name} не найден")
+    if storage and Path(storage).is_absolute():
+        raise ValueError("Файл шарда задается относительно основной базы")
+
+    source = db_manager._schema_of(table_name)
+    target = attach_shard(db_manager, storage) if storage else 'main'
+    if source == target:
+        return {'table': table_name, 'moved': False, 'schema': target}
+
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys = OFF")
+    previous = dict(db_manager._table_schemas)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if storage:
+            db_manager._table_schemas[table_name] = target
+        else:
+            db_manager._table_schemas.pop(table_name, None)
+
+        rows = conn.execute(f"SELECT COUNT(*) FROM {source}.{table_name}").fetchone()[0]
+        rebuild_table(
+            db_manager, table_name, db_manager.get_table_fields(table_name), batch_size,
+            from_schema=source
+        )
+
+        rebuilt = []
+        for child, _, _ in collect_references(db_manager).get(table_name, []):
+            same_file = db_manager._schema_of(child) == target
+            if child != table_name and child not in rebuilt and _references(conn, child, table_name) != same_file:
+                rebuild_table(db_manager, child, db_manager.get_table_fields(child), batch_size)
+                rebuilt.append(child)
+
+        conn.execute(
+            "UPDATE Dictionary SET storage = ? WHERE id = ?", (storage or None, dict_info['id'])
+        )
+
+        for schema in {'main', source, target}:
+            violations = conn.execute(f"PRAGMA {schema}.foreign_key_check").fetchall()
+            if violations:
+                raise sqlite3.IntegrityError(
+                    f"Нарушение внешних ключей после переноса: {len(violations)} записей"
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        db_manager._table_schemas = previous
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+    # Индексы и триггеры удалены вместе со старой таблицей
+    ensure_reference_indexes(db_manager)
+    install_change_log(db_manager, replace=True)
+    install_history(db_manager, replace=True)
+    db_manager._sync_summary_tables()
+    detach_unused(db_manager)
+    db_manager._invalidate_cache()
+
+    place = storage or Path(db_manager.db_path).name
+    print(f"✅ Справочник {table_name} перенесен в {place}: {rows} записей")
+    return {
+        'table': table_name,
+        'moved': True,
+        'schema': target,
+        'path': str(shard_path(db_manager, storage) if storage else db_manager.db_path),
+        'rows': rows,
+        'rebuilt': rebuilt,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def _references(conn, child: str, parent: str) -> bool:
+    """Есть ли у таблицы child FOREIGN KEY на parent"""
+    return any(row['table'] == parent for row in conn.execute(f"PRAGMA foreign_key_list({child})"))
+
+
+def main():
+    """Размещение справочников из командной строки"""
+    from lab2.database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Перенос справочников в отдельные файлы")
+    parser.add_argument('--db', type=Path, default=Path(__file__).parent.parent / 'data' / 'business.db')
+    parser.add_argument('--table', help="Справочник для переноса")
+    parser.add_argument('--storage', help="Файл относительно базы (без него - в основную базу)")
+    parser.add_argument('--list', action='store_true', help="Показать размещение справочников")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        if args.table:
+            db_manager.move_dictionary(args.table, args.storage)
+        if args.list or not args.table:
+            for dict_info in db_manager.get_dictionaries():
+                print(f"   {dict_info['name']}: {dict_info['storage'] or args.db.name}")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
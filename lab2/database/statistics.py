@@ -0,0 +1,212 @@
+"""
+Статистика таблиц справочников и обслуживание планировщика SQLite.
+
+run_maintenance() выполняет ANALYZE с ограничением analysis_limit (SQLite
+читает не больше ANALYSIS_LIMIT строк каждого индекса, поэтому анализ
+быстрый и на больших таблицах) и PRAGMA optimize, а затем обновляет
+Table_Statistics и Field_Statistics:
+
+    Table_Statistics  - число записей всего и живых (is_deleted = 0);
+    Field_Statistics  - оценка числа различных значений и доля NULL
+                        по каждому полю, по выборке до SAMPLE_SIZE строк.
+
+Интерфейс и построитель запросов читают эти таблицы одним запросом по
+ключу, например чтобы решить, загружать таблицу целиком или частями.
+Обслуживание запускается после массовых загрузок, при запуске
+приложения, если статистика старше MAINTENANCE_INTERVAL, и из командной
+строки (например, по расписанию cron):
+
+    python -m lab2.database.statistics --db business.db
+
+Функции работают с обычным соединением sqlite3 и читают метаданные
+справочников запросами, поэтому фоновому потоку приложения достаточно
+открыть свое соединение через open_connection(), без DatabaseManager.
+"""
+
+import argparse
+import math
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+from lab2.database.shards import SCHEMA_PREFIX
+
+# Сколько строк каждого индекса читает ANALYZE
+ANALYSIS_LIMIT = 1000
+
+# Размер выборки для оценки числа различных значений
+SAMPLE_SIZE = 10000
+
+# Статистика старше этого срока считается устаревшей
+MAINTENANCE_INTERVAL = timedelta(days=1)
+
+
+def open_connection(db_path: Union[str, Path]) -> sqlite3.Connection:
+    """Соединение для обслуживания: основная база и подключенные файлы справочников"""
+    conn = sqlite3.connect(db_path)
+    storages = [
+        row[0] for row in conn.execute(
+            "SELECT DISTINCT storage FROM Dictionary WHERE storage IS NOT NULL"
+        ).fetchall()
+    ]
+    # Запросы обращаются к таблицам без имени схемы, так что подойдет любое
+    for number, storage in enumerate(storages, 1):
+        conn.execute(
+            f"ATTACH DATABASE ? AS {SCHEMA_PREFIX}{number}", (str(Path(db_path).parent / storage),)
+        )
+    return conn
+
+
+def dictionary_tables(conn) -> List[str]:
+    """Справочники, таблицы которых есть в базе или подключенных файлах"""
+    return [row[0] for row in conn.execute("""
+        SELECT d.name FROM Dictionary d
+        WHERE EXISTS (
+            SELECT 1 FROM pragma_table_list t WHERE t.type = 'table' AND t.name = d.name
+        )
+        ORDER BY d.display_name
+    """).fetchall()]
+
+
+def table_fields(conn, table_name: str) -> List[str]:
+    """Поля справочника в порядке отображения"""
+    return [row[0] for row in conn.execute("""
+        SELECT f.field_name FROM Dictionary_Fields f
+        JOIN Dictionary d ON d.id = f.dictionary_id
+        WHERE d.name = ?
+        ORDER BY f.display_order
+    """, (table_name,)).fetchall()]
+
+
+def estimate_distinct(sample: List[Any], total: int) -> int:
+    """Оценка числа различных значений по выборке (Haas-Stokes Duj1, как в PostgreSQL).
+
+    n*d / (n - f1 + f1*n/N), где n - размер выборки, d - различных в ней,
+    f1 - встретившихся один раз, N - записей в таблице. Если все значения
+    выборки различны, оценка равна N, если повторяются все - d.
+    """
+    if not sample:
+        return 0
+    size = len(sample)
+    counts = Counter(sample)
+    singletons = sum(1 for count in counts.values() if count == 1)
+    estimate = size * len(counts) / (size - singletons + singletons * size / max(total, size))
+    return min(int(round(estimate)), max(total, len(counts)))
+
+
+def collect_table_statistics(conn, table_name: str) -> Dict[str, Any]:
+    """Считает записи таблицы и оценивает поля по равномерной выборке живых записей"""
+    row_count, live_count = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(is_deleted = 0), 0) FROM {table_name}"
+    ).fetchone()
+
+    fields = table_fields(conn, table_name)
+    # Каждая step-я живая запись по rowid: выборка по всей таблице, а не только начало
+    step = max(live_count // SAMPLE_SIZE, 1)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"""
+        SELECT {', '.join(fields)} FROM {table_name}
+        WHERE is_deleted = 0 AND rowid % ? = 0
+        LIMIT ?
+    """, (step, SAMPLE_SIZE))
+    sample = cursor.fetchall()
+
+    field_stats = {}
+    for position, field_name in enumerate(fields):
+        values = [row[position] for row in sample]
+        present = [value for value in values if value is not None]
+        # Различные значения оцениваются среди непустых, а не всех записей
+        non_null = round(live_count * len(present) / len(values)) if values else 0
+        field_stats[field_name] = {
+            'distinct_estimate': estimate_distinct(present, non_null),
+            'null_fraction': (len(values) - len(present)) / len(values) if values else 0.0,
+        }
+
+    return {'row_count': row_count, 'live_count': live_count, 'fields': field_stats}
+
+
+def refresh_statistics(conn, tables: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Пересчитывает и сохраняет статистику таблиц (по умолчанию всех справочников)"""
+    tables = tables or dictionary_tables(conn)
+    collected = {}
+    for table_name in tables:
+        stats = collect_table_statistics(conn, table_name)
+        conn.execute("""
+            INSERT OR REPLACE INTO Table_Statistics (table_name, row_count, live_count, analyzed_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        """, (table_name, stats['row_count'], stats['live_count']))
+        conn.execute("DELETE FROM Field_Statistics WHERE table_name = ?", (table_name,))
+        conn.executemany("""
+            INSERT INTO Field_Statistics (table_name, field_name, distinct_estimate, null_fraction)
+            VALUES (?, ?, ?, ?)
+        """, [
+            (table_name, field_name, field['distinct_estimate'], field['null_fraction'])
+            for field_name, field in stats['fields'].items()
+        ])
+        collected[table_name] = stats
+    conn.commit()
+    return collected
+
+
+def run_maintenance(conn, analyze: bool = True, tables: Optional[List[str]] = None) -> Dict[str, Any]:
+    """ANALYZE и PRAGMA optimize для планировщика, затем обновление статистики"""
+    started = time.perf_counter()
+    if analyze:
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        if tables:
+            for table_name in tables:
+                conn.execute(f"ANALYZE {table_name}")
+        else:
+            conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+
+    collected = refresh_statistics(conn, tables)
+    elapsed = time.perf_counter() - started
+    print(f"📊 Статистика обновлена за {elapsed * 1000:.1f} мс: {len(collected)} таблиц")
+    return {'tables': collected, 'elapsed': elapsed}
+
+
+def maintenance_due(conn, interval: timedelta = MAINTENANCE_INTERVAL) -> bool:
+    """Нужна ли статистика: ее нет у какого-то справочника или она старше interval"""
+    rows = dict(conn.execute(
+        "SELECT table_name, analyzed_at FROM Table_Statistics"
+    ).fetchall())
+    # CURRENT_TIMESTAMP в SQLite - время UTC без часового пояса
+    threshold = datetime.now(timezone.utc).replace(tzinfo=None) - interval
+    for (table_name,) in conn.execute("SELECT name FROM Dictionary").fetchall():
+        analyzed_at = rows.get(table_name)
+        if analyzed_at is None or datetime.fromisoformat(analyzed_at) < threshold:
+            return True
+    return False
+
+
+def main():
+    """Обслуживание статистики из командной строки"""
+    from lab2.database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="ANALYZE и статистика таблиц справочников")
+    parser.add_argument('--db', type=Path, default=Path(__file__).parent.parent / 'data' / 'business.db')
+    parser.add_argument('--table', action='append', dest='tables', help="Справочник (по умолчанию все)")
+    parser.add_argument('--no-analyze', action='store_true', help="Только счетчики, без ANALYZE")
+    parser.add_argument('--if-due', action='store_true', help="Только если статистика устарела")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        if args.if_due and not maintenance_due(db_manager.conn):
+            print("✅ Статистика актуальна")
+            return
+        report = run_maintenance(db_manager.conn, analyze=not args.no_analyze, tables=args.tables)
+        for table_name, stats in report['tables'].items():
+            print(f"   {table_name}: {stats['live_count']} живых из {stats['row_count']} записей")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
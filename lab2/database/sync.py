@@ -0,0 +1,323 @@
+"""
+Журнал изменений (CDC) и обмен дельтами между копиями базы.
+
+Триггеры на таблицах справочников пишут каждое изменение в Change_Log:
+таблица, id записи, операция, updated_at, JSON со значениями строки и
+узел-источник. Синхронизация забирает у другой базы только записи журнала
+после сохраненной отметки (watermark) и применяет их пачками в транзакциях;
+при конфликте побеждает версия с более поздним updated_at. Физическое
+удаление (сжатие архивирует мягко удаленные записи) применяется как мягкое:
+у копии свое сжатие и свои ссылки на запись. Изменение, нарушающее
+ограничения копии, откатывается, записывается в Sync_Conflicts и не
+останавливает обмен.
+
+Получив изменения, копия подтверждает источнику прочитанный seq
+(Sync_Acks источника). Записи журнала до минимального подтверждения всех
+известных копий больше никому не нужны и удаляются после обмена. Копия,
+которая перестала синхронизироваться, удерживает журнал; новая копия
+создается копированием файла (--reset-node-id), а не чтением журнала с нуля.
+
+Запуск: python -m lab2.database.sync путь/к/другой.db
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import List, Dict, Any
+
+TRIGGER_PREFIX = 'cdc'
+
+# Источник изменения: узел, применяющий чужие изменения, или текущий узел
+ORIGIN_SQL = """COALESCE(
+    (SELECT origin FROM Sync_Context WHERE id = 1),
+    (SELECT node_id FROM Sync_Node WHERE id = 1)
+)"""
+
+
+def install_change_log(db_manager, replace: bool = False):
+    """Создает триггеры журнала изменений на таблицах справочников.
+
+    replace=True пересоздает их, например после миграции, когда у таблиц
+    изменился набор колонок.
+    """
+    conn = db_manager.conn
+    # TEMP-триггеры таблиц шардов хранятся в sqlite_temp_master
+    existing = {
+        row['name'] for row in conn.execute("""
+            SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?
+            UNION ALL
+            SELECT name FROM sqlite_temp_master WHERE type = 'trigger' AND name LIKE ?
+        """, (f"{TRIGGER_PREFIX}_%", f"{TRIGGER_PREFIX}_%")).fetchall()
+    }
+
+    for dict_info in db_manager.get_dictionaries():
+        table_name = dict_info['name']
+        if not db_manager._table_exists(table_name):
+            continue
+
+        names = {op: f"{TRIGGER_PREFIX}_{table_name}_{op}" for op in ('insert', 'update', 'delete')}
+        if not replace and all(name in existing for name in names.values()):
+            continue
+
+        columns = db_manager._table_columns(table_name)
+        payload = "json_object({})".format(
+            ', '.join(f"'{column}', NEW.{column}" for column in columns)
+        )
+        bodies = {
+            'insert': ('AFTER INSERT', 'NEW.id', 'NEW.updated_at', payload),
+            'update': ('AFTER UPDATE', 'NEW.id', 'NEW.updated_at', payload),
+            'delete': (
+                'AFTER DELETE', 'OLD.id',
+                "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')", 'NULL'
+            ),
+        }
+        for op, (event, record_id, updated_at, row_payload) in bodies.items():
+            db_manager._create_trigger(names[op], event, table_name, f"""
+                INSERT INTO Change_Log (table_name, record_id, operation, updated_at, payload, origin)
+                VALUES ('{table_name}', {record_id}, '{op}', {updated_at}, {row_payload}, {ORIGIN_SQL});
+            """)
+
+    conn.commit()
+
+
+def get_node_id(conn: sqlite3.Connection) -> str:
+    """Возвращает идентификатор узла (копии базы)"""
+    return conn.execute("SELECT node_id FROM Sync_Node WHERE id = 1").fetchone()[0]
+
+
+def reset_node_id(conn: sqlite3.Connection) -> str:
+    """Выдает копии базы новый идентификатор узла (после копирования файла)"""
+    conn.execute("UPDATE Sync_Node SET node_id = lower(hex(randomblob(16))) WHERE id = 1")
+    conn.commit()
+    return get_node_id(conn)
+
+
+def pull_changes(
+    target_manager,
+    source_conn: sqlite3.Connection,
+    batch_size: int = 1000
+) -> Dict[str, int]:
+    """Применяет к target изменения из source после сохраненной отметки.
+
+    Пропускаются изменения, которые сам target и породил, чтобы они не
+    возвращались обратно. Каждая пачка применяется в одной транзакции
+    вместе со сдвигом отметки, каждое изменение - под своей точкой
+    сохранения: отклоненное ограничениями target откатывается целиком и
+    попадает в Sync_Conflicts, остальные изменения пачки применяются.
+    """
+    conn = target_manager.conn
+    target_node = get_node_id(conn)
+    source_node = get_node_id(source_conn)
+    if source_node == target_node:
+        raise ValueError(
+            "У копий базы одинаковый идентификатор узла (файл был скопирован). "
+            "Выполните для одной из них: python -m lab2.database.sync --reset-node-id"
+        )
+
+    row = conn.execute(
+        "SELECT last_seq FROM Sync_Peers WHERE peer_node_id = ?", (source_node,)
+    ).fetchone()
+    watermark = row[0] if row else 0
+    # Все записи журнала до этой включительно будут прочитаны target
+    # или не нужны ему (порождены им самим)
+    source_high = source_conn.execute("SELECT COALESCE(MAX(seq), 0) FROM Change_Log").fetchone()[0]
+
+    stats = {'applied': 0, 'skipped': 0, 'conflicts': 0}
+    columns_cache: Dict[str, List[str]] = {}
+
+    while True:
+        batch = source_conn.execute("""
+            SELECT seq, table_name, record_id, operation, updated_at, payload, origin
+            FROM Change_Log
+            WHERE seq > ? AND origin != ?
+            ORDER BY seq
+            LIMIT ?
+        """, (watermark, target_node, batch_size)).fetchall()
+
+        if not batch:
+            break
+        last_seq = batch[-1][0]
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for seq, table_name, record_id, operation, updated_at, payload, origin in batch:
+                if table_name not in columns_cache:
+                    columns_cache[table_name] = (
+                        target_manager._table_columns(table_name)
+                        if target_manager._table_exists(table_name) else []
+                    )
+                columns = columns_cache[table_name]
+
+                # Изменение помечается узлом-источником, а не target
+                conn.execute("UPDATE Sync_Context SET origin = ? WHERE id = 1", (origin,))
+                conn.execute("SAVEPOINT sync_change")
+                try:
+                    applied = _apply_change(
+                        conn, table_name, columns, record_id, operation, updated_at, payload
+                    )
+                except sqlite3.IntegrityError as e:
+                    conn.execute("ROLLBACK TO sync_change")
+                    conn.execute("""
+                        INSERT INTO Sync_Conflicts
+                            (peer_node_id, seq, table_name, record_id, operation, payload, error)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (source_node, seq, table_name, record_id, operation, payload, str(e)))
+                    stats['conflicts'] += 1
+                else:
+                    stats['applied' if applied else 'skipped'] += 1
+                conn.execute("RELEASE sync_change")
+
+            conn.execute("UPDATE Sync_Context SET origin = NULL WHERE id = 1")
+            conn.execute("""
+                INSERT INTO Sync_Peers (peer_node_id, last_seq) VALUES (?, ?)
+                ON CONFLICT(peer_node_id) DO UPDATE SET last_seq = excluded.last_seq
+            """, (source_node, last_seq))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        watermark = last_seq
+
+    _acknowledge(source_conn, target_node, max(watermark, source_high))
+    return stats
+
+
+def _acknowledge(source_conn: sqlite3.Connection, peer_node: str, seq: int):
+    """Запоминает в источнике, до какого seq копия peer_node получила журнал"""
+    try:
+        source_conn.execute("""
+            INSERT INTO Sync_Acks (peer_node_id, acked_seq) VALUES (?, ?)
+            ON CONFLICT(peer_node_id) DO UPDATE SET acked_seq = MAX(acked_seq, excluded.acked_seq)
+        """, (peer_node, seq))
+        source_conn.commit()
+    except Exception:
+        source_conn.rollback()
+        raise
+
+
+def prune_change_log(conn: sqlite3.Connection) -> int:
+    """Удаляет записи журнала, полученные всеми известными копиями.
+
+    Без подтверждений (копия ни с кем не синхронизировалась) журнал не
+    трогается. Возвращает число удаленных записей.
+    """
+    acked = conn.execute("SELECT MIN(acked_seq) FROM Sync_Acks").fetchone()[0]
+    if not acked:
+        return 0
+    try:
+        pruned = conn.execute("DELETE FROM Change_Log WHERE seq <= ?", (acked,)).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return pruned
+
+
+def _apply_change(
+    conn: sqlite3.Connection,
+    table_name: str,
+    columns: List[str],
+    record_id: str,
+    operation: str,
+    updated_at: str,
+    payload: str
+) -> bool:
+    """Применяет одно изменение, если оно не старее локальной версии записи"""
+    if not columns:
+        return False
+
+    local = conn.execute(
+        f"SELECT updated_at FROM {table_name} WHERE id = ?", (record_id,)
+    ).fetchone()
+    if local is not None and (local[0] or '') > (updated_at or ''):
+        return False
+
+    if operation == 'delete':
+        # Удаленная сжатием запись у источника уже была мягко удалена;
+        # физическое удаление здесь нарушило бы ссылки на нее
+        if local is not None:
+            conn.execute(f"""
+                UPDATE {table_name} SET is_deleted = 1, updated_at = ?
+                WHERE id = ? AND is_deleted = 0
+            """, (updated_at, record_id))
+        return True
+
+    values = {k: v for k, v in json.loads(payload).items() if k in columns}
+    names = list(values)
+    # Наличие записи уже известно: ON CONFLICT(id) не нужен, он требует
+    # PRIMARY KEY или UNIQUE на id, которых у таблицы может не быть
+    if local is not None:
+        assignments = ', '.join(f"{name} = ?" for name in names if name != 'id')
+        conn.execute(
+            f"UPDATE {table_name} SET {assignments} WHERE id = ?",
+            [value for name, value in values.items() if name != 'id'] + [record_id]
+        )
+    else:
+        conn.execute(f"""
+            INSERT INTO {table_name} ({', '.join(names)})
+            VALUES ({', '.join('?' for _ in names)})
+        """, list(values.values()))
+    return True
+
+
+def sync_databases(local_manager, remote_manager, batch_size: int = 1000) -> Dict[str, Any]:
+    """Двусторонний обмен дельтами между двумя базами"""
+    started = time.perf_counter()
+    pulled = pull_changes(local_manager, remote_manager.conn, batch_size)
+    pushed = pull_changes(remote_manager, local_manager.conn, batch_size)
+    pruned = {
+        'local': prune_change_log(local_manager.conn),
+        'remote': prune_change_log(remote_manager.conn),
+    }
+
+    local_manager._invalidate_cache()
+    remote_manager._invalidate_cache()
+    return {
+        'pulled': pulled, 'pushed': pushed, 'pruned': pruned,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def main():
+    """Синхронизация рабочей базы с другой копией из командной строки"""
+    from lab2.database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Обмен изменениями между копиями базы")
+    parser.add_argument('remote', type=Path, nargs='?', help="Путь к другой копии business.db")
+    parser.add_argument('--db', type=Path, default=Path(__file__).parent.parent / 'data' / 'business.db')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--reset-node-id', action='store_true',
+                        help="Выдать базе --db новый идентификатор узла")
+    args = parser.parse_args()
+
+    if args.reset_node_id:
+        local_manager = DatabaseManager(args.db)
+        print(f"✅ Новый идентификатор узла: {reset_node_id(local_manager.conn)}")
+        local_manager.close()
+        return
+    if args.remote is None:
+        parser.error("укажите путь к другой копии базы")
+
+    local_manager = DatabaseManager(args.db)
+    remote_manager = DatabaseManager(args.remote)
+    try:
+        report = local_manager.sync_with(remote_manager, args.batch_size)
+    finally:
+        local_manager.close()
+        remote_manager.close()
+
+    print(f"⬇️  Получено: {report['pulled']['applied']}, пропущено: {report['pulled']['skipped']}")
+    print(f"⬆️  Отправлено: {report['pushed']['applied']}, пропущено: {report['pushed']['skipped']}")
+    conflicts = report['pulled']['conflicts'] + report['pushed']['conflicts']
+    if conflicts:
+        print(f"⚠️  Не применено из-за ограничений: {conflicts} (см. Sync_Conflicts)")
+    print(f"📦 Удалено из журнала: {report['pruned']['local']} (здесь), "
+          f"{report['pruned']['remote']} (в копии)")
+    print(f"✅ Синхронизация за {report['elapsed']:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Проверка записей справочников по метаданным.
+
+compile_validator() один раз превращает Dictionary_Fields таблицы в
+список проверок: обязательность, тип (INTEGER, REAL, BOOLEAN, DATE),
+формат даты, существование записи по внешнему ключу (поиск в множестве
+id главного справочника, для небольшой пачки - только id, на которые она
+ссылается) и шаблон pattern (email, телефон). Валидатор
+не обращается к базе и сериализуется pickle, поэтому большие пачки можно
+проверять в нескольких процессах. Результат - приведенные к типам записи
+и ошибки по строкам:
+
+    {'row': 12, 'id': '...', 'field': 'email', 'code': 'pattern', 'message': '...'}
+
+Форма редактирования, служба и импорт применяют одни и те же правила.
+"""
+
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Tuple, FrozenSet
+
+# Колонки, которые заполняет DatabaseManager, а не пользователь
+SYSTEM_FIELDS = ('id', 'created_at', 'updated_at', 'is_deleted')
+
+# Форматы даты: хранимый ISO (можно со временем) и вводимый в форме ДД.ММ.ГГГГ.
+# Год может быть короче четырех цифр (974-01-01), а strptime('%Y') такой не принимает
+ISO_DATE = re.compile(r'(\d{1,4})-(\d{1,2})-(\d{1,2})(?:[T ][\d:.]*)?')
+DOTTED_DATE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{1,4})')
+
+BOOLEAN_VALUES = {
+    '1': 1, 'true': 1, 'да': 1, 'yes': 1,
+    '0': 0, 'false': 0, 'нет': 0, 'no': 0,
+}
+
+# Пачка строк на одну задачу процесса
+DEFAULT_CHUNK_SIZE = 10000
+
+# Для пачки не больше стольких строк id главных справочников выбираются по
+# значениям пачки, а не целиком: сохранение одной записи не читает весь справочник
+LOOKUP_BATCH_LIMIT = 500
+
+
+class RecordValidationError(ValueError):
+    """Записи не прошли проверку; errors - ошибки по строкам"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        self.errors = errors
+        details = '; '.join(f"строка {error['row']}: {error['message']}" for error in errors[:5])
+        more = f" и еще {len(errors) - 5}" if len(errors) > 5 else ""
+        super().__init__(f"Ошибки в записях: {details}{more}")
+
+
+class _FieldRule:
+    """Скомпилированные правила одного поля"""
+
+    __slots__ = ('name', 'display_name', 'data_type', 'required', 'pattern', 'reference_ids', 'reference_to')
+
+    def __init__(
+        self,
+        field: Dict[str, Any],
+        reference_ids: Optional[FrozenSet[str]]
+    ):
+        self.name = field['field_name']
+        self.display_name = field['display_name']
+        self.data_type = field['data_type']
+        self.required = bool(field['is_required'])
+        self.pattern = re.compile(field['pattern']) if field.get('pattern') else None
+        self.reference_to = field.get('reference_to')
+        self.reference_ids = reference_ids
+
+
+def _to_integer(value) -> int:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    number = float(str(value).replace(',', '.'))
+    if not number.is_integer():
+        raise ValueError
+    return int(number)
+
+
+def _to_real(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return float(str(value).replace(',', '.'))
+
+
+def _to_boolean(value) -> int:
+    if isinstance(value, (bool, int)) and value in (0, 1):
+        return int(value)
+    return BOOLEAN_VALUES[str(value).strip().lower()]
+
+
+def parse_date(value) -> date:
+    """Дата из date/datetime или строки ГГГГ-ММ-ДД[ время] или ДД.ММ.ГГГГ"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    match = ISO_DATE.fullmatch(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = DOTTED_DATE.fullmatch(text)
+        if not match:
+            raise ValueError(f"Некорректная дата: {value!r}")
+        day, month, year = match.groups()
+    return date(int(year), int(month), int(day))
+
+
+def _to_date(value) -> str:
+    return parse_date(value).isoformat()
+
+
+CONVERTERS = {'INTEGER': _to_integer, 'REAL': _to_real, 'BOOLEAN': _to_boolean, 'DATE': _to_date}
+
+TYPE_NAMES = {'INTEGER': 'целое число', 'REAL': 'число', 'BOOLEAN': 'да/нет', 'DATE': 'дата'}
+
+
+class RecordValidator:
+    """Проверка записей одной таблицы; не зависит от соединения с базой"""
+
+    def __init__(self, table_name: str, rules: List[_FieldRule]):
+        self.table_name = table_name
+        self.rules = rules
+        self.known_fields = {rule.name for rule in rules} | set(SYSTEM_FIELDS)
+
+    def validate_row(
+        self,
+        row: Dict[str, Any],
+        index: int = 0,
+        partial: bool = False
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Возвращает (запись с приведенными значениями, ошибки).
+
+        partial - проверяются только переданные поля (для изменения записи).
+        """
+        errors: List[Dict[str, Any]] = []
+        clean = {key: value for key, value in row.items() if key in SYSTEM_FIELDS}
+
+        def fail(rule_name: str, code: str, message: str):
+            errors.append({
+                'row': index, 'id': row.get('id'), 'field': rule_name,
+                'code': code, 'message': message,
+            })
+
+        for field_name in row:
+            if field_name not in self.known_fields:
+                fail(field_name, 'unknown', f"в справочнике нет поля '{field_name}'")
+
+        for rule in self.rules:
+            if partial and rule.name not in row:
+                continue
+            value = row.get(rule.name)
+            if isinstance(value, str):
+                value = value.strip()
+            if value is None or value == '':
+                if rule.required:
+                    fail(rule.name, 'required', f"поле '{rule.display_name}' обязательно")
+                clean[rule.name] = None
+                continue
+
+            converter = CONVERTERS.get(rule.data_type)
+            if converter:
+                try:
+                    value = converter(value)
+                except (ValueError, KeyError, TypeError, OverflowError):
+                    fail(
+                        rule.name, 'type',
+                        f"поле '{rule.display_name}' - ожидается "
+                        f"{TYPE_NAMES[rule.data_type]}, получено '{value}'"
+                    )
+                    continue
+
+            if rule.reference_ids is not None and value not in rule.reference_ids:
+                fail(
+                    rule.name, 'reference',
+                    f"поле '{rule.display_name}' - нет записи {value} в {rule.reference_to}"
+                )
+                continue
+
+            if rule.pattern is not None and not rule.pattern.match(str(value)):
+                fail(
+                    rule.name, 'pattern',
+                    f"поле '{rule.display_name}' - неверный формат '{value}'"
+                )
+                continue
+
+            clean[rule.name] = value
+
+        return clean, errors
+
+    def validate(
+        self,
+        rows: List[Dict[str, Any]],
+        start: int = 0,
+        partial: bool = False
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """Проверяет пачку; records[i] - приведенная запись или None при ошибках"""
+        records: List[Optional[Dict[str, Any]]] = []
+        errors: List[Dict[str, Any]] = []
+        for offset, row in enumerate(rows):
+            clean, row_errors = self.validate_row(row, start + offset, partial)
+            records.append(None if row_errors else clean)
+            errors.extend(row_errors)
+        return records, errors
+
+
+def compile_validator(
+    db_manager,
+    table_name: str,
+    rows: Optional[List[Dict[str, Any]]] = None
+) -> RecordValidator:
+    """Строит валидатор по метаданным; id главных справочников читаются один раз.
+
+    Если передана пачка rows не больше LOOKUP_BATCH_LIMIT строк, валидатор
+    знает только те id главных справочников, на которые ссылается пачка,
+    и годится только для нее.
+    """
+    lookup = rows is not None and len(rows) <= LOOKUP_BATCH_LIMIT
+    rules = []
+    for field in db_manager.get_table_fields(table_name):
+        if field['field_name'] in SYSTEM_FIELDS:
+            continue
+        reference_ids = None
+        ref_table = field.get('reference_to')
+        if field['data_type'] == 'FOREIGN_KEY' and ref_table and db_manager._table_exists(ref_table):
+            mirror = db_manager.replica.lookup(ref_table) if db_manager.replica else None
+            if lookup:
+                reference_ids = _referenced_ids(db_manager, ref_table, field['field_name'], rows, mirror)
+            elif mirror is not None:
+                reference_ids = frozenset(mirror.records)
+            else:
+                reference_ids = frozenset(
+                    row[0] for row in
+                    db_manager.conn.execute(f"SELECT id FROM {ref_table} WHERE is_deleted = 0")
+                )
+        rules.append(_FieldRule(field, reference_ids))
+    return RecordValidator(table_name, rules)
+
+
+def _referenced_ids(
+    db_manager,
+    ref_table: str,
+    field_name: str,
+    rows: List[Dict[str, Any]],
+    mirror
+) -> FrozenSet[str]:
+    """Существующие id главного справочника из значений поля field_name пачки"""
+    # id справочников - строки: другое значение не найдется и станет ошибкой ссылки
+    values = {
+        value.strip() for value in (row.get(field_name) for row in rows)
+        if isinstance(value, str) and value.strip()
+    }
+    if mirror is not None:
+        return frozenset(value for value in values if value in mirror.records)
+    if not values:
+        return frozenset()
+    # Поиск по первичному ключу: по одному шагу индекса на значение
+    cursor = db_manager.conn.execute(
+        f"SELECT id FROM {ref_table} WHERE is_deleted = 0 AND id IN ({', '.join('?' * len(values))})",
+        list(values)
+    )
+    return frozenset(row[0] for row in cursor)
+
+
+# Валидатор процесса-исполнителя: передается один раз при запуске процесса
+_worker_validator: Optional[RecordValidator] = None
+
+
+def _init_worker(validator: RecordValidator):
+    global _worker_validator
+    _worker_validator = validator
+
+
+def _validate_chunk(rows: List[Dict[str, Any]], start: int, partial: bool, keep_records: bool):
+    records, errors = _worker_validator.validate(rows, start, partial)
+    if not keep_records:
+        # Обратно передаются только ошибки: записи не копируются между процессами
+        records = []
+    return records, errors
+
+
+def validate_records(
+    db_manager,
+    table_name: str,
+    rows: List[Dict[str, Any]],
+    processes: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    partial: bool = False,
+    keep_records: bool = True
+) -> Dict[str, Any]:
+    """Проверяет записи; processes > 0 - пачками в нескольких процессах.
+
+    Возвращает {'checked', 'invalid', 'errors', 'records', 'elapsed'}, где
+    records[i] - приведенная к типам запись rows[i] или None. Если нужны
+    только ошибки, keep_records=False: records не возвращаются, и процессы
+    не пересылают записи обратно.
+    """
+    started = time.perf_counter()
+    validator = compile_validator(db_manager, table_name, rows)
+
+    if processes and len(rows) > chunk_size:
+        starts = range(0, len(rows), chunk_size)
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(validator,)
+        ) as pool:
+            parts = list(pool.map(
+                _validate_chunk,
+                (rows[start:start + chunk_size] for start in starts),
+                starts,
+                [partial] * len(starts),
+                [keep_records] * len(starts),
+            ))
+        records = [record for part_records, _ in parts for record in part_records]
+        errors = [error for _, part_errors in parts for error in part_errors]
+    else:
+        records, errors = validator.validate(rows, 0, partial)
+
+    return {
+        'checked': len(rows),
+        'invalid': len({error['row'] for error in errors}),
+        'errors': errors,
+        'records': records if keep_records else None,
+        'elapsed': time.perf_counter() - started,
+    }
@@ -0,0 +1,148 @@
+"""
+Очередь записи с групповой фиксацией.
+
+Все операции записи выполняет один поток со своим DatabaseManager.
+Операции, поставленные почти одновременно (в пределах max_delay секунд
+или до max_ops штук), выполняются в одной транзакции DatabaseManager.batch()
+и фиксируются одним commit, поэтому fsync оплачивается один раз на пачку.
+Каждый вызывающий получает Future, который завершается только после
+фиксации транзакции с его операцией. Каждая операция выполняется в своей
+точке сохранения: ошибка откатывает ее целиком, даже если она успела
+сделать несколько записей, а остальные операции пачки фиксируются.
+
+    queue = WriteQueue(db_path)
+    future = queue.submit(lambda db: db.insert_record('Cities', data))
+    record_id = future.result()
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from lab2.database.db_manager import DatabaseManager
+
+# Не больше стольких операций в одной транзакции
+DEFAULT_MAX_OPS = 256
+
+# Не дольше стольких секунд ждать следующих операций перед фиксацией
+DEFAULT_MAX_DELAY = 0.002
+
+# Признак остановки потока записи
+_STOP = object()
+
+
+class WriteQueue:
+    """Единственный поток записи, объединяющий операции в транзакции"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        max_ops: int = DEFAULT_MAX_OPS,
+        max_delay: float = DEFAULT_MAX_DELAY
+    ):
+        self.db_path = db_path
+        self.max_ops = max_ops
+        self.max_delay = max_delay
+        self.stats = {'operations': 0, 'commits': 0, 'failed': 0}
+        self._queue: queue.Queue = queue.Queue()
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self.db: Optional[DatabaseManager] = None
+
+        self._thread = threading.Thread(target=self._run, name='lab2-writer', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+
+    def submit(self, operation: Callable[[DatabaseManager], Any]) -> Future:
+        """Ставит операцию в очередь; Future завершится после фиксации"""
+        if not self._thread.is_alive():
+            raise RuntimeError("Очередь записи остановлена")
+        future: Future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def call(self, operation: Callable[[DatabaseManager], Any]) -> Any:
+        """Выполняет операцию через очередь и ждет результата"""
+        return self.submit(operation).result()
+
+    def close(self):
+        """Дожидается выполнения поставленных операций и останавливает поток"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        try:
+            # Соединение SQLite создается и используется только в этом потоке
+            self.db = DatabaseManager(self.db_path)
+            # WAL: читатели из других соединений не ждут записи
+            self.db.conn.execute("PRAGMA journal_mode = WAL")
+        except BaseException as e:
+            self._error = e
+            return
+        finally:
+            self._ready.set()
+
+        try:
+            while True:
+                batch, stop = self._collect()
+                if batch:
+                    self._apply(batch)
+                if stop:
+                    break
+        finally:
+            self.db.close()
+
+    def _collect(self) -> Tuple[List[tuple], bool]:
+        """Забирает из очереди пачку операций: до max_ops или до истечения max_delay"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_ops:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _apply(self, batch: List[tuple]):
+        """Выполняет пачку в одной транзакции и завершает Future после фиксации"""
+        results: List[Tuple[bool, Any]] = []
+        try:
+            with self.db.batch():
+                for operation, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        results.append((False, None))
+                        continue
+                    try:
+                        with self.db._write_transaction():
+                            value = operation(self.db)
+                    except Exception as e:
+                        results.append((False, e))
+                    else:
+                        results.append((True, value))
+        except Exception as e:
+            # Не удалась фиксация: ни одна операция пачки не сохранена
+            results = [(False, e)] * len(batch)
+
+        self.stats['operations'] += len(batch)
+        self.stats['commits'] += 1
+        for (_, future), (ok, value) in zip(batch, results):
+            if future.cancelled():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                self.stats['failed'] += 1
+                future.set_exception(value)
@@ -5,11 +5,14 @@
 Автор: Чепиков Арсений Алексеевич, 4 курс, 4 группа, 2025 год
 """
 
+import os
 import sys
 from pathlib import Path
 
 from lab2.database.db_manager import DatabaseManager
+from lab2.database.instrumentation import QueryProfiler
 from lab2.ui.main_window import MainWindow
+from lab2.ui.profiler import UIProfiler
 
 # Добавляем путь к модулям проекта
 project_root = Path(__file__).parent
@@ -25,9 +28,30 @@ def main():
     # Создаем схему базы данных, если её нет
     schema_path = project_root / 'schema.sql'
     
+    # Профилирование запросов включается переменной окружения LAB2_SQL_PROFILE
+    profiler = None
+    if os.environ.get('LAB2_SQL_PROFILE'):
+        profiler = QueryProfiler(
+            slow_threshold_ms=float(os.environ.get('LAB2_SQL_SLOW_MS', 100)),
+            export_path=Path(os.environ['LAB2_SQL_PROFILE'])
+        )
+    
+    # Профилирование интерфейса включается переменной окружения LAB2_UI_PROFILE
+    ui_profiler = None
+    if os.environ.get('LAB2_UI_PROFILE'):
+        ui_profiler = UIProfiler(
+            Path(os.environ['LAB2_UI_PROFILE']),
+            capture_cprofile=bool(os.environ.get('LAB2_UI_CPROFILE'))
+        )
+        ui_profiler.install()
+    
     # Инициализируем базу данных
     try:
-        db_manager = DatabaseManager(db_path)
+        db_manager = DatabaseManager(db_path, profiler=profiler)
+        
+        # Копия небольших справочников в памяти: LAB2_REPLICA_ROWS - порог записей
+        if os.environ.get('LAB2_REPLICA_ROWS'):
+            db_manager.enable_replica(max_rows=int(os.environ['LAB2_REPLICA_ROWS']))
         
         # Создаем и запускаем главное окно
         app = MainWindow(db_manager)
@@ -36,6 +60,13 @@ def main():
         # Закрываем соединение с БД при выходе
         db_manager.close()
         
+        if profiler:
+            print(f"📊 Статистика запросов: {profiler.export()}")
+        if ui_profiler:
+            print(f"📊 Отзывчивость интерфейса: {ui_profiler.save()}")
+        if db_manager.replica:
+            print(f"📊 Копия справочников: {db_manager.replica.snapshot()}")
+        
     except Exception as e:
         import logging
         logging.exception(f"Ошибка запуска приложения: {e}")
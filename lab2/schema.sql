@@ -1,5 +1,8 @@
 -- schema.sql (исправленная версия)
+-- При изменении файла увеличьте SCHEMA_VERSION в database/db_manager.py
 PRAGMA foreign_keys = ON;
+-- Действует только для новой базы, до создания первой таблицы
+PRAGMA auto_vacuum = INCREMENTAL;
 
 -- 1. Таблица Cities (без внешних ключей)
 CREATE TABLE IF NOT EXISTS Cities (
@@ -46,6 +49,14 @@ CREATE TABLE IF NOT EXISTS Dictionary (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Файл таблицы справочника относительно основной базы (NULL - основная база).
+-- Переносится методом DatabaseManager.move_dictionary
+ALTER TABLE Dictionary ADD COLUMN storage TEXT;
+
+-- Вести ли историю изменений записей (таблица <справочник>_History).
+-- Переключается методом DatabaseManager.set_history_enabled
+ALTER TABLE Dictionary ADD COLUMN keep_history INTEGER DEFAULT 1;
+
 CREATE TABLE IF NOT EXISTS Dictionary_Fields (
     id TEXT PRIMARY KEY,
     dictionary_id TEXT NOT NULL,
@@ -61,6 +72,115 @@ CREATE TABLE IF NOT EXISTS Dictionary_Fields (
     FOREIGN KEY (dictionary_id) REFERENCES Dictionary(id) ON DELETE CASCADE
 );
 
+-- Поведение внешнего ключа при мягком удалении главной записи:
+-- 'restrict' - запрещено, пока есть ссылки, 'cascade' - удалить и ссылающиеся
+ALTER TABLE Dictionary_Fields ADD COLUMN on_delete TEXT DEFAULT 'restrict';
+
+-- Регулярное выражение, которому должно соответствовать значение поля
+ALTER TABLE Dictionary_Fields ADD COLUMN pattern TEXT;
+
+-- Версия метаданных (справочники, поля, сводки). Увеличивается триггерами
+-- trg_metadata_version_*, по ней клиенты службы проверяют кэш (ETag)
+CREATE TABLE IF NOT EXISTS Metadata_Version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO Metadata_Version (id, version) VALUES (1, 0);
+
+-- Статистика таблиц данных для интерфейса и построителя запросов.
+-- Заполняется lab2.database.statistics после массовых загрузок и по расписанию
+CREATE TABLE IF NOT EXISTS Table_Statistics (
+    table_name TEXT PRIMARY KEY,
+    row_count INTEGER NOT NULL,
+    live_count INTEGER NOT NULL,
+    analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Оценка числа различных значений и доля NULL по полям (по выборке)
+CREATE TABLE IF NOT EXISTS Field_Statistics (
+    table_name TEXT NOT NULL,
+    field_name TEXT NOT NULL,
+    distinct_estimate INTEGER NOT NULL,
+    null_fraction REAL NOT NULL,
+    PRIMARY KEY (table_name, field_name)
+);
+
+-- Материализованные сводки: таблица summary_name хранит количество записей
+-- и суммы value_fields (через запятую) по группам group_field
+CREATE TABLE IF NOT EXISTS Dictionary_Summaries (
+    id TEXT PRIMARY KEY,
+    dictionary_id TEXT NOT NULL,
+    summary_name TEXT NOT NULL UNIQUE,
+    group_field TEXT NOT NULL,
+    value_fields TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (dictionary_id) REFERENCES Dictionary(id) ON DELETE CASCADE
+);
+
+-- Журнал примененных миграций таблиц данных
+CREATE TABLE IF NOT EXISTS Schema_Migrations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    version INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    details TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Журнал изменений записей справочников (заполняется триггерами cdc_*)
+CREATE TABLE IF NOT EXISTS Change_Log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    updated_at TEXT,
+    payload TEXT,
+    origin TEXT NOT NULL
+);
+
+-- Идентификатор этой копии базы
+CREATE TABLE IF NOT EXISTS Sync_Node (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    node_id TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO Sync_Node (id, node_id) VALUES (1, lower(hex(randomblob(16))));
+
+-- Отметки: до какого seq журнала другой копии изменения уже получены
+CREATE TABLE IF NOT EXISTS Sync_Peers (
+    peer_node_id TEXT PRIMARY KEY,
+    last_seq INTEGER NOT NULL DEFAULT 0
+);
+
+-- Подтверждения: до какого seq журнала этой копии другая копия уже получила
+-- изменения. Журнал до минимального подтверждения всех копий удаляется
+CREATE TABLE IF NOT EXISTS Sync_Acks (
+    peer_node_id TEXT PRIMARY KEY,
+    acked_seq INTEGER NOT NULL DEFAULT 0
+);
+
+-- Источник изменений, применяемых при синхронизации (NULL - локальные)
+CREATE TABLE IF NOT EXISTS Sync_Context (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    origin TEXT
+);
+
+INSERT OR IGNORE INTO Sync_Context (id, origin) VALUES (1, NULL);
+
+-- Изменения других копий, отклоненные ограничениями этой базы
+CREATE TABLE IF NOT EXISTS Sync_Conflicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    peer_node_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    payload TEXT,
+    error TEXT NOT NULL,
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- 4. Метаданные для Cities
 INSERT OR IGNORE INTO Dictionary (id, name, display_name, description) VALUES 
     ('cities_dict', 'Cities', 'Города', 'Справочник городов Беларуси');
@@ -94,6 +214,9 @@ INSERT OR IGNORE INTO Dictionary_Fields (id, dictionary_id, field_name, display_
     ('ent_address', 'enterprises_dict', 'address', 'Адрес', 'TEXT', 1, 'text', 11, NULL),
     ('ent_notes', 'enterprises_dict', 'notes', 'Примечания', 'TEXT', 0, 'textarea', 12, NULL);
 
+UPDATE Dictionary_Fields SET pattern = '^[^@\s]+@[^@\s]+\.[^@\s]+$' WHERE id = 'ent_email' AND pattern IS NULL;
+UPDATE Dictionary_Fields SET pattern = '^\+?[0-9][0-9 ()-]{5,}[0-9]$' WHERE id = 'ent_phone' AND pattern IS NULL;
+
 -- 6. Начальные данные о Беларуси
 INSERT OR IGNORE INTO Cities (id, name, region, population, area, foundation_date, is_industrial_center, description) VALUES
     ('e6b4a5b0-1234-4a5b-9c6d-7e8f9a0b1c2d', 'Минск', 'Минская', 2000000, 348.84, '1067-03-03', 1, 'Столица Беларуси, крупнейший политический, экономический и культурный центр страны'),
@@ -0,0 +1,336 @@
+"""
+Локальная HTTP/JSON-служба справочников поверх DatabaseManager.
+
+Чтение выполняется пулом потоков, у каждого из которых свое соединение
+только для чтения. Все записи идут через очередь записи (WriteQueue):
+запросы, пришедшие почти одновременно, объединяются в одну транзакцию.
+База работает в режиме WAL, чтобы чтение не ждало записи. Служба слушает
+только локальный адрес.
+
+Системные поля (id, created_at, updated_at, is_deleted) в теле POST и PATCH
+отклоняются с кодом 400: их заполняет DatabaseManager, а удаление идет
+только через DELETE и soft_delete с проверкой ссылок.
+
+Маршруты:
+    GET    /health
+    GET    /meta                                  справочники и поля (ETag)
+    GET    /tables/<таблица>/records?поле=знач&limit=&offset=
+    GET    /tables/<таблица>/records/<id>
+    GET    /tables/<таблица>/reference_values?prefix=&limit=
+    POST   /tables/<таблица>/records              запись или список записей (атомарно)
+    PATCH  /tables/<таблица>/records/<id>
+    DELETE /tables/<таблица>/records/<id>
+    POST   /tables/<таблица>/soft_delete          {"ids": [...]}
+    POST   /tables/<таблица>/update_where         {"filters": {...}, "changes": {...}}
+
+Запуск: python -m lab2.service --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+from lab2.database.db_manager import DatabaseManager
+from lab2.database.integrity import DeleteBlockedError
+from lab2.database.validation import SYSTEM_FIELDS, RecordValidationError
+from lab2.database.write_queue import WriteQueue
+
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+# Наибольший размер тела запроса, байт
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# Сколько ждать, пока каждый поток пула чтения закроет свое соединение, с
+READER_CLOSE_TIMEOUT = 5.0
+
+STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 304: 'Not Modified', 400: 'Bad Request',
+    404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict',
+    413: 'Payload Too Large', 500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+    """Ошибка, которая возвращается клиенту с кодом status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ReferenceService:
+    """HTTP-служба: разбор запросов, пул чтения и очередь записи"""
+
+    def __init__(self, db_path: Path, readers: int = 4):
+        self.db_path = db_path
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='lab2-reader')
+        self._reader_count = readers
+        self._local = threading.local()
+        self.writer: Optional[WriteQueue] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> int:
+        """Запускает службу и возвращает фактический порт"""
+        if host not in LOCAL_HOSTS:
+            raise ValueError(f"Служба работает только на локальном адресе, а не на {host}")
+        loop = asyncio.get_running_loop()
+        self.writer = await loop.run_in_executor(None, WriteQueue, self.db_path)
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        await self._close_readers()
+        self.readers.shutdown()
+        if self.writer:
+            await asyncio.get_running_loop().run_in_executor(None, self.writer.close)
+
+    async def _close_readers(self):
+        """Закрывает соединения пула чтения - каждое в потоке, который его открыл"""
+        # Задача ждет остальных на барьере, поэтому каждая выполняется в своем потоке
+        barrier = threading.Barrier(self._reader_count)
+
+        def close_own():
+            db = getattr(self._local, 'db', None)
+            if db is not None:
+                db.close()
+                self._local.db = None
+            try:
+                barrier.wait(READER_CLOSE_TIMEOUT)
+            except threading.BrokenBarrierError:
+                pass
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.readers, close_own) for _ in range(self._reader_count)
+        ))
+
+    def _reader(self) -> DatabaseManager:
+        """Соединение только для чтения, свое у каждого потока пула"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = DatabaseManager(self.db_path, read_only=True)
+        return db
+
+    async def _write(self, operation: Callable[[DatabaseManager], Any]) -> Any:
+        """Выполняет операцию через очередь записи и ждет фиксации"""
+        return await asyncio.wrap_future(self.writer.submit(operation))
+    
+    async def _read(self, operation: Callable[[DatabaseManager], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.readers, lambda: operation(self._reader()))
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Неверная строка запроса'})
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Неверный заголовок Content-Length'})
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {'error': 'Слишком большой запрос'})
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload, extra = await self._dispatch(method, target, headers, body)
+                await self._respond(writer, status, payload, extra)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except ValueError:
+            # Строка заголовка длиннее лимита StreamReader
+            try:
+                await self._respond(writer, 400, {'error': 'Слишком длинная строка заголовка'})
+            except ConnectionError:
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status: int, payload: Any, extra: Optional[Dict[str, str]] = None):
+        body = b'' if status == 304 else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+        ]
+        head += [f"{name}: {value}" for name, value in (extra or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        """Выполняет запрос и возвращает (код, ответ, доп. заголовки)"""
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/') if part]
+        query = dict(parse_qsl(url.query))
+        try:
+            data = json.loads(body) if body else None
+            return await self._route(method, parts, query, headers, data)
+        except HTTPError as e:
+            return e.status, {'error': str(e)}, None
+        except RecordValidationError as e:
+            return 400, {'error': str(e), 'errors': e.errors}, None
+        except DeleteBlockedError as e:
+            return 409, {'error': str(e), 'blockers': e.blockers}, None
+        except sqlite3.IntegrityError as e:
+            return 409, {'error': str(e)}, None
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': str(e)}, None
+        except Exception as e:
+            return 500, {'error': str(e)}, None
+
+    async def _route(self, method: str, parts: List[str], query: Dict[str, str], headers, data):
+        if parts == ['health']:
+            return 200, {'status': 'ok', 'writer': self.writer.stats}, None
+
+        if parts == ['meta']:
+            return await self._meta(headers)
+
+        if len(parts) < 3 or parts[0] != 'tables':
+            raise HTTPError(404, "Маршрут не найден")
+        table_name, resource = parts[1], parts[2]
+        record_id = parts[3] if len(parts) > 3 else None
+        await self._read(lambda db: self._check_table(db, table_name))
+
+        if resource == 'records' and record_id is None:
+            if method == 'GET':
+                limit = int(query.pop('limit', 100))
+                offset = int(query.pop('offset', 0))
+                rows = await self._read(lambda db: db.find_records(table_name, query, limit, offset))
+                return 200, rows, None
+            if method == 'POST':
+                records = await self._validated(
+                    table_name, data if isinstance(data, list) else [data]
+                )
+                # Список записей сохраняется целиком или не сохраняется совсем
+                ids = await self._write(lambda db: db.insert_records(table_name, records))
+                return 201, ids if isinstance(data, list) else {'id': ids[0]}, None
+
+        elif resource == 'records':
+            if method == 'GET':
+                row = await self._read(lambda db: db.get_record_by_id(table_name, record_id))
+                if row is None:
+                    raise HTTPError(404, "Запись не найдена")
+                return 200, row, None
+            if method == 'PATCH':
+                data = (await self._validated(table_name, [data], partial=True))[0]
+                await self._write(lambda db: db.update_record(table_name, record_id, dict(data)))
+                return 200, {'id': record_id}, None
+            if method == 'DELETE':
+                count = await self._write(lambda db: db.soft_delete_many(table_name, [record_id]))
+                return 200, {'deleted': count}, None
+
+        elif resource == 'reference_values' and method == 'GET':
+            prefix, limit = query.get('prefix', ''), int(query.get('limit', 50))
+            values = await self._read(lambda db: db.search_reference_values(table_name, prefix, limit))
+            return 200, [{'id': value_id, 'name': name} for value_id, name in values], None
+
+        elif resource == 'soft_delete' and method == 'POST':
+            count = await self._write(lambda db: db.soft_delete_many(table_name, data['ids']))
+            return 200, {'deleted': count}, None
+
+        elif resource == 'update_where' and method == 'POST':
+            changes = (await self._validated(table_name, [data['changes']], partial=True))[0]
+            count = await self._write(
+                lambda db: db.update_where(table_name, data['filters'], changes)
+            )
+            return 200, {'updated': count}, None
+
+        else:
+            raise HTTPError(404, "Маршрут не найден")
+
+        raise HTTPError(405, f"Метод {method} не поддерживается")
+
+    async def _validated(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]],
+        partial: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Проверяет записи в пуле чтения; возвращает их с приведенными значениями"""
+        for record in records:
+            if not isinstance(record, dict):
+                raise HTTPError(400, "Запись должна быть JSON-объектом")
+            system = [name for name in record if name in SYSTEM_FIELDS]
+            if system:
+                raise HTTPError(400, f"Системные поля задавать нельзя: {', '.join(system)}")
+        report = await self._read(lambda db: db.validate_records(table_name, records, partial=partial))
+        if report['errors']:
+            raise RecordValidationError(report['errors'])
+        return report['records']
+    
+    async def _meta(self, headers: Dict[str, str]):
+        """Метаданные с ETag по версии метаданных"""
+        version = await self._read(lambda db: db.get_metadata_version())
+        etag = f'"meta-{version}"'
+        if headers.get('if-none-match') == etag:
+            return 304, None, {'ETag': etag}
+
+        def load(db: DatabaseManager):
+            return [
+                dict(d, fields=db.get_dictionary_fields(d['id'])) for d in db.get_dictionaries()
+            ]
+        return 200, {'version': version, 'dictionaries': await self._read(load)}, {'ETag': etag}
+
+    @staticmethod
+    def _check_table(db: DatabaseManager, table_name: str):
+        # Имя таблицы подставляется в SQL, поэтому допускаются только справочники
+        if not db.get_dictionary_by_name(table_name):
+            raise HTTPError(404, f"Справочник '{table_name}' не найден")
+
+
+async def serve(db_path: Path, host: str, port: int, readers: int):
+    service = ReferenceService(db_path, readers)
+    actual_port = await service.start(host, port)
+    print(f"✅ Служба справочников: http://{host}:{actual_port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+
+
+def main():
+    """Запуск службы из командной строки"""
+    parser = argparse.ArgumentParser(description="Локальная HTTP-служба справочников")
+    parser.add_argument('--db', type=Path, default=Path(__file__).parent / 'data' / 'business.db')
+    parser.add_argument('--host', default='127.0.0.1', choices=LOCAL_HOSTS)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.readers))
+    except KeyboardInterrupt:
+        print("✅ Служба остановлена")
+
+
+if __name__ == "__main__":
+    main()
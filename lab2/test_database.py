@@ -0,0 +1,1377 @@
+# test_database.py
+import asyncio
+import json
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import date, datetime
+from pathlib import Path
+
+from lab2.benchmark import run_benchmark
+from lab2.database.columnar import export_columns
+from lab2.database.db_manager import SCHEMA_VERSION, DatabaseManager
+from lab2.database.generator import generate_data, iter_rows, parse_sizes
+from lab2.database.instrumentation import QueryProfiler
+from lab2.database.integrity import DeleteBlockedError
+from lab2.database.records import record_class, to_dict, to_dicts
+from lab2.database.statistics import (
+    collect_table_statistics, estimate_distinct, maintenance_due, open_connection, run_maintenance
+)
+from lab2.database.validation import RecordValidationError, compile_validator, parse_date
+from lab2.database.write_queue import WriteQueue
+from lab2.service import ReferenceService
+from lab2.ui.profiler import UIProfiler
+from lab2.ui.table_view import SortedKeys, sort_key, use_paged_loading
+
+MINSK_ID = 'e6b4a5b0-1234-4a5b-9c6d-7e8f9a0b1c2d'
+
+
+def enterprise_record(**values) -> dict:
+    """Предприятие со всеми обязательными полями"""
+    record = {
+        'name': 'Завод', 'city_id': MINSK_ID, 'industry_type': 'Машиностроение',
+        'employee_count': 100, 'annual_revenue': 1000.0, 'foundation_year': 2000,
+        'is_state_owned': 0, 'address': 'ул. Заводская, 1',
+    }
+    record.update(values)
+    return record
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Каждый тест работает со своей временной базой с начальными данными"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self._tmp.name) / 'business.db'
+        self.db = DatabaseManager(self.db_path)
+
+    def tearDown(self):
+        self.db.close()
+        self._tmp.cleanup()
+
+    def add_enterprise(self, **values) -> str:
+        return self.db.insert_record('IndustrialEnterprises', enterprise_record(**values))
+
+    def reopen(self, **options):
+        self.db.close()
+        self.db = DatabaseManager(self.db_path, **options)
+
+
+class AggregateTests(DatabaseTestCase):
+    """Группировка и агрегаты по справочнику в SQL"""
+
+    def test_group_by_reference_with_display(self):
+        rows = self.db.aggregate('IndustrialEnterprises', 'city_id', {'employee_count': ['sum', 'avg', 'max']})
+        by_city = {row['city_id_display']: row for row in rows}
+        self.assertEqual(set(by_city), {'Минск', 'Гомель', 'Брест'})
+        minsk = by_city['Минск']
+        self.assertEqual((minsk['city_id'], minsk['count']), (MINSK_ID, 3))
+        self.assertEqual(minsk['sum_employee_count'], 18000 + 16500 + 2500)
+        self.assertEqual(minsk['avg_employee_count'], (18000 + 16500 + 2500) / 3)
+        self.assertEqual(minsk['max_employee_count'], 18000)
+
+    def test_group_by_field_of_referenced_table(self):
+        rows = self.db.aggregate('IndustrialEnterprises', ['city_id.region', 'industry_type'], {'employee_count': 'sum'})
+        keys = [(row['city_id.region'], row['industry_type'], row['count']) for row in rows]
+        self.assertIn(('Минская', 'Машиностроение', 2), keys)
+        self.assertEqual(keys, sorted(keys))
+
+    def test_deleted_records_are_excluded(self):
+        record_id = self.add_enterprise(employee_count=5)
+        self.db.soft_delete_record('IndustrialEnterprises', record_id)
+        total = self.db.aggregate('IndustrialEnterprises', aggregates={'employee_count': 'sum'})[0]
+        with_deleted = self.db.aggregate(
+            'IndustrialEnterprises', aggregates={'employee_count': 'sum'}, include_deleted=True
+        )[0]
+        self.assertEqual(with_deleted['sum_employee_count'] - total['sum_employee_count'], 5)
+        self.assertEqual(with_deleted['count'] - total['count'], 1)
+
+    def test_cache_is_invalidated_by_writes(self):
+        query = ('IndustrialEnterprises', 'city_id', {'employee_count': 'sum'})
+        first = self.db.aggregate(*query, use_cache=True)
+        first[0]['count'] = -1
+        self.assertNotEqual(self.db.aggregate(*query, use_cache=True)[0]['count'], -1)
+
+        self.add_enterprise(employee_count=1)
+        minsk = next(row for row in self.db.aggregate(*query, use_cache=True) if row['city_id'] == MINSK_ID)
+        self.assertEqual(minsk['count'], 4)
+
+        # Изменение связанного справочника тоже сбрасывает кэш: подписи берутся из него
+        self.db.update_record('Cities', MINSK_ID, {'name': 'Мінск'})
+        labels = {row['city_id_display'] for row in self.db.aggregate(*query, use_cache=True)}
+        self.assertIn('Мінск', labels)
+
+    def test_invalid_arguments(self):
+        for group_by, aggregates in (
+            ('нет_поля', {}),
+            ('name.region', {}),
+            ('city_id.нет_поля', {}),
+            (None, {'name': 'sum'}),
+            (None, {'employee_count': 'median'}),
+        ):
+            with self.assertRaises(ValueError):
+                self.db.aggregate('IndustrialEnterprises', group_by, aggregates)
+
+
+class StartupTests(DatabaseTestCase):
+    """Схема и начальные данные загружаются, только если устарел user_version"""
+
+    GRODNO_ID = 'c3d4e5f6-5678-8f9a-0b1c-2d3e4f5a6b7c'
+
+    def grodno_exists(self) -> bool:
+        return self.db.conn.execute("SELECT 1 FROM Cities WHERE id = ?", (self.GRODNO_ID,)).fetchone() is not None
+
+    def test_current_version_skips_schema_and_seed(self):
+        self.assertEqual(self.db.get_schema_version(), SCHEMA_VERSION)
+        self.db.conn.execute("DELETE FROM Cities WHERE id = ?", (self.GRODNO_ID,))
+        self.db.conn.commit()
+
+        self.reopen()
+        self.assertFalse(self.grodno_exists())
+
+    def test_outdated_version_replays_schema(self):
+        self.db.conn.execute("DELETE FROM Cities WHERE id = ?", (self.GRODNO_ID,))
+        self.db.conn.execute("PRAGMA user_version = 1")
+        self.db.conn.commit()
+
+        self.reopen()
+        self.assertTrue(self.grodno_exists())
+        self.assertEqual(self.db.get_schema_version(), SCHEMA_VERSION)
+
+
+class SummaryTests(DatabaseTestCase):
+    """aggregate() по сводной таблице совпадает с запросом к справочнику"""
+
+    AGGREGATES = {'employee_count': ['sum', 'avg'], 'branch_count': ['sum', 'avg']}
+    SUMMARY = 'IndustrialEnterprises_by_contact_person'
+
+    def setUp(self):
+        super().setUp()
+        # Числовое поле, допускающее NULL
+        self.db.add_dictionary_field({
+            'dictionary_id': 'enterprises_dict', 'field_name': 'branch_count',
+            'display_name': 'Филиалов', 'data_type': 'INTEGER',
+        })
+        self.add_enterprise(contact_person=None, branch_count=None, employee_count=34500)
+        self.add_enterprise(contact_person=None, branch_count=3)
+        self.add_enterprise(contact_person='', branch_count=None)
+        self.db.add_summary_table('IndustrialEnterprises', 'contact_person', ['employee_count', 'branch_count'])
+
+    def sql_aggregate(self):
+        """Тот же результат обычным запросом к справочнику"""
+        cursor = self.db.conn.execute("""
+            SELECT contact_person, COUNT(*) AS count,
+                   SUM(employee_count) AS sum_employee_count, AVG(employee_count) AS avg_employee_count,
+                   SUM(branch_count) AS sum_branch_count, AVG(branch_count) AS avg_branch_count
+            FROM IndustrialEnterprises WHERE is_deleted = 0
+            GROUP BY contact_person ORDER BY contact_person
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def traced_aggregate(self):
+        """aggregate() и выполненные им запросы"""
+        statements = []
+        self.db.conn.set_trace_callback(statements.append)
+        try:
+            rows = self.db.aggregate('IndustrialEnterprises', 'contact_person', self.AGGREGATES)
+        finally:
+            self.db.conn.set_trace_callback(None)
+        return rows, statements
+
+    def assert_matches_sql(self):
+        actual, statements = self.traced_aggregate()
+        self.assertTrue(any(self.SUMMARY in sql for sql in statements))
+        expected = self.sql_aggregate()
+        self.assertEqual(actual, expected)
+        for row_actual, row_expected in zip(actual, expected):
+            for key, value in row_expected.items():
+                self.assertIs(type(row_actual[key]), type(value), key)
+
+    def test_initial_fill_matches_sql(self):
+        self.assertIn(self.SUMMARY, [summary['summary_name'] for summary in self.db.get_summaries()])
+        self.assert_matches_sql()
+
+    def test_null_group_and_integer_sum(self):
+        rows = {row['contact_person']: row for row in self.db.aggregate(
+            'IndustrialEnterprises', 'contact_person', self.AGGREGATES
+        )}
+        self.assertIn(None, rows)
+        self.assertIn('', rows)
+        self.assertEqual(rows[None]['sum_employee_count'], 34600)
+        self.assertIsInstance(rows[None]['sum_employee_count'], int)
+        # Среднее считается по непустым значениям
+        self.assertEqual(rows[None]['avg_branch_count'], 3.0)
+        self.assertIsNone(rows['']['sum_branch_count'])
+        self.assertIsNone(rows['']['avg_branch_count'])
+
+    def test_triggers_keep_summary_in_sync(self):
+        record_id = self.add_enterprise(contact_person=None, branch_count=7)
+        self.assert_matches_sql()
+        self.db.update_record('IndustrialEnterprises', record_id, {'contact_person': 'Иванов'})
+        self.assert_matches_sql()
+        self.db.update_record('IndustrialEnterprises', record_id, {'branch_count': None})
+        self.assert_matches_sql()
+        self.db.soft_delete_record('IndustrialEnterprises', record_id)
+        self.assert_matches_sql()
+
+
+class DisplayRowsTests(DatabaseTestCase):
+    """Строки для таблицы интерфейса"""
+
+    FIELDS = [
+        {'field_name': 'name', 'data_type': 'TEXT'},
+        {'field_name': 'city_id', 'data_type': 'FOREIGN_KEY', 'reference_to': 'Cities'},
+    ]
+
+    def test_reference_replaced_by_name(self):
+        rows = self.db.get_display_rows('IndustrialEnterprises', self.FIELDS)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({row[2] for row in rows}, {'Минск', 'Гомель', 'Брест'})
+        record_id = rows[0][0]
+        self.assertEqual(
+            self.db.get_display_rows('IndustrialEnterprises', self.FIELDS, where={'id': record_id}),
+            [rows[0]]
+        )
+
+    def test_pages_do_not_hold_read_lock(self):
+        for i in range(20):
+            self.add_enterprise(name=f'Завод {i}')
+        expected = self.db.get_display_rows('IndustrialEnterprises', self.FIELDS)
+
+        pages = self.db.iter_display_rows('IndustrialEnterprises', self.FIELDS, page_size=4)
+        loaded = list(next(pages))
+        # Между страницами другое соединение пишет без ожидания блокировки
+        writer = sqlite3.connect(self.db_path, timeout=0)
+        try:
+            writer.execute("UPDATE Cities SET population = population + 1")
+            writer.commit()
+        finally:
+            writer.close()
+        for page in pages:
+            self.assertLessEqual(len(page), 4)
+            loaded.extend(page)
+
+        self.assertEqual(len(loaded), len(expected))
+        self.assertEqual(set(loaded), set(expected))
+
+
+class SortedKeysTests(unittest.TestCase):
+    """Точечные изменения отсортированной таблицы"""
+
+    def apply(self, shown, keys, operations):
+        # shown - строки (iid, ключ) в порядке показа, как в Treeview
+        for operation, iid, key in operations:
+            if operation != 'insert':
+                index = [row[0] for row in shown].index(iid)
+                keys.remove(index)
+                del shown[index]
+            if operation != 'delete':
+                shown.insert(keys.insert(key), (iid, key))
+        return shown
+
+    def test_positions_follow_sort_in_both_directions(self):
+        operations = [
+            ('insert', 'e', 5.0), ('update', 'a', 7.0), ('insert', 'f', 2.0),
+            ('delete', 'c', None), ('update', 'e', 0.0), ('insert', 'g', 7.0),
+        ]
+        for reverse in (False, True):
+            shown = sorted([('a', 1.0), ('b', 2.0), ('c', 3.0), ('d', 4.0)],
+                           key=lambda row: row[1], reverse=reverse)
+            keys = SortedKeys([key for _, key in shown], reverse)
+
+            shown = self.apply(shown, keys, operations)
+
+            self.assertEqual(keys.keys, [key for _, key in shown])
+            self.assertEqual(keys.keys, sorted(keys.keys, reverse=reverse))
+            self.assertEqual({iid for iid, _ in shown}, {'a', 'b', 'd', 'e', 'f', 'g'})
+
+    def test_equal_keys_keep_insertion_order(self):
+        for reverse in (False, True):
+            shown = [('a', 1.0), ('b', 1.0)]
+            keys = SortedKeys([1.0, 1.0], reverse)
+            shown = self.apply(shown, keys, [('insert', 'c', 1.0), ('update', 'a', 1.0)])
+            self.assertEqual([iid for iid, _ in shown], ['b', 'c', 'a'])
+
+    def test_sort_key_by_type(self):
+        self.assertLess(sort_key('REAL', '9,50'), sort_key('REAL', '1 000,00'))
+        self.assertLess(sort_key('DATE', '31.12.1999'), sort_key('DATE', '01.01.2000'))
+        self.assertEqual(sort_key('TEXT', 'Минск'), sort_key('TEXT', 'минск'))
+
+
+class StatisticsTests(DatabaseTestCase):
+    """Статистика таблиц и выбор постраничной загрузки"""
+
+    GRODNO_ID = 'c3d4e5f6-5678-8f9a-0b1c-2d3e4f5a6b7c'
+
+    def test_estimate_distinct(self):
+        self.assertEqual(estimate_distinct([], 100), 0)
+        # Все значения выборки различны - различных столько же, сколько записей
+        self.assertEqual(estimate_distinct(list(range(100)), 1000), 1000)
+        # Все повторяются - в таблице те же значения, что и в выборке
+        self.assertEqual(estimate_distinct([1, 1, 2, 2, 3, 3], 1000), 3)
+        estimate = estimate_distinct([1, 1, 2, 3, 4], 50)
+        self.assertGreater(estimate, 4)
+        self.assertLess(estimate, 50)
+
+    def test_collect_table_statistics(self):
+        self.db.soft_delete_record('Cities', self.GRODNO_ID)
+        self.db.conn.execute("UPDATE Cities SET description = NULL")
+        self.db.conn.execute("UPDATE Cities SET description = 'Столица' WHERE id = ?", (MINSK_ID,))
+        self.db.conn.commit()
+
+        stats = collect_table_statistics(self.db.conn, 'Cities')
+        self.assertEqual((stats['row_count'], stats['live_count']), (5, 4))
+        self.assertEqual(stats['fields']['name']['distinct_estimate'], 4)
+        self.assertEqual(stats['fields']['name']['null_fraction'], 0.0)
+        self.assertEqual(stats['fields']['description']['null_fraction'], 0.75)
+        self.assertEqual(stats['fields']['description']['distinct_estimate'], 1)
+
+    def test_maintenance_on_plain_connection(self):
+        # Фоновое обслуживание приложения: свое соединение, таблица в шарде
+        self.db.move_dictionary('IndustrialEnterprises', 'enterprises.db')
+        conn = open_connection(self.db_path)
+        try:
+            self.assertTrue(maintenance_due(conn))
+            report = run_maintenance(conn)
+            self.assertFalse(maintenance_due(conn))
+        finally:
+            conn.close()
+
+        self.assertEqual(set(report['tables']), {'Cities', 'IndustrialEnterprises'})
+        self.assertEqual(self.db.get_table_statistics('IndustrialEnterprises')['live_count'], 5)
+
+    def test_paged_loading_decision(self):
+        # Без статистики - наибольший rowid
+        self.assertTrue(use_paged_loading(self.db, 'IndustrialEnterprises', limit=4))
+        self.assertFalse(use_paged_loading(self.db, 'IndustrialEnterprises', limit=5))
+
+        record_id = self.add_enterprise()
+        self.db.soft_delete_record('IndustrialEnterprises', record_id)
+        self.db.run_maintenance(analyze=False)
+        # Со статистикой - число живых записей, без просмотра таблицы
+        self.add_enterprise()
+        self.assertFalse(use_paged_loading(self.db, 'IndustrialEnterprises', limit=5))
+        self.assertTrue(use_paged_loading(self.db, 'IndustrialEnterprises', limit=4))
+
+
+class ShardTests(DatabaseTestCase):
+    """Перенос справочника в отдельный файл и обратно"""
+
+    def tables_in(self, schema: str) -> set:
+        return {
+            row[0] for row in self.db.conn.execute(
+                f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'"
+            )
+        }
+
+    def test_move_to_shard_and_back(self):
+        report = self.db.move_dictionary('IndustrialEnterprises', 'shards/enterprises.db')
+        self.assertTrue(report['moved'])
+        self.assertEqual(report['rows'], 5)
+        self.assertTrue((Path(self._tmp.name) / 'shards' / 'enterprises.db').exists())
+        self.assertNotIn('IndustrialEnterprises', self.tables_in('main'))
+        self.assertIn('IndustrialEnterprises', self.tables_in(report['schema']))
+
+        # Соединения и подписи ссылок работают между файлами
+        labels = {
+            row[2] for row in self.db.get_display_rows('IndustrialEnterprises', DisplayRowsTests.FIELDS)
+        }
+        self.assertEqual(labels, {'Минск', 'Гомель', 'Брест'})
+        rows = self.db.aggregate('IndustrialEnterprises', 'city_id', {'employee_count': 'sum'})
+        self.assertEqual(sum(row['count'] for row in rows), 5)
+
+        # FOREIGN KEY между файлами нет: ссылки проверяет integrity
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.add_enterprise(city_id='нет-такого-города')
+        enterprise_id = self.db.get_all_records('IndustrialEnterprises')[0]['id']
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.update_record('IndustrialEnterprises', enterprise_id, {'city_id': 'нет-такого-города'})
+        with self.assertRaises(DeleteBlockedError):
+            self.db.soft_delete_record('Cities', MINSK_ID)
+
+        # Размещение хранится в Dictionary и восстанавливается при открытии
+        record_id = self.add_enterprise(name='Новый завод')
+        self.reopen()
+        self.assertEqual(self.db._schema_of('IndustrialEnterprises'), report['schema'])
+        self.assertEqual(self.db.get_record_by_id('IndustrialEnterprises', record_id)['name'], 'Новый завод')
+
+        back = self.db.move_dictionary('IndustrialEnterprises')
+        self.assertEqual((back['moved'], back['schema'], back['rows']), (True, 'main', 6))
+        self.assertIn('IndustrialEnterprises', self.tables_in('main'))
+        self.assertEqual(self.db._data_schemas(), ['main'])
+        self.assertEqual(len(self.db.get_all_records('IndustrialEnterprises')), 6)
+        self.assertFalse(self.db.move_dictionary('IndustrialEnterprises')['moved'])
+
+    def test_shard_writes_are_logged_in_main_file(self):
+        self.db.move_dictionary('IndustrialEnterprises', 'enterprises.db')
+        self.reopen()
+        record_id = self.add_enterprise()
+        logged = self.db.conn.execute(
+            "SELECT operation FROM main.Change_Log WHERE table_name = 'IndustrialEnterprises' AND record_id = ?",
+            (record_id,)
+        ).fetchall()
+        self.assertEqual([row[0] for row in logged], ['insert'])
+
+    def test_backup_copies_shard_files(self):
+        self.db.move_dictionary('IndustrialEnterprises', 'enterprises.db')
+        dest = Path(self._tmp.name) / 'backup' / 'business.db'
+        report = self.db.backup(dest, pause=0)
+        self.assertEqual(set(report['shards']), {'enterprises.db'})
+        self.assertTrue((dest.parent / 'enterprises.db').exists())
+
+        copy = DatabaseManager(dest, read_only=True)
+        try:
+            self.assertEqual(len(copy.get_all_records('IndustrialEnterprises')), 5)
+        finally:
+            copy.close()
+
+    def test_invalid_moves(self):
+        with self.assertRaises(ValueError):
+            self.db.move_dictionary('NoSuchTable', 'x.db')
+        with self.assertRaises(ValueError):
+            self.db.move_dictionary('Cities', str(Path(self._tmp.name).resolve() / 'cities.db'))
+        self.assertFalse(self.db.move_dictionary('Cities')['moved'])
+
+
+class HistoryTests(DatabaseTestCase):
+    """Состояние справочника на момент времени"""
+
+    def moment(self) -> datetime:
+        # Версии различаются по времени с точностью до миллисекунды
+        time.sleep(0.005)
+        moment = datetime.now()
+        time.sleep(0.005)
+        return moment
+
+    def history_triggers(self) -> set:
+        return {
+            row[0] for row in self.db.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'hist_%'"
+            )
+        }
+
+    def test_as_of_returns_versions(self):
+        before_insert = self.moment()
+        record_id = self.add_enterprise(name='Старое имя')
+        after_insert = self.moment()
+        self.db.update_record('IndustrialEnterprises', record_id, {'name': 'Новое имя'})
+        after_update = self.moment()
+        self.db.soft_delete_record('IndustrialEnterprises', record_id)
+
+        def name_at(moment, **options):
+            records = self.db.as_of('IndustrialEnterprises', moment, record_id, **options)
+            return [record['name'] for record in records]
+
+        self.assertEqual(name_at(before_insert), [])
+        self.assertEqual(name_at(after_insert), ['Старое имя'])
+        self.assertEqual(name_at(after_update.isoformat()), ['Новое имя'])
+        self.assertEqual(name_at(datetime.now()), [])
+        self.assertEqual(name_at(datetime.now(), include_deleted=True), ['Новое имя'])
+        # Дата без времени - состояние на конец дня
+        self.assertEqual(name_at(date.today(), include_deleted=True), ['Новое имя'])
+
+        everything = self.db.as_of('IndustrialEnterprises', after_update)
+        self.assertEqual(len(everything), 6)
+        self.assertEqual([r['id'] for r in everything], sorted(r['id'] for r in everything))
+        versions = self.db.get_record_history('IndustrialEnterprises', record_id)
+        self.assertEqual([v['is_deleted'] for v in versions], [0, 0, 1])
+        self.assertEqual(versions[0]['valid_to'], versions[1]['valid_from'])
+
+    def test_history_can_be_disabled_per_dictionary(self):
+        self.db.set_history_enabled('Cities', False)
+        self.assertEqual(self.history_triggers(), {
+            f"hist_IndustrialEnterprises_{op}" for op in ('insert', 'update', 'delete')
+        })
+        with self.assertRaises(ValueError):
+            self.db.as_of('Cities', datetime.now())
+
+        # Отключение хранится в метаданных и действует после открытия базы
+        self.reopen()
+        self.assertNotIn('hist_Cities_update', self.history_triggers())
+        self.db.update_record('Cities', MINSK_ID, {'population': 1})
+        self.assertEqual(len(self.db.conn.execute(
+            "SELECT 1 FROM Cities_History WHERE id = ?", (MINSK_ID,)
+        ).fetchall()), 1)
+
+        # После включения действующие версии догоняют таблицу
+        self.db.set_history_enabled('Cities', True)
+        self.assertIn('hist_Cities_update', self.history_triggers())
+        current = self.db.as_of('Cities', datetime.now())
+        self.assertEqual(len(current), 5)
+        self.assertEqual(next(c for c in current if c['id'] == MINSK_ID)['population'], 1)
+        versions = self.db.get_record_history('Cities', MINSK_ID)
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(versions[0]['valid_to'], versions[1]['valid_from'])
+        # Неизмененные записи новую версию не получают
+        self.assertEqual(len(self.db.conn.execute("SELECT 1 FROM Cities_History").fetchall()), 6)
+
+    def test_unknown_dictionary(self):
+        with self.assertRaises(ValueError):
+            self.db.set_history_enabled('NoSuchTable', False)
+        with self.assertRaises(ValueError):
+            self.db.as_of('NoSuchTable', datetime.now())
+
+
+class MigrationTests(DatabaseTestCase):
+    """Пересборка таблицы сохраняет ограничения колонок"""
+
+    def table_info(self, table_name):
+        return {row['name']: row for row in self.db.conn.execute(f"PRAGMA table_info({table_name})")}
+
+    def test_rebuild_keeps_constraints(self):
+        before = self.table_info('IndustrialEnterprises')
+        self.db.conn.execute(
+            "UPDATE Dictionary_Fields SET data_type = 'REAL' "
+            "WHERE dictionary_id = 'enterprises_dict' AND field_name = 'employee_count'"
+        )
+        self.db.conn.commit()
+        plan = self.db.migrate()
+        self.assertEqual([step['operation'] for step in plan], ['rebuild'])
+
+        after = self.table_info('IndustrialEnterprises')
+        self.assertEqual(after['employee_count']['type'], 'REAL')
+        for name in ('name', 'city_id', 'address', 'is_state_owned', 'email'):
+            self.assertEqual(after[name]['notnull'], before[name]['notnull'], name)
+            self.assertEqual(after[name]['dflt_value'], before[name]['dflt_value'], name)
+        foreign_keys = self.db.conn.execute("PRAGMA foreign_key_list(IndustrialEnterprises)").fetchall()
+        self.assertEqual([(row['table'], row['on_delete']) for row in foreign_keys], [('Cities', 'RESTRICT')])
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.add_enterprise(name=None)
+
+
+class CompactionTests(DatabaseTestCase):
+    """Архивирование старых мягко удаленных записей"""
+
+    def setUp(self):
+        super().setUp()
+        self.archive_path = Path(self._tmp.name) / 'archive.db'
+        self.city_id = self.db.insert_record('Cities', {
+            'name': 'Лида', 'region': 'Гродненская', 'population': 100000, 'area': 30.0,
+        })
+
+    def delete_long_ago(self, table_name, record_id):
+        self.db.soft_delete_record(table_name, record_id)
+        self.db.conn.execute(f"UPDATE {table_name} SET updated_at = '2000-01-01' WHERE id = ?", (record_id,))
+        self.db.conn.commit()
+
+    def compact(self, **options):
+        return self.db.compact_deleted(retention_days=30, archive_path=self.archive_path, **options)
+
+    def ids(self, table_name, path=None):
+        conn = sqlite3.connect(path or self.db_path)
+        try:
+            return {row[0] for row in conn.execute(f"SELECT id FROM {table_name}")}
+        finally:
+            conn.close()
+
+    def test_retention_keeps_recent_deletions(self):
+        old_ids = [self.add_enterprise(name=f'Старый {i}') for i in range(5)]
+        recent_id = self.add_enterprise(name='Недавний')
+        for record_id in old_ids:
+            self.delete_long_ago('IndustrialEnterprises', record_id)
+        self.db.soft_delete_record('IndustrialEnterprises', recent_id)
+
+        report = self.compact(batch_size=2)
+
+        self.assertEqual(report['archived']['IndustrialEnterprises'], 5)
+        remaining = self.ids('IndustrialEnterprises')
+        self.assertIn(recent_id, remaining)
+        self.assertFalse(remaining & set(old_ids))
+        archived = sqlite3.connect(self.archive_path)
+        try:
+            rows = archived.execute(
+                "SELECT id, name, is_deleted, archived_at FROM IndustrialEnterprises"
+            ).fetchall()
+        finally:
+            archived.close()
+        self.assertEqual({row[0] for row in rows}, set(old_ids))
+        self.assertTrue(all(row[2] == 1 and row[3] for row in rows))
+
+    def test_referenced_record_is_skipped(self):
+        # Ссылка на уже удаленный город, как ее может принести синхронизация
+        enterprise_id = self.add_enterprise(name='Лидский завод')
+        self.delete_long_ago('Cities', self.city_id)
+        self.db.conn.execute(
+            "UPDATE IndustrialEnterprises SET city_id = ? WHERE id = ?", (self.city_id, enterprise_id)
+        )
+        self.db.conn.commit()
+
+        report = self.compact()
+        self.assertEqual(report['archived']['Cities'], 0)
+        self.assertEqual(report['skipped']['Cities'], 1)
+        self.assertIn(self.city_id, self.ids('Cities'))
+
+        # Предприятие уходит в архив в том же проходе и освобождает город
+        self.delete_long_ago('IndustrialEnterprises', enterprise_id)
+        report = self.compact()
+        self.assertEqual(report['archived'], {'IndustrialEnterprises': 1, 'Cities': 1})
+        self.assertEqual(report['skipped']['Cities'], 0)
+        self.assertNotIn(self.city_id, self.ids('Cities'))
+        self.assertEqual(self.ids('Cities', self.archive_path), {self.city_id})
+
+    def test_vacuum_conversion_is_opt_in(self):
+        # База, созданная до перехода на INCREMENTAL
+        self.db.conn.execute("PRAGMA auto_vacuum = NONE")
+        self.db.conn.execute("VACUUM")
+        self.delete_long_ago('Cities', self.city_id)
+        mode = self.db.conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        self.assertEqual(mode, 0)
+
+        report = self.compact()
+        self.assertEqual(report['vacuum']['main'], 'skipped')
+        self.assertEqual(report['pages_reclaimed'], 0)
+        self.assertEqual(self.db.conn.execute("PRAGMA auto_vacuum").fetchone()[0], mode)
+
+        self.assertEqual(self.compact(convert_auto_vacuum=True)['vacuum']['main'], 'converted')
+        self.assertEqual(self.db.conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertEqual(self.compact()['vacuum']['main'], 'incremental')
+
+
+class SyncTests(DatabaseTestCase):
+    """Обмен изменениями между двумя копиями базы"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = DatabaseManager(Path(self._tmp.name) / 'other.db')
+        self.city_id = self.db.insert_record('Cities', {
+            'name': 'Лида', 'region': 'Гродненская', 'population': 100000, 'area': 30.0,
+        })
+        self.db.sync_with(self.other)
+
+    def tearDown(self):
+        self.other.close()
+        super().tearDown()
+
+    def test_compaction_delete_is_soft_delete_and_conflict_does_not_block(self):
+        # Копия ссылается на город, который в базе удален и архивирован
+        enterprise_id = self.other.insert_record(
+            'IndustrialEnterprises', enterprise_record(name='Лидский завод', city_id=self.city_id)
+        )
+        self.db.soft_delete_record('Cities', self.city_id)
+        self.db.compact_deleted(retention_days=0, archive_path=Path(self._tmp.name) / 'archive.db')
+        self.assertIsNone(self.db.conn.execute(
+            "SELECT id FROM Cities WHERE id = ?", (self.city_id,)
+        ).fetchone())
+
+        report = self.db.sync_with(self.other)
+
+        # Запись копии не прошла внешний ключ базы: конфликт записан, отметка сдвинута
+        self.assertEqual(report['pulled']['conflicts'], 1)
+        conflicts = self.db.conn.execute("SELECT table_name, record_id FROM Sync_Conflicts").fetchall()
+        self.assertEqual([tuple(row) for row in conflicts], [('IndustrialEnterprises', enterprise_id)])
+        # Удаление сжатием применено в копии как мягкое, ссылка на город цела
+        self.assertEqual(report['pushed']['conflicts'], 0)
+        city = self.other.conn.execute(
+            "SELECT is_deleted FROM Cities WHERE id = ?", (self.city_id,)
+        ).fetchone()
+        self.assertEqual(city[0], 1)
+        self.assertEqual(self.other.conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+
+        again = self.db.sync_with(self.other)
+        self.assertEqual(again['pulled'], {'applied': 0, 'skipped': 0, 'conflicts': 0})
+
+    def test_conflict_rolls_back_only_its_change(self):
+        self.other.conn.execute("DELETE FROM Cities WHERE id = ?", (self.city_id,))
+        self.other.conn.commit()
+        self.add_enterprise(name='Без города', city_id=self.city_id)
+        self.add_enterprise(name='Минский')
+
+        report = self.db.sync_with(self.other)
+        self.assertEqual(report['pushed']['conflicts'], 1)
+        names = {row[0] for row in self.other.conn.execute("SELECT name FROM IndustrialEnterprises")}
+        self.assertIn('Минский', names)
+        self.assertNotIn('Без города', names)
+
+    def test_update_round_trip(self):
+        self.other.update_record('Cities', self.city_id, {'population': 101000})
+        report = self.db.sync_with(self.other)
+        self.assertEqual(report['pulled']['applied'], 1)
+        self.assertEqual(self.db.get_record_by_id('Cities', self.city_id)['population'], 101000)
+        count = self.db.conn.execute("SELECT COUNT(*) FROM Cities WHERE id = ?", (self.city_id,)).fetchone()[0]
+        self.assertEqual(count, 1)
+
+    def log_seqs(self, db):
+        return [row[0] for row in db.conn.execute("SELECT seq FROM Change_Log ORDER BY seq")]
+
+    def test_log_pruned_up_to_slowest_peer(self):
+        # После обмена в setUp копия получила весь журнал базы
+        self.assertEqual(self.log_seqs(self.db), [])
+
+        third = DatabaseManager(Path(self._tmp.name) / 'third.db')
+        try:
+            self.db.sync_with(third)
+            self.db.update_record('Cities', self.city_id, {'population': 102000})
+            pending = self.log_seqs(self.db)
+            self.assertEqual(len(pending), 1)
+
+            # Третья копия изменение еще не получила - журнал сохраняется
+            report = self.db.sync_with(self.other)
+            self.assertEqual(report['pruned']['local'], 0)
+            self.assertEqual(self.log_seqs(self.db), pending)
+
+            report = self.db.sync_with(third)
+            self.assertEqual(report['pulled']['applied'] + report['pushed']['applied'], 1)
+            self.assertEqual(report['pruned']['local'], 1)
+            self.assertEqual(self.log_seqs(self.db), [])
+            self.assertEqual(third.get_record_by_id('Cities', self.city_id)['population'], 102000)
+        finally:
+            third.close()
+
+        # Новые изменения после сжатия журнала получают новые seq
+        self.db.update_record('Cities', self.city_id, {'population': 103000})
+        self.assertGreater(self.log_seqs(self.db)[0], pending[0])
+        self.db.sync_with(self.other)
+        self.assertEqual(self.other.get_record_by_id('Cities', self.city_id)['population'], 103000)
+
+
+class BackupTests(DatabaseTestCase):
+    """Онлайн-копия базы"""
+
+    def test_backup_creates_missing_directories(self):
+        for compress in (False, True):
+            dest = Path(self._tmp.name) / 'backups' / str(compress) / 'business.db'
+            report = self.db.backup(dest, compress=compress)
+            self.assertTrue(dest.exists())
+            self.assertGreater(report['pages'], 0)
+
+
+    def test_writes_between_steps_do_not_restart_backup(self):
+        with self.db.batch():
+            for i in range(300):
+                self.add_enterprise(name=f'Завод {i}', address='ул. Длинная, ' + 'д' * 200)
+        before = self.db.conn.execute("SELECT COUNT(*) FROM IndustrialEnterprises").fetchone()[0]
+        writer = sqlite3.connect(self.db_path, timeout=0)
+        steps = []
+
+        def on_progress(status, remaining, total):
+            steps.append(remaining)
+            # Каждый шаг другое соединение пишет в базу без ожидания
+            writer.execute("UPDATE Cities SET population = population + 1")
+            writer.commit()
+
+        dest = Path(self._tmp.name) / 'copy.db'
+        try:
+            report = self.db.backup(dest, pages_per_step=5, progress=on_progress, pause=0)
+        finally:
+            writer.close()
+
+        # Копирование не начиналось заново: остаток только уменьшался
+        self.assertGreater(len(steps), 10)
+        self.assertEqual(steps, sorted(steps, reverse=True))
+        self.assertEqual(steps[-1], 0)
+        self.assertLessEqual(len(steps), report['pages'] // 5 + 1)
+
+        copy = sqlite3.connect(dest)
+        try:
+            self.assertEqual(copy.execute("PRAGMA integrity_check").fetchone()[0], 'ok')
+            count = copy.execute("SELECT COUNT(*) FROM IndustrialEnterprises").fetchone()[0]
+        finally:
+            copy.close()
+        self.assertEqual(count, before)
+
+class ProfilerTests(DatabaseTestCase):
+    """Замер методов и запросов DatabaseManager"""
+
+    FIELDS = [{'field_name': 'name', 'data_type': 'TEXT'}]
+
+    def setUp(self):
+        super().setUp()
+        self.profiler = QueryProfiler()
+        self.reopen(profiler=self.profiler)
+        self.profiler.reset()
+
+    def test_failed_call_is_recorded(self):
+        with self.assertRaises(sqlite3.Error):
+            self.db.get_display_rows('NoSuchTable', self.FIELDS)
+        self.db.get_display_rows('IndustrialEnterprises', self.FIELDS)
+
+        methods = self.profiler.snapshot()['methods']
+        stats = methods['get_display_rows']
+        self.assertEqual((stats['count'], stats['errors'], stats['rows']), (2, 1, 5))
+
+    def test_rows_read_by_iterating_cursor(self):
+        shape = 'SELECT name FROM IndustrialEnterprises'
+        cursor = self.db.conn.execute(shape)
+        names = [row[0] for row in cursor]
+        self.assertEqual(len(names), 5)
+        queries = self.profiler.snapshot()['queries']
+        self.assertEqual((queries[shape]['count'], queries[shape]['rows']), (1, 5))
+
+    def test_generator_method_measured_over_iteration(self):
+        for i in range(10):
+            self.add_enterprise(name=f'Завод {i}')
+        self.profiler.reset()
+
+        pages = self.db.iter_display_rows('IndustrialEnterprises', self.FIELDS, page_size=4)
+        self.assertNotIn('iter_display_rows', self.profiler.snapshot()['methods'])
+        self.assertEqual(sum(len(page) for page in pages), 15)
+        stats = self.profiler.snapshot()['methods']['iter_display_rows']
+        self.assertEqual((stats['count'], stats['errors'], stats['rows']), (1, 0, 15))
+        # Время страниц-запросов входит в замер метода
+        queries = self.profiler.snapshot()['queries']
+        query_ms = sum(q['total_ms'] for shape, q in queries.items() if 'LIMIT' in shape)
+        self.assertGreaterEqual(stats['total_ms'], query_ms)
+
+        # Прерванный обход учитывается без отметки об ошибке
+        pages = self.db.iter_display_rows('IndustrialEnterprises', self.FIELDS, page_size=4)
+        next(pages)
+        pages.close()
+        stats = self.profiler.snapshot()['methods']['iter_display_rows']
+        self.assertEqual((stats['count'], stats['errors'], stats['rows']), (2, 0, 19))
+
+
+class UIProfilerTests(unittest.TestCase):
+    """Замер обработчиков интерфейса без окна Tk"""
+
+    class Widget:
+        # Простой заменитель виджета: after_idle копит обратные вызовы
+        def __init__(self):
+            self.idle = []
+
+        def after_idle(self, callback):
+            self.idle.append(callback)
+
+        def run_idle(self):
+            while self.idle:
+                self.idle.pop(0)()
+
+        def on_click(self, inner=False):
+            if inner:
+                self.on_click()
+            return 'ok'
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.profiler = UIProfiler(Path(self._tmp.name) / 'ui.json', capture_cprofile=True)
+        self.original = self.Widget.__dict__['on_click']
+        self.profiler.install({self.Widget: ['on_click']})
+
+    def tearDown(self):
+        self.profiler.uninstall()
+        self._tmp.cleanup()
+
+    def test_handler_and_stall_are_measured(self):
+        widget = self.Widget()
+        self.assertEqual(widget.on_click(), 'ok')
+        widget.on_click(inner=True)
+        report = self.profiler.report()['handlers']['Widget.on_click']
+        # Вложенный вызов тоже учитывается, задержка - когда Tk простаивает
+        self.assertEqual(report['calls'], 3)
+        self.assertEqual(report['stall']['total_ms'], 0.0)
+        widget.run_idle()
+        report = self.profiler.report()['handlers']['Widget.on_click']
+        self.assertEqual(len(self.profiler.calls['Widget.on_click']['stall']), 3)
+        self.assertGreaterEqual(report['stall']['max_ms'], report['handler']['max_ms'])
+        self.assertTrue(any('on_click' in line for line in report['cprofile']))
+
+        path = self.profiler.save()
+        with open(path, encoding='utf-8') as f:
+            self.assertIn('Widget.on_click', json.load(f)['handlers'])
+
+    def test_uninstall_restores_handlers(self):
+        self.profiler.uninstall()
+        self.assertIs(self.Widget.__dict__['on_click'], self.original)
+        self.Widget().on_click()
+        self.assertEqual(self.profiler.calls, {})
+
+
+class GeneratorTests(DatabaseTestCase):
+    """Синтетические данные и нагрузочный замер"""
+
+    SIZES = {'IndustrialEnterprises': 40, 'Cities': 10}
+
+    def rows(self, db, table_name):
+        columns = 'id, name, city_id' if table_name == 'IndustrialEnterprises' else 'id, name, population'
+        return db.conn.execute(f"SELECT {columns}, created_at FROM {table_name} ORDER BY rowid").fetchall()
+
+    def test_same_seed_gives_same_data(self):
+        other = DatabaseManager(Path(self._tmp.name) / 'other.db')
+        try:
+            report = generate_data(self.db, self.SIZES, seed=7)
+            generate_data(other, self.SIZES, seed=7)
+            self.assertEqual(report['rows'], {'Cities': 10, 'IndustrialEnterprises': 40})
+            for table_name in self.SIZES:
+                self.assertEqual(
+                    [tuple(row) for row in self.rows(self.db, table_name)],
+                    [tuple(row) for row in self.rows(other, table_name)]
+                )
+        finally:
+            other.close()
+
+        different = list(iter_rows(self.db, 'Cities', 3, seed=8))
+        self.assertNotEqual([row['name'] for row in different],
+                            [row['name'] for row in iter_rows(self.db, 'Cities', 3, seed=7)])
+
+    def test_references_point_to_existing_parents(self):
+        generate_data(self.db, self.SIZES, seed=7, batch_size=16)
+        self.assertEqual(self.db.conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+        city_count = self.db.conn.execute("SELECT COUNT(DISTINCT city_id) FROM IndustrialEnterprises").fetchone()[0]
+        self.assertGreater(city_count, 1)
+        # Продолжение генерации не повторяет уже созданные записи
+        generate_data(self.db, {'Cities': 5}, seed=7)
+        ids = [row[0] for row in self.db.conn.execute("SELECT id FROM Cities")]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_parse_sizes(self):
+        self.assertEqual(parse_sizes(['Cities=10', 'IndustrialEnterprises=2000']),
+                         {'Cities': 10, 'IndustrialEnterprises': 2000})
+
+    def test_benchmark_reports_every_operation(self):
+        results = run_benchmark(self.db, repeat=1, inserts=2)
+        for key in ('get_all_records:Cities', 'iter_records:IndustrialEnterprises',
+                    'get_reference_values:Cities', 'render_rows:IndustrialEnterprises',
+                    'sort:IndustrialEnterprises.employee_count', 'insert_record:Cities'):
+            self.assertIn(key, results)
+        self.assertEqual(results['insert_record:Cities']['count'], 2)
+        json.dumps(results)
+
+
+class RecordsTests(DatabaseTestCase):
+    """Поток записей namedtuple вместо словарей"""
+
+    def test_stream_matches_dict_records(self):
+        deleted_id = self.add_enterprise(name='Удаленный')
+        self.db.soft_delete_record('IndustrialEnterprises', deleted_id)
+
+        records = self.db.iter_records('IndustrialEnterprises', batch_size=2)
+        self.assertFalse(isinstance(records, list))
+        as_dicts = sorted(to_dicts(records), key=lambda r: r['id'])
+        expected = sorted(self.db.get_all_records('IndustrialEnterprises'), key=lambda r: r['id'])
+        self.assertEqual(as_dicts, expected)
+
+        with_deleted = list(self.db.iter_records('IndustrialEnterprises', include_deleted=True))
+        self.assertIn(deleted_id, {record.id for record in with_deleted})
+        self.assertEqual(len(with_deleted), len(expected) + 1)
+        # Класс записи строится один раз на набор колонок
+        self.assertIs(type(with_deleted[0]), type(next(self.db.iter_records('IndustrialEnterprises'))))
+
+    def test_keyword_column_names(self):
+        cls = record_class('Odd', ('id', 'class', 'from'))
+        record = cls._make(('a', 'b', 'c'))
+        self.assertEqual(record.id, 'a')
+        self.assertEqual(to_dict(record), {'id': 'a', 'class': 'b', 'from': 'c'})
+
+
+class WriteQueueTests(DatabaseTestCase):
+    """Групповая фиксация операций очереди записи"""
+
+    def setUp(self):
+        super().setUp()
+        self.db.close()
+        self.queue = WriteQueue(self.db_path, max_delay=0.5)
+        self.db = DatabaseManager(self.db_path, read_only=True)
+
+    def tearDown(self):
+        self.queue.close()
+        super().tearDown()
+
+    def test_failed_operation_is_rolled_back_entirely(self):
+        def insert_then_fail(db):
+            db.insert_record('IndustrialEnterprises', enterprise_record(name='Откаченный'))
+            db.insert_record('IndustrialEnterprises', enterprise_record(name='Без города', city_id='нет'))
+
+        failed = self.queue.submit(insert_then_fail)
+        kept = self.queue.submit(
+            lambda db: db.insert_record('IndustrialEnterprises', enterprise_record(name='Сохраненный'))
+        )
+        with self.assertRaises(sqlite3.IntegrityError):
+            failed.result()
+        self.assertTrue(kept.result())
+        self.assertEqual(self.queue.stats['commits'], 1)
+
+        names = {row[0] for row in self.db.conn.execute("SELECT name FROM IndustrialEnterprises")}
+        self.assertIn('Сохраненный', names)
+        self.assertNotIn('Откаченный', names)
+
+
+class BulkUpdateTests(DatabaseTestCase):
+    """Групповое изменение и удаление пачками"""
+
+    def add_many(self, count):
+        with self.db.batch():
+            return [self.add_enterprise(name=f'Завод {i}', employee_count=i) for i in range(count)]
+
+    def test_update_where_batches_long_lists(self):
+        ids = self.add_many(1200)
+        updated = self.db.update_where('IndustrialEnterprises', {'id': ids + ['нет такого']},
+                                       {'employee_count': '7'})
+        self.assertEqual(updated, 1200)
+        counts = self.db.conn.execute(
+            "SELECT employee_count, typeof(employee_count), COUNT(*) FROM IndustrialEnterprises "
+            "WHERE name LIKE 'Завод %' GROUP BY 1, 2"
+        ).fetchall()
+        # Значение приведено к типу поля, как при изменении одной записи
+        self.assertEqual([tuple(row) for row in counts], [(7, 'integer', 1200)])
+
+        # Удаленные записи без явного is_deleted в условиях не меняются
+        self.db.soft_delete_many('IndustrialEnterprises', ids[:600])
+        updated = self.db.update_where('IndustrialEnterprises', {'id': ids}, {'employee_count': 8})
+        self.assertEqual(updated, 600)
+
+    def test_soft_delete_many_batches_long_lists(self):
+        ids = self.add_many(1200)
+        self.assertEqual(self.db.soft_delete_many('IndustrialEnterprises', ids + ids[:10]), 1200)
+        self.assertEqual(self.db.soft_delete_many('IndustrialEnterprises', ids), 0)
+        active = self.db.conn.execute(
+            "SELECT COUNT(*) FROM IndustrialEnterprises WHERE is_deleted = 0"
+        ).fetchone()[0]
+        self.assertEqual(active, 5)
+
+    def test_update_where_rejects_system_fields_and_invalid_values(self):
+        filters = {'city_id': MINSK_ID}
+        for changes in ({'is_deleted': 1}, {'id': 'x'}, {'created_at': '2000-01-01'}):
+            with self.assertRaises(ValueError):
+                self.db.update_where('IndustrialEnterprises', filters, changes)
+        with self.assertRaises(RecordValidationError) as caught:
+            self.db.update_where('IndustrialEnterprises', filters,
+                                 {'employee_count': 'много', 'city_id': 'нет такого'})
+        self.assertEqual({error['code'] for error in caught.exception.errors}, {'type', 'reference'})
+        with self.assertRaises(RecordValidationError):
+            self.db.update_where('IndustrialEnterprises', filters, {'name': ''})
+
+        active = self.db.conn.execute(
+            "SELECT COUNT(*) FROM IndustrialEnterprises WHERE city_id = ? AND is_deleted = 0", (MINSK_ID,)
+        ).fetchone()[0]
+        self.assertEqual(active, 3)
+
+
+class DeletePolicyTests(DatabaseTestCase):
+    """Проверка ссылок при мягком удалении"""
+
+    def active(self, table_name, **filters):
+        return len(self.db.find_records(table_name, filters, limit=1000))
+
+    def test_restrict_blocks_delete(self):
+        with self.assertRaises(DeleteBlockedError) as caught:
+            self.db.soft_delete_record('Cities', MINSK_ID)
+        blockers = caught.exception.blockers
+        self.assertEqual([(b['table'], b['column'], b['count']) for b in blockers],
+                         [('IndustrialEnterprises', 'city_id', 3)])
+        self.assertEqual(self.active('Cities', id=MINSK_ID), 1)
+
+        # Удаленные ссылающиеся записи удалению не мешают
+        ids = [row['id'] for row in self.db.find_records('IndustrialEnterprises', {'city_id': MINSK_ID})]
+        self.db.soft_delete_many('IndustrialEnterprises', ids)
+        self.assertEqual(self.db.soft_delete_many('Cities', [MINSK_ID]), 1)
+
+    def test_cascade_deletes_referencing_records(self):
+        self.db.set_on_delete_policy('IndustrialEnterprises', 'city_id', 'cascade')
+        events = []
+        self.db.add_change_listener(lambda table, operation, record_id: events.append((table, operation)))
+
+        self.assertEqual(self.db.soft_delete_many('Cities', [MINSK_ID]), 1)
+        self.assertEqual(self.active('IndustrialEnterprises', city_id=MINSK_ID), 0)
+        self.assertEqual(self.active('IndustrialEnterprises'), 2)
+        self.assertEqual(sorted(events), [('Cities', 'delete')] + [('IndustrialEnterprises', 'delete')] * 3)
+
+    def test_policy_arguments_are_checked(self):
+        with self.assertRaises(ValueError):
+            self.db.set_on_delete_policy('IndustrialEnterprises', 'city_id', 'set_null')
+        with self.assertRaises(ValueError):
+            self.db.set_on_delete_policy('IndustrialEnterprises', 'name', 'cascade')
+
+    def test_reference_check_uses_index(self):
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM IndustrialEnterprises WHERE city_id IN (?) AND is_deleted = 0",
+            (MINSK_ID,)
+        ).fetchall()
+        self.assertIn('idx_IndustrialEnterprises_city_id', ' '.join(row[-1] for row in plan))
+
+
+class ReferenceSearchTests(DatabaseTestCase):
+    """Поиск значений для поля выбора связанной записи"""
+
+    def add_city(self, name):
+        return self.db.insert_record('Cities', {'name': name, 'region': 'Минская', 'population': 1, 'area': 1.0})
+
+    def test_prefix_search(self):
+        first, second = self.add_city('Молодечно'), self.add_city('Молодечно')
+        self.add_city('Мозырь')
+        deleted = self.add_city('Мосты')
+        self.db.soft_delete_record('Cities', deleted)
+
+        for use_replica in (False, True):
+            if use_replica:
+                self.db.enable_replica()
+            values = self.db.search_reference_values('Cities', 'мо')
+            self.assertEqual([label for _, label in values], ['Мозырь', 'Молодечно', 'Молодечно'])
+            # Одинаковые названия остаются разными записями
+            self.assertEqual({record_id for record_id, label in values if label == 'Молодечно'},
+                             {first, second})
+            self.assertEqual(len(self.db.search_reference_values('Cities', 'М', limit=2)), 2)
+            self.assertEqual(self.db.search_reference_values('Cities', 'Я'), [])
+            self.assertEqual(self.db.get_reference_label('Cities', MINSK_ID), 'Минск')
+        self.db.disable_replica()
+        self.assertIsNone(self.db.get_reference_label('Cities', 'нет такого'))
+
+    def test_prefix_search_uses_index(self):
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, name FROM Cities "
+            "WHERE name >= ? AND name < ? AND is_deleted = 0 ORDER BY name LIMIT ?",
+            ('М', 'М\U0010ffff', 50)
+        ).fetchall()
+        self.assertIn('idx_Cities_name', ' '.join(row[-1] for row in plan))
+
+
+class ReplicaTests(DatabaseTestCase):
+    """Копия справочников в памяти"""
+
+    def setUp(self):
+        super().setUp()
+        self.replica = self.db.enable_replica(max_rows=100)
+
+    def search(self, prefix):
+        return [label for _, label in self.db.search_reference_values('Cities', prefix)]
+
+    def test_own_changes_arrive_by_events(self):
+        city_id = self.db.insert_record('Cities', {
+            'name': 'Лида', 'region': 'Гродненская', 'population': 1, 'area': 1.0,
+        })
+        self.assertEqual(self.search('ли'), ['Лида'])
+        self.db.update_record('Cities', city_id, {'name': 'Лида-2'})
+        self.assertEqual(self.search('ли'), ['Лида-2'])
+        self.db.soft_delete_record('Cities', city_id)
+        self.assertEqual(self.search('ли'), [])
+        # Копия не перечитывалась целиком
+        self.assertEqual(self.replica.snapshot()['tables']['Cities']['loads'], 1)
+
+    def test_other_connection_changes_are_seen(self):
+        self.assertEqual(self.db.get_reference_label('Cities', MINSK_ID), 'Минск')
+        other = DatabaseManager(self.db_path)
+        try:
+            other.update_record('Cities', MINSK_ID, {'name': 'Минск-сити'})
+        finally:
+            other.close()
+
+        self.assertEqual(self.db.get_reference_label('Cities', MINSK_ID), 'Минск-сити')
+        self.assertEqual(self.search('минск'), ['Минск-сити'])
+        self.assertEqual(self.db.get_record_by_id('Cities', MINSK_ID)['name'], 'Минск-сити')
+        self.assertEqual(self.replica.snapshot()['tables']['Cities']['loads'], 2)
+
+    def test_large_dictionary_is_not_mirrored(self):
+        replica = self.db.enable_replica(max_rows=4)
+        self.assertIsNone(replica.lookup('Cities'))
+        self.assertEqual(self.search('Мин'), ['Минск'])
+        self.assertGreater(replica.snapshot()['tables']['Cities']['misses'], 0)
+
+
+class ReadOnlyTests(DatabaseTestCase):
+    """Открытие базы только для чтения"""
+
+    def display_name(self, db):
+        return next(d['display_name'] for d in db.get_dictionaries() if d['name'] == 'Cities')
+
+    def test_reads_without_touching_file(self):
+        self.db.close()
+        before = self.db_path.read_bytes()
+        self.db = DatabaseManager(self.db_path, read_only=True)
+        self.assertEqual(len(self.db.get_all_records('IndustrialEnterprises')), 5)
+        self.assertEqual(self.db.get_reference_label('Cities', MINSK_ID), 'Минск')
+        with self.assertRaises(sqlite3.Error):
+            self.add_enterprise()
+        self.db.close()
+        self.assertEqual(self.db_path.read_bytes(), before)
+        self.db = DatabaseManager(self.db_path)
+
+    def test_missing_file_is_not_created(self):
+        missing = Path(self._tmp.name) / 'missing.db'
+        with self.assertRaises(sqlite3.OperationalError):
+            DatabaseManager(missing, read_only=True)
+        self.assertFalse(missing.exists())
+
+    def test_metadata_changes_seen_unless_immutable(self):
+        reader = DatabaseManager(self.db_path, read_only=True)
+        snapshot = DatabaseManager(self.db_path, immutable=True)
+        try:
+            self.assertEqual(self.display_name(reader), 'Города')
+            self.db.conn.execute("UPDATE Dictionary SET display_name = 'Населенные пункты' WHERE name = 'Cities'")
+            self.db.conn.commit()
+            self.assertEqual(self.display_name(reader), 'Населенные пункты')
+            # Снимок считает файл неизменным и метаданные не перечитывает
+            self.assertEqual(self.display_name(snapshot), 'Города')
+        finally:
+            reader.close()
+            snapshot.close()
+
+
+class ServiceTests(DatabaseTestCase):
+    """HTTP-служба через сокет, как ее видит клиент"""
+
+    def exchange(self, *requests: bytes):
+        """Запускает службу, отправляет сырые запросы по одному соединению на каждый"""
+        async def run():
+            service = ReferenceService(self.db_path, readers=2)
+            port = await service.start(port=0)
+            responses = []
+            try:
+                for raw in requests:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    writer.write(raw)
+                    await writer.drain()
+                    responses.append(await reader.read())
+                    writer.close()
+                    await writer.wait_closed()
+            finally:
+                await service.stop()
+            return responses
+        return [self.parse(response) for response in asyncio.run(run())]
+
+    @staticmethod
+    def parse(response: bytes):
+        head, _, body = response.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        return int(lines[0].split(' ')[1]), json.loads(body) if body else None, headers
+
+    @staticmethod
+    def raw_request(method: str, target: str, data=None) -> bytes:
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        head = f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+        return head.encode('latin-1') + body
+
+    def request(self, method: str, target: str, data=None):
+        return self.exchange(self.raw_request(method, target, data))[0]
+
+    def enterprise_names(self):
+        return {row[0] for row in self.db.conn.execute("SELECT name FROM IndustrialEnterprises")}
+
+    def test_list_insert_is_atomic(self):
+        # Ограничение базы, о котором метаданные не знают
+        self.db.conn.execute("""
+            CREATE TRIGGER reject_name BEFORE INSERT ON IndustrialEnterprises
+            WHEN NEW.name = 'Отклоненный' BEGIN SELECT RAISE(ABORT, 'отклонено'); END
+        """)
+        self.db.conn.commit()
+        records = [
+            enterprise_record(name='Первый'),
+            enterprise_record(name='Второй'),
+            enterprise_record(name='Отклоненный'),
+        ]
+        status, payload, _ = self.request('POST', '/tables/IndustrialEnterprises/records', records)
+        self.assertEqual(status, 409, payload)
+        self.assertFalse({'Первый', 'Второй', 'Отклоненный'} & self.enterprise_names())
+
+        status, payload, _ = self.request('POST', '/tables/IndustrialEnterprises/records', records[:2])
+        self.assertEqual(status, 201, payload)
+        self.assertEqual(len(payload), 2)
+        self.assertTrue({'Первый', 'Второй'} <= self.enterprise_names())
+
+    def test_system_fields_are_rejected(self):
+        record_id = self.add_enterprise(name='Завод')
+        target = f'/tables/IndustrialEnterprises/records/{record_id}'
+        responses = self.exchange(
+            self.raw_request('PATCH', target, {'is_deleted': 1}),
+            self.raw_request('PATCH', target, {'id': 'другой', 'name': 'Новый'}),
+            self.raw_request('PATCH', target, {'created_at': '2000-01-01'}),
+            self.raw_request('POST', '/tables/IndustrialEnterprises/records', enterprise_record(id='свой')),
+            self.raw_request('GET', target),
+        )
+        for status, payload, _ in responses[:4]:
+            self.assertEqual(status, 400, payload)
+        status, record, _ = responses[4]
+        self.assertEqual((status, record['id'], record['name'], record['is_deleted']), (200, record_id, 'Завод', 0))
+
+        # Удаление - только через DELETE с проверкой ссылок
+        status, payload, _ = self.request('DELETE', f'/tables/Cities/records/{MINSK_ID}')
+        self.assertEqual(status, 409, payload)
+        self.assertEqual(payload['blockers'][0]['table'], 'IndustrialEnterprises')
+
+    def test_update_where_is_validated(self):
+        target = '/tables/IndustrialEnterprises/update_where'
+        responses = self.exchange(*(
+            self.raw_request('POST', target, {'filters': {'city_id': MINSK_ID}, 'changes': changes})
+            for changes in ({'is_deleted': 1}, {'employee_count': 'много'}, {'employee_count': '10'})
+        ))
+        self.assertEqual([status for status, _, _ in responses], [400, 400, 200])
+        self.assertEqual(responses[2][1], {'updated': 3})
+
+    def test_malformed_requests_get_400(self):
+        responses = self.exchange(
+            b"GARBAGE\r\n\r\n",
+            b"POST /tables/Cities/records HTTP/1.1\r\nContent-Length: abc\r\n\r\n",
+            b"POST /tables/Cities/records HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+        )
+        for status, payload, _ in responses:
+            self.assertEqual(status, 400, payload)
+            self.assertIn('error', payload)
+
+    def test_meta_etag(self):
+        status, payload, headers = self.request('GET', '/meta')
+        self.assertEqual(status, 200)
+        self.assertIn('Cities', [d['name'] for d in payload['dictionaries']])
+        raw = self.raw_request('GET', '/meta').replace(
+            b"Connection: close", f"If-None-Match: {headers['ETag']}\r\nConnection: close".encode('latin-1')
+        )
+        self.assertEqual(self.exchange(raw)[0][0], 304)
+
+    def test_stop_closes_reader_connections(self):
+        self.db.close()
+        self.request('GET', '/tables/Cities/records')
+        # Последнее закрытое соединение WAL-базы удаляет файл журнала
+        self.assertFalse(Path(f"{self.db_path}-wal").exists())
+        self.db = DatabaseManager(self.db_path)
+
+    def test_insert_records_outside_queue(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.insert_records('IndustrialEnterprises', [
+                enterprise_record(id='dup', name='Первый'), enterprise_record(id='dup', name='Повтор'),
+            ])
+        self.assertNotIn('Первый', self.enterprise_names())
+
+
+class DateTests(DatabaseTestCase):
+    """Даты с годом короче четырех цифр"""
+
+    VITEBSK_ID = 'b2c3d4e5-4567-7e8f-9a0b-1c2d3e4f5a6b'
+
+    def test_parse_short_year(self):
+        self.assertEqual(parse_date('974-01-01'), date(974, 1, 1))
+        self.assertEqual(parse_date('01.02.974'), date(974, 2, 1))
+        self.assertEqual(parse_date('2025-03-01T10:15:00.123'), date(2025, 3, 1))
+        for value in ('974-13-01', 'вчера', ''):
+            with self.assertRaises(ValueError):
+                parse_date(value)
+
+    def test_columnar_export_keeps_short_year(self):
+        columns = export_columns(self.db, 'Cities')
+        dates = dict(zip(columns['id'].to_list(), columns['foundation_date'].to_list()))
+        self.assertEqual(dates[self.VITEBSK_ID], date(974, 1, 1))
+
+    def test_columnar_export_rejects_bad_date(self):
+        self.db.conn.execute("UPDATE Cities SET foundation_date = 'давно' WHERE id = ?", (self.VITEBSK_ID,))
+        with self.assertRaisesRegex(ValueError, 'foundation_date'):
+            export_columns(self.db, 'Cities')
+
+    def test_validator_accepts_short_year(self):
+        report = self.db.validate_records('Cities', [self.db.get_record_by_id('Cities', self.VITEBSK_ID)])
+        self.assertEqual(report['errors'], [])
+
+
+class ValidatorTests(DatabaseTestCase):
+    """Проверка ссылок небольшой пачки без чтения всего главного справочника"""
+
+    @staticmethod
+    def city_ids(validator):
+        return next(rule.reference_ids for rule in validator.rules if rule.name == 'city_id')
+
+    def test_small_batch_reads_only_its_references(self):
+        rows = [enterprise_record(), enterprise_record(city_id=' нет ')]
+        self.assertEqual(self.city_ids(compile_validator(self.db, 'IndustrialEnterprises', rows)), {MINSK_ID})
+        self.assertEqual(len(self.city_ids(self.db.compile_validator('IndustrialEnterprises'))), 5)
+
+    def test_small_batch_errors_match_full_validator(self):
+        deleted_id = self.db.insert_record('Cities', {
+            'name': 'Лида', 'region': 'Гродненская', 'population': 100000, 'area': 30.0,
+        })
+        self.db.soft_delete_record('Cities', deleted_id)
+        rows = [enterprise_record(), enterprise_record(city_id='нет'), enterprise_record(city_id=deleted_id)]
+        report = self.db.validate_records('IndustrialEnterprises', rows)
+        self.assertEqual([(error['row'], error['code']) for error in report['errors']],
+                         [(1, 'reference'), (2, 'reference')])
+        self.assertEqual(self.db.compile_validator('IndustrialEnterprises').validate(rows)[1], report['errors'])
+
+
+if __name__ == '__main__':
+    unittest.main()
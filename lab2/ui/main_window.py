@@ -1,10 +1,16 @@
+import threading
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from typing import Optional, Dict, Any
 from lab2.database.db_manager import DatabaseManager
+from lab2.database.integrity import DeleteBlockedError
+from lab2.database.statistics import maintenance_due, open_connection, run_maintenance
 from lab2.ui.record_editor import RecordEditor
 from lab2.ui.table_view import TableView
 
+# Через сколько мс после запуска проверять, не устарела ли статистика таблиц
+MAINTENANCE_DELAY_MS = 5000
+
 class MainWindow(tk.Tk):
     def __init__(self, db_manager: DatabaseManager):
         super().__init__()
@@ -20,6 +26,9 @@ class MainWindow(tk.Tk):
         
         self._setup_ui()
         self._load_dictionaries()
+        
+        # Обновляем статистику таблиц, когда окно уже показано
+        self.after(MAINTENANCE_DELAY_MS, self._run_maintenance_if_due)
     
     def _setup_ui(self):
         """Настройка пользовательского интерфейса"""
@@ -29,6 +38,7 @@ class MainWindow(tk.Tk):
         # Меню "Файл"
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Обновить", command=self._refresh_data)
+        file_menu.add_command(label="Резервная копия...", command=self._backup_database)
         file_menu.add_separator()
         file_menu.add_command(label="Выход", command=self.quit)
         menubar.add_cascade(label="Файл", menu=file_menu)
@@ -180,16 +190,14 @@ class MainWindow(tk.Tk):
         
         fields = self.db.get_dictionary_fields(self.current_dictionary['id'])
         
-        editor = RecordEditor(
+        # Таблица обновится сама по событию изменения из DatabaseManager
+        RecordEditor(
             self,
             self.db,
             self.current_dictionary['name'],
             fields,
             mode='add'
         )
-        
-        if editor.result:
-            self._refresh_data()
     
     def _edit_record(self):
         """Редактирование выбранной записи"""
@@ -208,7 +216,8 @@ class MainWindow(tk.Tk):
         
         fields = self.db.get_dictionary_fields(self.current_dictionary['id'])
         
-        editor = RecordEditor(
+        # Таблица обновится сама по событию изменения из DatabaseManager
+        RecordEditor(
             self,
             self.db,
             self.current_dictionary['name'],
@@ -216,9 +225,6 @@ class MainWindow(tk.Tk):
             mode='edit',
             record_data=record
         )
-        
-        if editor.result:
-            self._refresh_data()
     
     def _view_record(self):
         """Просмотр выбранной записи"""
@@ -247,24 +253,113 @@ class MainWindow(tk.Tk):
         )
     
     def _delete_record(self):
-        """Удаление выбранной записи"""
+        """Удаление выбранных записей"""
         if not self.current_dictionary or not self.table_view:
             return
         
-        selected_id = self.table_view.get_selected_id()
-        if not selected_id:
+        selected_ids = self.table_view.get_selected_ids()
+        if not selected_ids:
             messagebox.showwarning("Внимание", "Выберите запись для удаления")
             return
         
-        if messagebox.askyesno("Подтверждение", "Удалить выбранную запись?"):
-            self.db.soft_delete_record(self.current_dictionary['name'], selected_id)
-            self._refresh_data()
+        question = (
+            "Удалить выбранную запись?" if len(selected_ids) == 1
+            else f"Удалить выбранные записи ({len(selected_ids)})?"
+        )
+        if messagebox.askyesno("Подтверждение", question):
+            # Строки уберутся из таблицы по событиям удаления
+            try:
+                self.db.soft_delete_many(self.current_dictionary['name'], selected_ids)
+            except DeleteBlockedError as e:
+                messagebox.showerror("Удаление невозможно", str(e))
+    
+    def _run_maintenance_if_due(self):
+        """ANALYZE и статистика таблиц раз в сутки (MAINTENANCE_INTERVAL) в фоновом потоке"""
+        if self.db.read_only:
+            return
+        
+        state = {'report': None, 'error': None}
+        
+        def worker():
+            # Соединение SQLite принадлежит потоку, поэтому у фонового потока
+            # свое, без DatabaseManager: метаданные и миграции ему не нужны
+            conn = None
+            try:
+                conn = open_connection(self.db.db_path)
+                if maintenance_due(conn):
+                    state['report'] = run_maintenance(conn)
+            except Exception as e:
+                state['error'] = e
+            finally:
+                if conn is not None:
+                    conn.close()
+        
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        
+        def poll():
+            if thread.is_alive():
+                self.after(200, poll)
+                return
+            if state['error']:
+                print(f"⚠️  Не удалось обновить статистику: {state['error']}")
+            elif state['report']:
+                # Число записей для постраничной загрузки берется из новой статистики
+                self._refresh_data()
+        
+        poll()
     
     def _refresh_data(self):
         """Обновление данных"""
         if self.current_dictionary and self.table_view:
             self.table_view.refresh_data()
     
+    def _backup_database(self):
+        """Онлайн-копия базы в фоновом потоке, без остановки работы"""
+        dest = filedialog.asksaveasfilename(
+            parent=self,
+            title="Резервная копия",
+            defaultextension=".db",
+            filetypes=[("База SQLite", "*.db"), ("Сжатая копия", "*.db.gz")]
+        )
+        if not dest:
+            return
+        
+        state = {'percent': 0, 'result': None, 'error': None}
+        
+        def on_progress(status, remaining, total):
+            state['percent'] = int((total - remaining) * 100 / total) if total else 100
+        
+        def worker():
+            try:
+                state['result'] = self.db.backup(
+                    dest, progress=on_progress, compress=dest.endswith('.gz')
+                )
+            except Exception as e:
+                state['error'] = e
+        
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        
+        def poll():
+            # Tk не потокобезопасен, поэтому состояние читаем из главного потока
+            if thread.is_alive():
+                self.title(f"Бизнес-приложение: Справочная система - копия {state['percent']}%")
+                self.after(100, poll)
+                return
+            self.title("Бизнес-приложение: Справочная система")
+            if state['error']:
+                messagebox.showerror("Ошибка", f"Не удалось создать копию: {state['error']}")
+            else:
+                result = state['result']
+                messagebox.showinfo(
+                    "Резервная копия",
+                    f"Копия сохранена: {result['path']}\n"
+                    f"Страниц: {result['pages']}, время: {result['elapsed']:.1f} с"
+                )
+        
+        poll()
+    
     def _add_dictionary(self):
         """Добавление нового справочника"""
         dialog = tk.Toplevel(self)
@@ -0,0 +1,147 @@
+"""
+Профилирование отзывчивости интерфейса lab2.
+
+UIProfiler оборачивает обработчики MainWindow, TableView и RecordEditor и
+для каждого вызова замеряет:
+  * время работы самого обработчика;
+  * задержку цикла событий - от начала обработчика до момента, когда Tk
+    снова простаивает (включая отрисовку, которую обработчик вызвал).
+По желанию каждый обработчик выполняется под cProfile. Итоги сохраняются
+в JSON-отчет.
+
+Включается переменной окружения LAB2_UI_PROFILE=путь/к/отчету.json
+(LAB2_UI_CPROFILE=1 добавляет статистику cProfile).
+"""
+
+import cProfile
+import functools
+import io
+import json
+import pstats
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from lab2.ui.main_window import MainWindow
+from lab2.ui.record_editor import RecordEditor
+from lab2.ui.table_view import TableView
+
+# Обработчики, которые оборачиваются по умолчанию. _delete_record не входит:
+# его время почти целиком - ожидание ответа в диалоге подтверждения
+DEFAULT_HANDLERS = {
+    MainWindow: [
+        '_on_dictionary_selected', '_refresh_data', '_load_table_view',
+        '_add_record', '_edit_record', '_view_record',
+    ],
+    TableView: ['refresh_data', '_sort_by_column', '_on_record_changed'],
+    RecordEditor: ['__init__', '_save_record'],
+}
+
+# Сколько строк статистики cProfile сохранять на обработчик
+PROFILE_TOP = 25
+
+
+class UIProfiler:
+    """Замеры времени обработчиков интерфейса и задержек цикла событий"""
+
+    def __init__(self, report_path: Path, capture_cprofile: bool = False):
+        self.report_path = Path(report_path)
+        self.capture_cprofile = capture_cprofile
+        self.calls: Dict[str, Dict[str, List[float]]] = {}
+        self.profiles: Dict[str, pstats.Stats] = {}
+        self._originals: List[tuple] = []
+        self._depth = 0
+
+    def install(self, handlers: Optional[Dict[type, List[str]]] = None):
+        """Оборачивает обработчики на уровне классов (до создания окон)"""
+        for cls, names in (handlers or DEFAULT_HANDLERS).items():
+            for name in names:
+                original = cls.__dict__[name]
+                self._originals.append((cls, name, original))
+                setattr(cls, name, self._wrap(f"{cls.__name__}.{name}", original))
+
+    def uninstall(self):
+        """Возвращает исходные обработчики"""
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals.clear()
+
+    def _wrap(self, key: str, handler):
+        profiler = self
+
+        @functools.wraps(handler)
+        def wrapper(widget, *args, **kwargs):
+            started = time.perf_counter()
+            outermost = profiler._depth == 0
+            profile = cProfile.Profile() if profiler.capture_cprofile and outermost else None
+
+            profiler._depth += 1
+            try:
+                if profile:
+                    return profile.runcall(handler, widget, *args, **kwargs)
+                return handler(widget, *args, **kwargs)
+            finally:
+                profiler._depth -= 1
+                elapsed = time.perf_counter() - started
+                stats = profiler.calls.setdefault(key, {'handler': [], 'stall': []})
+                stats['handler'].append(elapsed)
+                if profile:
+                    profiler._add_profile(key, profile)
+                profiler._measure_stall(widget, stats, started)
+
+        return wrapper
+
+    def _measure_stall(self, widget, stats: Dict[str, List[float]], started: float):
+        """Задержка до ближайшего простоя Tk после запуска обработчика"""
+        def on_idle():
+            stats['stall'].append(time.perf_counter() - started)
+
+        try:
+            widget.after_idle(on_idle)
+        except Exception:
+            # Окно уже уничтожено (например, редактор закрылся в обработчике)
+            stats['stall'].append(time.perf_counter() - started)
+
+    def _add_profile(self, key: str, profile: cProfile.Profile):
+        if key in self.profiles:
+            self.profiles[key].add(profile)
+        else:
+            self.profiles[key] = pstats.Stats(profile)
+
+    def report(self) -> Dict[str, Any]:
+        """Сводка по обработчикам, от самых тяжелых к легким"""
+        handlers = {}
+        for key, stats in self.calls.items():
+            handlers[key] = {
+                'calls': len(stats['handler']),
+                'handler': _summarize(stats['handler']),
+                'stall': _summarize(stats['stall']),
+            }
+            if key in self.profiles:
+                stream = io.StringIO()
+                profile_stats = self.profiles[key]
+                profile_stats.stream = stream
+                profile_stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+                handlers[key]['cprofile'] = stream.getvalue().splitlines()
+
+        ordered = sorted(handlers.items(), key=lambda item: item[1]['stall']['max_ms'], reverse=True)
+        return {'handlers': dict(ordered)}
+
+    def save(self) -> Path:
+        """Записывает отчет в файл"""
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return self.report_path
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    """Сумма, среднее, медиана и максимум замеров в миллисекундах"""
+    if not samples:
+        return {'total_ms': 0.0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'max_ms': 0.0}
+    ordered = sorted(samples)
+    return {
+        'total_ms': round(sum(ordered) * 1000, 2),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
@@ -5,6 +5,7 @@ from typing import Dict, Any, List, Optional
 import uuid
 
 from lab2.database.db_manager import DatabaseManager
+from lab2.ui.reference_picker import ReferencePicker
 
 class RecordEditor(tk.Toplevel):
     def __init__(
@@ -129,14 +130,14 @@ class RecordEditor(tk.Toplevel):
             return {'type': 'textarea', 'widget': text_widget}
         
         elif widget_type == 'combobox' and reference_to:
-            var = tk.StringVar()
-            combo = ttk.Combobox(parent, textvariable=var, state='readonly')
-            combo.pack(fill=tk.X)
-            
-            # Загружаем значения для выпадающего списка
-            self._load_combobox_values(combo, reference_to, var)
+            # Значения подгружаются по мере ввода, а не целиком
+            picker = ReferencePicker(parent, self.db, reference_to)
+            picker.combo.pack(fill=tk.X)
             
-            return {'type': 'combobox', 'widget': combo, 'var': var, 'ref_table': reference_to}
+            return {
+                'type': 'combobox', 'widget': picker.combo, 'var': picker.var,
+                'picker': picker, 'ref_table': reference_to
+            }
         
         elif widget_type == 'date':
             var = tk.StringVar()
@@ -168,18 +169,6 @@ class RecordEditor(tk.Toplevel):
             entry.pack(fill=tk.X)
             return {'type': 'text', 'var': var}
     
-    def _load_combobox_values(self, combo: ttk.Combobox, ref_table: str, var: tk.StringVar):
-        """Загружает значения для выпадающего списка"""
-        try:
-            values = self.db.get_reference_values(ref_table)
-            combo['values'] = [v[1] for v in values]
-            
-            # Сохраняем mapping между отображаемым значением и ID
-            combo._value_map = {v[1]: v[0] for v in values}
-            combo._id_map = {v[0]: v[1] for v in values}
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить значения: {str(e)}")
-    
     def _show_date_picker(self, date_var: tk.StringVar):
         """Показывает диалог выбора даты"""
         dialog = tk.Toplevel(self)
@@ -285,10 +274,8 @@ class RecordEditor(tk.Toplevel):
                 widget_info['widget'].insert('1.0', str(value))
             
             elif widget_info['type'] == 'combobox':
-                # Для combobox ищем отображаемое значение по ID
-                combo = widget_info['widget']
-                if hasattr(combo, '_id_map') and value in combo._id_map:
-                    widget_info['var'].set(combo._id_map[value])
+                # Для combobox находим отображаемое значение по ID
+                widget_info['picker'].set_id(value)
             
             elif widget_info['type'] in ['text', 'number', 'date']:
                 # Форматируем значение для отображения
@@ -338,17 +325,17 @@ class RecordEditor(tk.Toplevel):
                     continue
                 
                 widget_info = self.widgets[field_name]
-                value = self._get_widget_value(widget_info, field)
-                
-                # Валидация
-                if field['is_required'] and (value is None or str(value).strip() == ''):
-                    messagebox.showerror(
-                        "Ошибка", 
-                        f"Поле '{field['display_name']}' обязательно для заполнения"
-                    )
-                    return
-                
-                data[field_name] = value
+                data[field_name] = self._get_widget_value(widget_info, field)
+            
+            # Валидация по метаданным: те же правила, что у импорта и службы
+            report = self.db.validate_records(self.table_name, [data], partial=self.mode != 'add')
+            if report['errors']:
+                messagebox.showerror(
+                    "Ошибка",
+                    '\n'.join(error['message'][:1].upper() + error['message'][1:] for error in report['errors'])
+                )
+                return
+            data = report['records'][0]
             
            # Сохраняем запись
             if self.mode == 'add':
@@ -375,16 +362,8 @@ class RecordEditor(tk.Toplevel):
             return widget_info['widget'].get('1.0', tk.END).strip()
         
         elif widget_type == 'combobox':
-            display_value = widget_info['var'].get()
-            combo = widget_info['widget']
-            
-            if not display_value:
-                return None
-            
-            # Получаем ID по отображаемому значению
-            if hasattr(combo, '_value_map'):
-                return combo._value_map.get(display_value)
-            return None
+            # Получаем ID выбранной или однозначно введенной записи
+            return widget_info['picker'].get_id()
         
         elif widget_type == 'date':
             date_str = widget_info['var'].get()
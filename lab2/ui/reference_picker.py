@@ -0,0 +1,102 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from typing import Dict, List, Optional, Tuple
+
+from lab2.database.db_manager import DatabaseManager
+
+# Сколько вариантов показывать в выпадающем списке
+REFERENCE_LIMIT = 50
+
+# Пауза после ввода перед запросом к БД, мс
+SEARCH_DELAY_MS = 200
+
+# Клавиши, после которых не нужно искать заново
+NAVIGATION_KEYS = {'Up', 'Down', 'Left', 'Right', 'Return', 'Escape', 'Tab', 'Home', 'End'}
+
+
+class ReferencePicker:
+    """Поле выбора записи связанного справочника с поиском по началу названия.
+
+    Значения не загружаются целиком: при вводе и при открытии списка
+    выполняется запрос с LIMIT по введенному префиксу, а текущее значение
+    записи находится по id. Одинаковые названия в списке различаются
+    началом id.
+    """
+
+    def __init__(self, parent, db: DatabaseManager, ref_table: str):
+        self.db = db
+        self.ref_table = ref_table
+        self.var = tk.StringVar()
+        self.combo = ttk.Combobox(parent, textvariable=self.var, postcommand=self._search)
+
+        # Варианты последнего поиска: подпись -> id
+        self._choices: Dict[str, str] = {}
+        # Выбранная запись: (id, подпись)
+        self._selected: Optional[Tuple[str, str]] = None
+        self._pending_search = None
+
+        self.combo.bind('<KeyRelease>', self._on_key_release)
+        self.combo.bind('<<ComboboxSelected>>', self._on_selected)
+
+    def set_id(self, record_id: str):
+        """Показывает запись с заданным id"""
+        label = self.db.get_reference_label(self.ref_table, record_id)
+        if label is None:
+            return
+        self._selected = (record_id, label)
+        self.var.set(label)
+
+    def get_id(self) -> Optional[str]:
+        """Возвращает id выбранной записи или None, если введенное не найдено"""
+        text = self.var.get().strip()
+        if not text:
+            return None
+        if self._selected and self._selected[1] == text:
+            return self._selected[0]
+        if text in self._choices:
+            return self._choices[text]
+
+        # Название введено вручную: подходит, только если оно однозначно
+        matches = [
+            record_id for record_id, label in
+            self.db.search_reference_values(self.ref_table, text, limit=2)
+            if label == text
+        ]
+        return matches[0] if len(matches) == 1 else None
+
+    def _on_key_release(self, event):
+        if event.keysym in NAVIGATION_KEYS:
+            return
+        if self._pending_search:
+            self.combo.after_cancel(self._pending_search)
+        self._pending_search = self.combo.after(SEARCH_DELAY_MS, self._search)
+
+    def _on_selected(self, event=None):
+        label = self.var.get()
+        if label in self._choices:
+            self._selected = (self._choices[label], label)
+
+    def _search(self):
+        """Загружает в список до REFERENCE_LIMIT записей, начинающихся с введенного"""
+        self._pending_search = None
+        try:
+            values = self.db.search_reference_values(
+                self.ref_table, self.var.get().strip(), limit=REFERENCE_LIMIT
+            )
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось загрузить значения: {str(e)}")
+            return
+
+        self._choices = dict(zip(_unique_labels(values), (record_id for record_id, _ in values)))
+        self.combo['values'] = list(self._choices)
+
+
+def _unique_labels(values: List[Tuple[str, str]]) -> List[str]:
+    """Подписи вариантов; повторяющиеся названия дополняются началом id"""
+    counts: Dict[str, int] = {}
+    for _, label in values:
+        counts[label] = counts.get(label, 0) + 1
+    return [
+        label if counts[label] == 1 else f"{label} ({record_id[:8]})"
+        for record_id, label in values
+    ]
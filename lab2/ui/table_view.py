@@ -1,10 +1,141 @@
 import tkinter as tk
 from tkinter import ttk
-from typing import List, Dict, Any, Optional
+from bisect import bisect_right
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
 
 from lab2.database.db_manager import DatabaseManager
 
+# Технические поля, которые не показываются в таблице
+HIDDEN_FIELDS = ['id', 'created_at', 'updated_at', 'is_deleted']
+
+# Таблицы больше стольких записей (по статистике) загружаются страницами
+FULL_LOAD_LIMIT = 20000
+
+# Строк на страницу и пауза между страницами при постраничной загрузке, мс
+PAGE_SIZE = 2000
+PAGE_DELAY_MS = 1
+
+
+def use_paged_loading(db: DatabaseManager, table_name: str, limit: int = FULL_LOAD_LIMIT) -> bool:
+    """Загружать ли таблицу страницами: оценка числа записей больше limit.
+
+    Размер таблицы берется из сохраненной статистики, без COUNT(*).
+    """
+    return db.estimate_row_count(table_name) > limit
+
+
+@lru_cache(maxsize=4096)
+def _format_date(value: str) -> str:
+    """Форматирует дату в ДД.ММ.ГГГГ (повторяющиеся значения берутся из кэша)"""
+    try:
+        if 'T' in value:  # ISO формат с временем
+            dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        else:
+            dt = datetime.strptime(value, '%Y-%m-%d')
+        return dt.strftime('%d.%m.%Y')
+    except (ValueError, AttributeError):
+        return str(value)
+
+
+@lru_cache(maxsize=4096)
+def _format_real(value) -> str:
+    """Форматирует число с разделением разрядов и запятой"""
+    try:
+        return f"{float(value):,.2f}".replace(',', ' ').replace('.', ',')
+    except (ValueError, TypeError):
+        return str(value)
+
+
+def _format_text(value) -> str:
+    """Ячейка текстового или целого поля"""
+    return '' if value is None else str(value)
+
+
+def _format_date_cell(value) -> str:
+    """Ячейка поля-даты"""
+    return _format_date(value) if value else _format_text(value)
+
+
+def _format_boolean_cell(value) -> str:
+    """Ячейка логического поля"""
+    if value is None:
+        return ''
+    return 'Да' if value else 'Нет'
+
+
+def _format_real_cell(value) -> str:
+    """Ячейка вещественного поля"""
+    return '' if value is None else _format_real(value)
+
+
+# Форматтеры ячеек по типу данных; внешние ключи приходят из БД уже названиями
+FORMATTERS: Dict[str, Callable[[Any], str]] = {
+    'DATE': _format_date_cell,
+    'BOOLEAN': _format_boolean_cell,
+    'REAL': _format_real_cell,
+}
+
+
+def sort_key(data_type: str, value: str):
+    """Ключ сортировки отображаемого значения ячейки с учетом типа данных"""
+    if data_type in ['INTEGER', 'REAL']:
+        try:
+            return float(value.replace(' ', '').replace(',', '.')) if value else 0
+        except ValueError:
+            return 0
+    elif data_type == 'DATE':
+        return _parse_date_for_sort(value)
+    return value.lower() if value else ''
+
+
+def _parse_date_for_sort(date_str: str) -> datetime:
+    """Парсит дату для сортировки"""
+    try:
+        # Пытаемся парсить формат ДД.ММ.ГГГГ
+        return datetime.strptime(date_str, '%d.%m.%Y')
+    except (ValueError, AttributeError):
+        return datetime.min
+
+
+class SortedKeys:
+    """Ключи сортировки строк в порядке показа.
+    
+    Позиция новой строки ищется двоичным поиском, поэтому точечное
+    изменение отсортированной таблицы не требует пересортировки. Равные
+    ключи сохраняют порядок вставки: новая строка встает после них.
+    """
+    
+    def __init__(self, keys: List[Any], reverse: bool = False):
+        self.keys = keys
+        self.reverse = reverse
+    
+    def insert(self, key) -> int:
+        """Добавляет ключ и возвращает позицию строки"""
+        if not self.reverse:
+            index = bisect_right(self.keys, key)
+        else:
+            # Ключи идут по убыванию: ищем позицию после всех ключей >= key
+            low, high = 0, len(self.keys)
+            while low < high:
+                middle = (low + high) // 2
+                if self.keys[middle] >= key:
+                    low = middle + 1
+                else:
+                    high = middle
+            index = low
+        
+        self.keys.insert(index, key)
+        return index
+    
+    def remove(self, index: int):
+        """Убирает ключ строки, стоящей на позиции index"""
+        del self.keys[index]
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+
 
 class TableView(ttk.Frame):
     def __init__(
@@ -19,8 +150,36 @@ class TableView(ttk.Frame):
         self.table_name = table_name
         self.fields = fields
         
+        # Отображаемые поля и их форматтеры вычисляются один раз для схемы
+        self.display_fields = [
+            f for f in self.fields
+            if not f['is_primary_key'] and f['field_name'] not in HIDDEN_FIELDS
+        ]
+        self.formatters = [
+            FORMATTERS.get(f['data_type'], _format_text) for f in self.display_fields
+        ]
+        
+        self._data_types = {f['field_name']: f['data_type'] for f in self.fields}
+        
+        # Текущая сортировка (колонка, по убыванию) и ключи строк в порядке показа
+        self._sort_state: Optional[tuple] = None
+        self._sorted_keys: Optional[SortedKeys] = None
+        
+        # Постраничная загрузка большой таблицы: оставшиеся страницы и задача after
+        self._pages = None
+        self._load_job = None
+        
         self._setup_widgets()
         self.refresh_data()
+        
+        # Изменения записей применяются к таблице точечно
+        self.db.add_change_listener(self._on_record_changed)
+    
+    def destroy(self):
+        """Отписывается от изменений БД при уничтожении виджета"""
+        self.db.remove_change_listener(self._on_record_changed)
+        self._cancel_loading()
+        super().destroy()
     
     def _setup_widgets(self):
         """Настройка виджетов таблицы"""
@@ -41,7 +200,7 @@ class TableView(ttk.Frame):
             self.tree_frame,
             yscrollcommand=vsb.set,
             xscrollcommand=hsb.set,
-            selectmode='browse'
+            selectmode='extended'
         )
         
         vsb.config(command=self.tree.yview)
@@ -58,11 +217,8 @@ class TableView(ttk.Frame):
     
     def _setup_columns(self):
         """Настройка колонок Treeview"""
-        # Определяем отображаемые колонки (скрываем технические поля)
-        display_fields = [
-            f for f in self.fields 
-            if not f['is_primary_key'] and f['field_name'] not in ['id', 'created_at', 'updated_at', 'is_deleted']
-        ]
+        # Отображаемые колонки (технические поля скрыты)
+        display_fields = self.display_fields
         
         # Настраиваем колонки
         self.tree['columns'] = [f['field_name'] for f in display_fields]
@@ -98,111 +254,147 @@ class TableView(ttk.Frame):
     
     def refresh_data(self):
         """Обновление данных в таблице"""
-        # Очищаем текущие данные
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self._cancel_loading()
+        # Очищаем текущие данные одним вызовом
+        self.tree.delete(*self.tree.get_children())
+        self._sort_state = None
+        self._sorted_keys = None
         
-        # Получаем записи из БД
-        records = self.db.get_all_records(self.table_name)
+        if use_paged_loading(self.db, self.table_name):
+            # Первая страница показывается сразу, остальные - между событиями
+            self._pages = self.db.iter_display_rows(self.table_name, self.display_fields, PAGE_SIZE)
+            self._load_next_page()
+            return
         
-        # Добавляем записи в Treeview
-        for record in records:
-            values = []
-            
-            # Собираем значения для отображения
-            display_fields = [
-                f for f in self.fields 
-                if not f['is_primary_key'] and f['field_name'] not in ['id', 'created_at', 'updated_at', 'is_deleted']
-            ]
-            
-            for field in display_fields:
-                field_name = field['field_name']
-                value = record.get(field_name, '')
-                
-                # Форматируем значение
-                formatted_value = self._format_value(value, field)
-                values.append(formatted_value)
-            
-            # Добавляем запись (id хранится в iid)
-            self.tree.insert(
-                '', 
-                tk.END, 
-                iid=record['id'],
-                text=record['id'],
-                values=values
-            )
-    
-    def _format_value(self, value, field: Dict[str, Any]) -> str:
-        """Форматирует значение для отображения"""
-        if value is None:
-            return ''
+        # Получаем строки из БД: (id, значения в порядке колонок)
+        rows = self.db.get_display_rows(self.table_name, self.display_fields)
+        formatters = self.formatters
         
-        data_type = field['data_type']
+        # Добавляем записи в Treeview (id хранится в iid)
+        for row in rows:
+            record_id = row[0]
+            values = [fmt(value) for fmt, value in zip(formatters, row[1:])]
+            self.tree.insert('', tk.END, iid=record_id, text=record_id, values=values)
+    
+    def _load_next_page(self):
+        """Добавляет следующую страницу и планирует загрузку оставшихся"""
+        self._load_job = None
+        # Каждая страница читается отдельным запросом, курсор между
+        # страницами не остается открытым
+        rows = next(self._pages, None)
+        if rows is None:
+            self._pages = None
+            return
         
-        if data_type == 'DATE' and value:
-            try:
-                # Пытаемся преобразовать в формат ДД.ММ.ГГГГ
-                if 'T' in value:  # ISO формат с временем
-                    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        formatters = self.formatters
+        for row in rows:
+            record_id = row[0]
+            # Строка уже добавлена оповещением об изменении - она новее
+            if self.tree.exists(record_id):
+                continue
+            values = [fmt(value) for fmt, value in zip(formatters, row[1:])]
+            index = self._insert_sort_key(values) if self._sort_state else tk.END
+            self.tree.insert('', index, iid=record_id, text=record_id, values=values)
+        self._load_job = self.after(PAGE_DELAY_MS, self._load_next_page)
+    
+    def _cancel_loading(self):
+        """Останавливает постраничную загрузку"""
+        if self._load_job:
+            self.after_cancel(self._load_job)
+        self._load_job = None
+        self._pages = None
+    
+    def _on_record_changed(self, table_name: str, operation: str, record_id: str):
+        """Применяет изменение одной записи без полной перезагрузки"""
+        if table_name == self.table_name:
+            if operation == 'delete':
+                self._remove_row(record_id)
+            else:
+                rows = self.db.get_display_rows(
+                    self.table_name, self.display_fields, where={'id': record_id}
+                )
+                if rows:
+                    self._upsert_row(rows[0])
                 else:
-                    dt = datetime.strptime(value, '%Y-%m-%d')
-                return dt.strftime('%d.%m.%Y')
-            except (ValueError, AttributeError):
-                return str(value)
-        
-        elif data_type == 'BOOLEAN':
-            return 'Да' if value else 'Нет'
-        
-        elif data_type == 'FOREIGN_KEY' and value:
-            # Для внешних ключей отображаем название
-            ref_table = field['reference_to']
-            if ref_table:
-                ref_record = self.db.get_record_by_id(ref_table, value)
-                if ref_record and 'name' in ref_record:
-                    return ref_record['name']
-        
-        elif data_type == 'REAL' and value is not None:
-            # Форматируем числа с запятой
-            try:
-                return f"{float(value):,.2f}".replace(',', ' ').replace('.', ',')
-            except (ValueError, TypeError):
-                pass
+                    self._remove_row(record_id)
+            return
         
-        return str(value)
+        # Изменилась связанная запись - обновляем названия в ссылающихся строках
+        if operation == 'insert':
+            return
+        for field in self.display_fields:
+            if field['data_type'] == 'FOREIGN_KEY' and field.get('reference_to') == table_name:
+                rows = self.db.get_display_rows(
+                    self.table_name, self.display_fields, where={field['field_name']: record_id}
+                )
+                for row in rows:
+                    self._upsert_row(row)
+    
+    def _upsert_row(self, row: tuple):
+        """Добавляет или обновляет строку, сохраняя текущую сортировку"""
+        record_id = row[0]
+        values = [fmt(value) for fmt, value in zip(self.formatters, row[1:])]
+        
+        if self.tree.exists(record_id):
+            if not self._sort_state:
+                self.tree.item(record_id, values=values)
+                return
+            # Строка могла сменить позицию - убираем ее ключ и вставляем заново
+            self._sorted_keys.remove(self.tree.index(record_id))
+            self.tree.item(record_id, values=values)
+            index = self._insert_sort_key(values)
+            self.tree.move(record_id, '', index)
+            return
+        
+        # Без сортировки новые записи идут первыми, как при ORDER BY created_at DESC
+        index = self._insert_sort_key(values) if self._sort_state else 0
+        self.tree.insert('', index, iid=record_id, text=record_id, values=values)
+    
+    def _remove_row(self, record_id: str):
+        """Удаляет строку из таблицы, если она показана"""
+        if not self.tree.exists(record_id):
+            return
+        if self._sort_state:
+            self._sorted_keys.remove(self.tree.index(record_id))
+        self.tree.delete(record_id)
+    
+    def _insert_sort_key(self, values: List[str]) -> int:
+        """Добавляет ключ строки в список отсортированных ключей и возвращает позицию"""
+        column, _ = self._sort_state
+        key = self._sort_key(column, values[self.tree['columns'].index(column)])
+        return self._sorted_keys.insert(key)
+    
+    def _sort_key(self, column: str, value: str):
+        """Ключ сортировки отображаемого значения с учетом типа данных"""
+        return sort_key(self._data_types.get(column, 'TEXT'), value)
     
     def _sort_by_column(self, column: str, reverse: bool):
         """Сортировка по колонке"""
-        # Получаем все элементы
-        items = [(self.tree.set(item, column), item) for item in self.tree.get_children('')]
-        
-        # Определяем тип данных для корректной сортировки
-        field = next((f for f in self.fields if f['field_name'] == column), None)
-        data_type = field['data_type'] if field else 'TEXT'
+        # Получаем все элементы с ключами сортировки
+        items = [
+            (self._sort_key(column, self.tree.set(item, column)), item)
+            for item in self.tree.get_children('')
+        ]
         
         # Сортируем с учетом типа данных
-        if data_type in ['INTEGER', 'REAL']:
-            items.sort(key=lambda x: float(x[0].replace(' ', '').replace(',', '.')) if x[0] else 0, reverse=reverse)
-        elif data_type == 'DATE':
-            items.sort(key=lambda x: self._parse_date_for_sort(x[0]), reverse=reverse)
-        else:
-            items.sort(key=lambda x: x[0].lower() if x[0] else '', reverse=reverse)
+        items.sort(key=lambda x: x[0], reverse=reverse)
         
         # Перемещаем элементы в отсортированном порядке
         for index, (_, item) in enumerate(items):
             self.tree.move(item, '', index)
         
+        # Запоминаем сортировку для точечных обновлений
+        self._sort_state = (column, reverse)
+        self._sorted_keys = SortedKeys([key for key, _ in items], reverse)
+        
         # Меняем направление сортировки для следующего раза
         self.tree.heading(column, command=lambda: self._sort_by_column(column, not reverse))
     
-    def _parse_date_for_sort(self, date_str: str) -> datetime:
-        """Парсит дату для сортировки"""
-        try:
-            # Пытаемся парсить формат ДД.ММ.ГГГГ
-            return datetime.strptime(date_str, '%d.%m.%Y')
-        except (ValueError, AttributeError):
-            return datetime.min
-    
     def get_selected_id(self) -> Optional[str]:
-        """Возвращает ID выбранной записи"""
+        """Возвращает ID выбранной записи (первой, если выбрано несколько)"""
         selection = self.tree.selection()
         return selection[0] if selection else None
+    
+    def get_selected_ids(self) -> List[str]:
+        """Возвращает ID всех выбранных записей"""
+        return list(self.tree.selection())